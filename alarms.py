@@ -0,0 +1,130 @@
+import threading
+from collections import deque
+
+from derived_channels import key_name
+
+MAX_EVENTS = 50
+DEFAULT_DEBOUNCE = 2  # Consecutive samples past the limit before the alarm fires
+
+
+class Alarm:
+    """Low and/or high limits on one PID, checked on every sample.
+
+    Fires after `debounce` samples in a row past a limit, and clears once
+    the value is back inside by `band`. A fired alarm stays latched, still
+    shown, until it is acknowledged, so a spike between two screen frames
+    is not missed.
+    """
+    __slots__ = ("engine", "key", "name", "low", "high", "debounce", "band", "count", "active", "latched", "value")
+
+    def __init__(self, engine, key, low=None, high=None, debounce=DEFAULT_DEBOUNCE, band=0.0):
+        if low is None and high is None:
+            raise ValueError("needs a low or a high limit")
+        self.engine = engine
+        self.key = key
+        self.name = key_name(key)
+        self.low = low
+        self.high = high
+        self.debounce = max(1, int(debounce))
+        self.band = band
+        self.count = 0
+        self.active = False
+        self.latched = False
+        self.value = None
+
+    def check(self, value, timestamp):
+        high, low = self.high, self.low
+        if self.active:
+            self.value = value
+            if (high is None or value < high - self.band) and (low is None or value > low + self.band):
+                self.active = False
+                self.count = 0
+                if self.engine.on_clear:
+                    self.engine.on_clear((timestamp, self.name, "clear", value, None))
+            return
+        if (high is not None and value > high) or (low is not None and value < low):
+            self.count += 1
+            if self.count >= self.debounce:
+                self.active = True
+                self.latched = True
+                self.value = value
+                kind, limit = ("high", high) if high is not None and value > high else ("low", low)
+                self.engine.fire((timestamp, self.name, kind, value, limit))
+        else:
+            self.count = 0
+
+
+class AlarmEngine:
+    """Per-PID threshold alarms, checked as each sample is stored.
+
+    attach() registers every alarm as a watcher of its PID in the store, so
+    checks run on the polling side at the full sample rate. Fired alarms go
+    into a bounded event queue (timestamp, name, "high"/"low", value, limit)
+    and on_alarm(event) is called right away, to wake the UI. on_clear, if
+    set, gets a (timestamp, name, "clear", value, None) event when an alarm
+    goes back inside its limits; with the poller in its own process the
+    checks run there and receive() applies both kinds in the UI process.
+    """
+
+    def __init__(self, store, settings, on_alarm=None, max_events=MAX_EVENTS):
+        self.store = store
+        self.on_alarm = on_alarm
+        self.on_clear = None
+        self.events = deque(maxlen=max_events)
+        self.lock = threading.Lock()
+        by_name = {key_name(spec.key): spec for spec in store.specs}
+        self.alarms = []
+        for name, options in (settings or {}).items():
+            if name not in by_name:
+                print(f"[!] Alarms: Unknown PID {name}, skipping")
+                continue
+            try:
+                self.alarms.append(Alarm(self, by_name[name].key, **options))
+            except (TypeError, ValueError) as e:
+                print(f"[!] Alarms: Bad settings for {name} ({e}), skipping")
+
+    def attach(self):
+        for alarm in self.alarms:
+            self.store.watch(alarm.key, alarm.check)
+
+    def detach(self):
+        for alarm in self.alarms:
+            self.store.unwatch(alarm.key, alarm.check)
+
+    def fire(self, event):
+        with self.lock:
+            self.events.append(event)
+        print(f"[!] Alarm: {event[1]} {event[2]} at {event[3]:.1f} (limit {event[4]:g})")
+        if self.on_alarm:
+            self.on_alarm(event)
+
+    def receive(self, event):
+        """Applies an event fired or cleared by the engine in another process."""
+        _, name, kind, value, _ = event
+        for alarm in self.alarms:
+            if alarm.name == name:
+                alarm.value = value
+                alarm.active = kind != "clear"
+                alarm.latched = alarm.latched or alarm.active
+        if kind == "clear":
+            return
+        with self.lock:
+            self.events.append(event)
+        if self.on_alarm:
+            self.on_alarm(event)
+
+    def drain(self):
+        """Events fired since the last drain, oldest first."""
+        with self.lock:
+            events = list(self.events)
+            self.events.clear()
+        return events
+
+    def showing(self):
+        """Alarms that are active or latched and not yet acknowledged."""
+        return [alarm for alarm in self.alarms if alarm.active or alarm.latched]
+
+    def acknowledge(self):
+        """Unlatches every alarm; ones still past their limit stay shown."""
+        for alarm in self.alarms:
+            alarm.latched = alarm.active
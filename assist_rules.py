@@ -0,0 +1,192 @@
+import ast
+
+from derived_channels import BASE_FUNCTIONS, key_name
+
+DEFAULT_DWELL = 0.5  # Seconds a new label must hold before it is shown
+RATE_SUFFIX = "_RATE"  # THROTTLE_RATE reads THROTTLE's "rate" column
+NO_LABEL = "--"
+
+
+class Relax(ast.NodeTransformer):
+    """Rewrites a condition into its "hold" form: each `NAME < limit` (or
+    >, <=, >=) gets the limit moved by NAME's hysteresis band, so a state
+    that is on stays on until the input is clearly past the limit. Under a
+    `not` the limit moves the other way.
+    """
+
+    def __init__(self, bands):
+        self.bands = bands
+        self.polarity = 1
+
+    def visit_UnaryOp(self, node):
+        if isinstance(node.op, ast.Not):
+            self.polarity = -self.polarity
+            self.generic_visit(node)
+            self.polarity = -self.polarity
+            return node
+        return self.generic_visit(node)
+
+    def visit_Compare(self, node):
+        if len(node.ops) != 1:
+            return node
+        op = node.ops[0]
+        if isinstance(op, (ast.Lt, ast.LtE)):
+            direction = 1
+        elif isinstance(op, (ast.Gt, ast.GtE)):
+            direction = -1
+        else:
+            return node
+        names = [n.id for n in ast.walk(node.left) if isinstance(n, ast.Name) and n.id in self.bands]
+        if not names:
+            return node
+        shift = ast.Constant(self.bands[names[0]] * direction * self.polarity)
+        node.comparators = [ast.BinOp(node.comparators[0], ast.Add(), shift)]
+        return node
+
+
+class Guard(ast.NodeTransformer):
+    """Rewrites each comparison into `NAME is not None and ...` for the
+    inputs it reads, so a clause over a PID that has never been sampled
+    (unsupported on this car, say) is simply false and the rest of the
+    condition still decides.
+    """
+
+    def __init__(self, names):
+        self.names = names
+
+    def visit_Compare(self, node):
+        names = []
+        for n in ast.walk(node):
+            if isinstance(n, ast.Name) and n.id in self.names and n.id not in names:
+                names.append(n.id)
+        if not names:
+            return node
+        checks = [ast.Compare(ast.Name(name, ast.Load()), [ast.IsNot()], [ast.Constant(None)]) for name in names]
+        return ast.copy_location(ast.BoolOp(ast.And(), checks + [node]), node)
+
+
+class Rule:
+    """One assist: its states' compiled conditions and what it currently shows."""
+    __slots__ = ("key", "mode", "labels", "enter", "hold", "inputs", "default", "dwell", "base", "format",
+                 "active", "shown", "pending", "pending_since", "seen", "failed")
+
+    def __init__(self, key, spec, resolve, bands, functions):
+        self.key = key
+        self.mode = "score" if "penalties" in spec else spec.get("mode", "first")
+        states = spec["penalties"] if self.mode == "score" else spec["states"]
+        self.labels = [label for label, _ in states]
+        self.default = spec.get("default", NO_LABEL)
+        self.dwell = spec.get("dwell", DEFAULT_DWELL)
+        self.base = spec.get("score", 100)
+        self.format = spec.get("format", "{}")
+
+        names = []
+        for _, condition in states:
+            for node in ast.walk(ast.parse(condition, mode="eval")):
+                if isinstance(node, ast.Name) and node.id not in functions and node.id not in names:
+                    names.append(node.id)
+        # Names the store doesn't have (not in this PID catalog) are constants None, so never sampled
+        inputs = {name: resolve(name) for name in names}
+        missing = {name: None for name in names if inputs[name] is None}
+        if missing:
+            print(f"[!] Assists: {key_name(key)}: unknown input(s) {', '.join(missing)}, treated as never sampled")
+        self.inputs = [inputs[name] for name in names if name not in missing]
+        args = ", ".join(name for name in names if name not in missing)
+        functions = dict(functions, **missing)
+        self.enter = [self.compile(args, names, condition, None, functions) for _, condition in states]
+        self.hold = [self.compile(args, names, condition, bands, functions) for _, condition in states]
+
+        self.active = [False] * len(states)
+        self.shown = None
+        self.pending = None
+        self.pending_since = 0.0
+        self.seen = -1
+        self.failed = False
+
+    def compile(self, args, names, condition, bands, functions):
+        tree = ast.parse(f"lambda {args}: {condition}", mode="eval")
+        if bands:
+            tree = Relax(bands).visit(tree)
+        tree = ast.fix_missing_locations(Guard(names).visit(tree))
+        return eval(compile(tree, f"<{key_name(self.key)}>", "eval"), {"__builtins__": {}, **functions})
+
+    def decide(self, args):
+        """Updates which states are on and returns the label they add up to."""
+        active = self.active
+        if self.mode == "first":
+            chosen = None
+            for i in range(len(active)):
+                test = self.hold[i] if active[i] else self.enter[i]
+                if chosen is None and test(*args):
+                    chosen = i
+            for i in range(len(active)):
+                active[i] = i == chosen
+            return self.default if chosen is None else self.labels[chosen]
+        for i in range(len(active)):
+            active[i] = bool((self.hold[i] if active[i] else self.enter[i])(*args))
+        if self.mode == "score":
+            return self.format.format(self.base - sum(p for p, on in zip(self.labels, active) if on))
+        return ", ".join(label for label, on in zip(self.labels, active) if on) or self.default
+
+
+class AssistRules:
+    """Driver assists declared as labelled conditions over PID names.
+
+    rules maps an assist key to one of:
+      {"states": [(label, condition), ...], "default": label}  first state that holds
+      {"mode": "all", "states": [...], "default": label}       every state that holds, joined
+      {"penalties": [(points, condition), ...], "score": 100, "format": "{}%"}
+    plus an optional "dwell" in seconds. Conditions are Python expressions
+    over PID names (NAME_RATE for the rate column), compiled once; bands
+    gives each name's hysteresis, in its own units.
+
+    evaluate() reads a store snapshot and returns only the labels that
+    changed. A rule is skipped while its inputs have no new samples (and no
+    label change is waiting out its dwell). An input never sampled reads as
+    None and every comparison on it is false (see Guard), so one missing PID
+    only turns off the clauses that need it; a rule with no input sampled at
+    all keeps its label.
+    """
+
+    def __init__(self, store, rules, bands=None, functions=None):
+        self.functions = dict(BASE_FUNCTIONS, **(functions or {}))
+        by_name = {key_name(spec.key): spec for spec in store.specs}
+
+        def resolve(name):
+            column = "value"
+            if name not in by_name and name.endswith(RATE_SUFFIX):
+                name, column = name[:-len(RATE_SUFFIX)], "rate"
+            if name not in by_name:
+                return None
+            return by_name[name].id, column
+
+        self.rules = [Rule(key, spec, resolve, bands or {}, self.functions) for key, spec in rules.items()]
+
+    def evaluate(self, snapshot, now):
+        changed = {}
+        seq = snapshot.seq
+        for rule in self.rules:
+            seen = 0
+            for i, _ in rule.inputs:
+                seen += seq[i]
+            if not seen or (seen == rule.seen and rule.pending is None):
+                continue
+            rule.seen = seen
+            try:
+                label = rule.decide([getattr(snapshot, column)[i] if seq[i] else None for i, column in rule.inputs])
+            except (ArithmeticError, ValueError, TypeError) as e:
+                if not rule.failed:
+                    print(f"[!] Assists: {key_name(rule.key)} failed: {e}")
+                    rule.failed = True
+                continue
+            if label == rule.shown:
+                rule.pending = None
+            elif rule.shown is None or rule.dwell <= 0:
+                rule.shown = changed[rule.key] = label
+            elif label != rule.pending:
+                rule.pending = label
+                rule.pending_since = now
+            elif now - rule.pending_since >= rule.dwell:
+                rule.shown = changed[rule.key] = label
+                rule.pending = None
+        return changed
@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import deque
+
+from elm327 import decode_dtcs, parse_vin, reply_text
+from metrics import metrics
+
+# How late one background command may make the fast PIDs, on top of the
+# slack they have left. Well under what shows as a hitch on a 60 fps gauge
+# needle that is already being fed every 50 ms.
+BACKGROUND_MAX_DELAY = 0.05
+# Never run background commands back to back, whatever the slack.
+BACKGROUND_MIN_GAP = 0.5
+# A command that has never found a gap this long goes in right after the
+# next gap where no fast PID is overdue instead of waiting forever.
+BACKGROUND_MAX_WAIT = 10.0
+
+DEFAULT_ESTIMATE = 0.05
+ESTIMATE_SMOOTHING = 0.3
+
+# name -> (command, reply decoder)
+DIAGNOSTIC_COMMANDS = {
+    "dtcs": (b"03\r", decode_dtcs),
+    "vin": (b"0902\r", parse_vin),
+    "adapter_voltage": (b"ATRV\r", reply_text),
+}
+
+
+class BackgroundJob:
+    __slots__ = ("name", "cmd", "decode", "callback", "queued_at")
+
+    def __init__(self, name, cmd, decode, callback, queued_at):
+        self.name = name
+        self.cmd = cmd
+        self.decode = decode
+        self.callback = callback
+        self.queued_at = queued_at
+
+
+class BackgroundLane:
+    """Occasional slow commands (DTCs, VIN, adapter voltage) slotted into poll gaps.
+
+    Any thread can submit; the poll loop asks for the next job only between
+    Mode 01 requests and only when the fast PIDs can take the job's expected
+    round trip. Each job's callback(name, value) runs on the poll thread, so
+    UI callers should hand the result over to their own thread.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.jobs = deque()
+        self.estimates = {}  # name -> smoothed round trip in seconds
+        self.last_run = 0.0
+
+    def submit(self, name, callback, cmd=None, decode=None):
+        """Queues a job; name picks a DIAGNOSTIC_COMMANDS entry unless cmd is given."""
+        if cmd is None:
+            cmd, decode = DIAGNOSTIC_COMMANDS[name]
+        with self.lock:
+            if any(job.name == name for job in self.jobs):
+                return  # Already queued; one answer serves both callers
+            self.jobs.append(BackgroundJob(name, cmd, decode or reply_text, callback, time.monotonic()))
+
+    def next_job(self, slack, now=None):
+        """Returns a job to send now given the fast PIDs' slack, or None."""
+        if not self.jobs:
+            return None
+        if now is None:
+            now = time.monotonic()
+        if now - self.last_run < BACKGROUND_MIN_GAP or slack == float("-inf"):
+            return None
+        with self.lock:
+            job = self.jobs[0]
+            estimate = self.estimates.get(job.name, DEFAULT_ESTIMATE)
+            if estimate > slack + BACKGROUND_MAX_DELAY:
+                if now - job.queued_at < BACKGROUND_MAX_WAIT or slack <= 0:
+                    return None
+            return self.jobs.popleft()
+
+    def requeue(self, job):
+        """Puts a job cut off by a lost connection back at the front."""
+        with self.lock:
+            self.jobs.appendleft(job)
+
+    def finish(self, job, reply, sent_at, now=None):
+        """Delivers one job's decoded reply and learns its round trip."""
+        if now is None:
+            now = time.monotonic()
+        elapsed = now - sent_at
+        estimate = self.estimates.get(job.name, elapsed)
+        self.estimates[job.name] = estimate + ESTIMATE_SMOOTHING * (elapsed - estimate)
+        self.last_run = now
+        metrics.observe("background_seconds", elapsed)
+        try:
+            value = job.decode(reply)
+        except Exception as e:
+            print(f"[!] Background Lane: Could not decode {job.name}: {e}")
+            value = None
+        job.callback(job.name, value)
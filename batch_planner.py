@@ -0,0 +1,62 @@
+# A Mode 01 reply fits one CAN frame while '41' + (PID echo + data) per PID <= 7 bytes.
+SINGLE_FRAME_BYTES = 7
+MAX_PIDS_PER_REQUEST = 6
+RESPONSE_HEADER_BYTES = 1
+BATCHED_MODE = "01"  # Other modes (Mode 22 data identifiers) go one PID per request
+
+
+def is_batched(data, pid):
+    return data[pid].get("mode", BATCHED_MODE) == BATCHED_MODE
+
+
+def pid_cost(data, pid):
+    """Bytes one PID adds to a reply: the PID echo plus its data."""
+    return len(data[pid]["pid"]) // 2 + data[pid]["bytes"]
+
+
+def response_size(data, pids):
+    return RESPONSE_HEADER_BYTES + sum(pid_cost(data, pid) for pid in pids)
+
+
+def fits(data, batch, pid):
+    """True if adding pid to batch keeps the reply in a single frame."""
+    if len(batch) >= MAX_PIDS_PER_REQUEST:
+        return False
+    if batch and not (is_batched(data, pid) and is_batched(data, batch[0])):
+        return False
+    return response_size(data, batch) + pid_cost(data, pid) <= SINGLE_FRAME_BYTES
+
+
+def plan_batches(data, pids):
+    """Bin-packs pids into the fewest single-frame Mode 01 requests.
+
+    First-fit decreasing on reply size; the PID set is tiny, so this lands on
+    the optimum for any realistic config. PIDs of other modes get a request
+    each.
+    """
+    pids = list(dict.fromkeys(pids))
+    order = {pid: i for i, pid in enumerate(pids)}
+    batches = []
+    for pid in sorted(pids, key=lambda p: pid_cost(data, p), reverse=True):
+        if not is_batched(data, pid):
+            batches.append([pid])
+            continue
+        if RESPONSE_HEADER_BYTES + pid_cost(data, pid) > SINGLE_FRAME_BYTES:
+            print(f"[!] Batch Planner: {pid.name} can never fit a single frame. Polling it alone.")
+            batches.append([pid])
+            continue
+        for batch in batches:
+            if fits(data, batch, pid):
+                batch.append(pid)
+                break
+        else:
+            batches.append([pid])
+    for batch in batches:
+        batch.sort(key=order.get)
+    return batches
+
+
+def describe_plan(data, batches):
+    return " | ".join(
+        f"{'+'.join(pid.name for pid in batch)} ({response_size(data, batch)}B)" for batch in batches
+    )
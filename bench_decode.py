@@ -0,0 +1,99 @@
+"""Decode throughput: the old string-walking parser vs. compiled batch decoders.
+
+Run with: python bench_decode.py
+"""
+import time
+from enum import Enum
+
+from obd_decode import CompiledBatch
+
+
+class PID(Enum):
+    RPM = "ENGINE_RPM"
+    BOOST = "MANIFOLD_PRESSURE"
+    THROTTLE = "THROTTLE_POSITION"
+    TIMING = "IGNITION_TIMING"
+    AFR = "AFR_C"
+
+
+# Just the fields the decoders read, mirroring DATA in wifi.py
+DATA = {
+    PID.RPM: {"pid": "0C", "bytes": 2},
+    PID.BOOST: {"pid": "0B", "bytes": 1},
+    PID.THROTTLE: {"pid": "11", "bytes": 1},
+    PID.TIMING: {"pid": "0E", "bytes": 1},
+    PID.AFR: {"pid": "44", "bytes": 2},
+}
+
+CASES = {
+    "single frame": ([PID.RPM, PID.BOOST, PID.THROTTLE], b"410C1AF80B6411A0\r\r"),
+    "spaced": ([PID.RPM, PID.BOOST, PID.THROTTLE], b"41 0C 1A F8 0B 64 11 A0 \r\r"),
+    "missing PID": ([PID.RPM, PID.BOOST, PID.THROTTLE], b"410C1AF811A0\r\r"),
+    "reordered": ([PID.RPM, PID.BOOST, PID.THROTTLE], b"410B640C1AF811A0\r\r"),
+    "multi-frame": (
+        [PID.RPM, PID.BOOST, PID.THROTTLE, PID.TIMING, PID.AFR],
+        b"00C\r0:410C1AF80B64\r1:11A00E9C448000\r\r",
+    ),
+}
+
+
+def legacy_parse(buffer, requested_pids):
+    """parse_batch_response as it was before compiled decoders."""
+    results = []
+    try:
+        raw_str = buffer.decode('utf-8', errors='ignore').strip()
+    except:
+        return results
+
+    if ':' in raw_str:
+        lines = raw_str.split('\r')
+        clean_hex = ""
+        for line in lines:
+            line = line.strip()
+            if ':' in line:
+                clean_hex += line.split(':')[1]
+    else:
+        clean_hex = raw_str.replace('\r', '').replace('\n', '')
+
+    clean_hex = clean_hex.replace(' ', '').replace('>', '')
+    response_start = clean_hex.find("41")
+    if response_start == -1:
+        return results
+
+    current_data = clean_hex[response_start + 2:]
+
+    for pid_key in requested_pids:
+        pid_hex = DATA[pid_key]["pid"]
+        hex_len = DATA[pid_key]["bytes"] * 2
+        if current_data.startswith(pid_hex):
+            try:
+                results.append((pid_key, int(current_data[2 : 2 + hex_len], 16)))
+                current_data = current_data[2 + hex_len:]
+            except ValueError:
+                break
+    return results
+
+
+def rate(fn, reply, pids, seconds=1.0):
+    count = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        for _ in range(1000):
+            fn(reply, pids)
+        count += 1000
+    return count / seconds
+
+
+def main():
+    print(f"{'case':<14}{'legacy/s':>12}{'compiled/s':>12}{'speedup':>9}  PIDs found (legacy/compiled)")
+    for name, (pids, reply) in CASES.items():
+        batch = CompiledBatch(DATA, pids)
+        view = memoryview(bytearray(reply))
+        old = rate(legacy_parse, reply, pids)
+        new = rate(lambda r, p: batch.decode(r), view, pids)
+        found = f"{len(legacy_parse(reply, pids))}/{len(batch.decode(view))}"
+        print(f"{name:<14}{old:>12,.0f}{new:>12,.0f}{new / old:>8.1f}x  {found}")
+
+
+if __name__ == "__main__":
+    main()
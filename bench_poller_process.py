@@ -0,0 +1,151 @@
+"""Poll rate and UI frame-time jitter: polling thread vs. separate poller process.
+
+Needs the simulator (or an adapter) to poll:
+    python obd_simulator.py &
+    OBD_HOST=127.0.0.1 python bench_poller_process.py
+
+Both modes run a stand-in for the Kivy loop on the main thread: 60 frames a
+second, each burning BENCH_FRAME_WORK_MS of pure-Python work and formatting
+every value of the published snapshot like the gauges do. The UI is pinned
+to core 0 and, in process mode, the poller to the last core. DATA is built
+from pids.json into a TelemetryStore as in wifi.py.
+"""
+import os
+import statistics
+import threading
+import time
+from enum import Enum
+
+from config_manager import ConfigManager
+from pid_catalog import load_catalog
+from pid_scheduler import FAST_PID_MAX_AGE
+from poller_process import PollerProcess
+from telemetry_store import TelemetryStore
+from transport import TransportHub
+
+HOST = os.environ.get("OBD_HOST", "127.0.0.1")
+PORT = int(os.environ.get("OBD_PORT", 35000))
+SECONDS = float(os.environ.get("BENCH_SECONDS", 10))
+FRAME_WORK_MS = float(os.environ.get("BENCH_FRAME_WORK_MS", 6))
+FRAME_INTERVAL = 1.0 / 60.0
+CONNECT_TIMEOUT = 15
+
+# The same catalog, store and derived channels as wifi.py; BOOST is MAP - BARO
+CATALOG = load_catalog()
+PID = Enum("PID", [(name, name) for name in CATALOG], module=__name__)
+STORE = TelemetryStore({PID[name]: entry for name, entry in CATALOG.items()},
+                       functions={"gear": lambda rpm, speed: 0, "STOICH_AFR": 14.7})
+STORE.set_filters(ConfigManager.DEFAULT_CONFIG["filters"])
+DATA = STORE.view
+
+
+def polled_pids(keys):
+    """Like wifi.polled_pids: derived channels become the PIDs they are computed from."""
+    pids = []
+    for key in keys:
+        for leaf in STORE.derived.leaves(PID[key]):
+            if leaf not in pids:
+                pids.append(leaf)
+    return pids
+
+
+FAST_PIDS = [pid for pid in polled_pids(["RPM", "BOOST", "THROTTLE"]) if DATA[pid]["max_age"] <= FAST_PID_MAX_AGE]
+SLOW_PIDS = [pid for pid in polled_pids(["BOOST", "TIMING", "LOAD", "STFT", "COOLANT_TEMP", "IAT"]) if pid not in FAST_PIDS]
+
+
+def publish(adapter):
+    STORE.publish()
+
+
+def make_hub(after_poll=None):
+    return TransportHub.from_config([{"type": "elm327", "name": "bench"}], DATA, PID.__members__,
+                                    STORE.update, lambda: (FAST_PIDS, SLOW_PIDS), after_poll,
+                                    default_host=HOST, default_port=PORT)
+
+
+def burn(ms):
+    end = time.perf_counter() + ms / 1000.0
+    n = 0
+    while time.perf_counter() < end:
+        n += sum(i * i for i in range(50))
+    return n
+
+
+def ui_loop(seconds, sync=None):
+    """Returns the frame-to-frame intervals of a 60 fps loop doing FRAME_WORK_MS per frame."""
+    intervals = []
+    now = last = time.perf_counter()
+    end = now + seconds
+    next_frame = now
+    while now < end:
+        if sync and sync():
+            STORE.publish()
+        burn(FRAME_WORK_MS)
+        snapshot = STORE.snapshot
+        for spec in STORE.specs:
+            snapshot.text(spec.key)
+        next_frame += FRAME_INTERVAL
+        delay = next_frame - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        now = time.perf_counter()
+        intervals.append(now - last)
+        last = now
+    return intervals
+
+
+def wait_for(samples):
+    deadline = time.monotonic() + CONNECT_TIMEOUT
+    while samples() == 0:
+        if time.monotonic() > deadline:
+            raise SystemExit(f"No samples from {HOST}:{PORT} after {CONNECT_TIMEOUT}s; is the simulator running?")
+        time.sleep(0.1)
+    time.sleep(1.0)  # Let priming and latency tuning settle
+
+
+def bench_process(core):
+    poller = PollerProcess(make_hub(), DATA, STORE.set, core)
+    poller.start()
+    try:
+        wait_for(poller.samples)
+        start = poller.samples()
+        intervals = ui_loop(SECONDS, poller.sync)
+        return poller.samples() - start, intervals
+    finally:
+        poller.stop()
+
+
+def bench_thread():
+    hub = make_hub(publish)
+    count = [0]
+    def sink(pid, value, ts):
+        count[0] += 1
+    hub.sink = sink
+    threading.Thread(target=hub.run_forever, daemon=True).start()
+    wait_for(lambda: count[0])
+    start = count[0]
+    intervals = ui_loop(SECONDS)
+    return count[0] - start, intervals
+
+
+def report(name, samples, intervals):
+    ms = sorted(i * 1000.0 for i in intervals)
+    p50 = ms[len(ms) // 2]
+    p99 = ms[min(int(len(ms) * 0.99), len(ms) - 1)]
+    print(f"{name:<8} {samples / SECONDS:9.0f} samples/s   frame p50 {p50:5.1f}ms  p99 {p99:5.1f}ms  "
+          f"max {ms[-1]:5.1f}ms  jitter (stdev) {statistics.pstdev(ms):5.2f}ms")
+
+
+if __name__ == "__main__":
+    poller_core = None
+    if hasattr(os, "sched_setaffinity") and (os.cpu_count() or 1) > 1:
+        os.sched_setaffinity(0, {0})
+        poller_core = os.cpu_count() - 1
+    print(f"{SECONDS:g}s per mode, {FRAME_WORK_MS:g}ms of work per 60 fps frame, adapter {HOST}:{PORT}\n")
+
+    # Process mode first: forking after the polling thread has started would copy its sockets.
+    results = [("process", *bench_process(poller_core))]
+    results.append(("thread", *bench_thread()))
+    print()
+    for name, samples, intervals in results:
+        report(name, samples, intervals)
@@ -13,7 +13,45 @@ class ConfigManager:
         "warnings": ["WARMUP_STATUS", "BATTERY_STATUS"],
         "fast_pids": ["RPM", "BOOST", "TIMING", "THROTTLE", "STFT"],
         "slow_pids": ["IAT", "COOLANT_TEMP", "OIL_TEMP", "LTFT", "VOLTAGE", "LOAD", "AFR"],
-        "show_rpm_bar": True
+        "show_rpm_bar": True,
+        "latency_mode": False,
+        "burst_pids": ["RPM", "BOOST", "SPEED"],
+        "burst_seconds": 10,
+        "poller_process": False,
+        "poller_core": None,
+        "history_seconds": 30,
+        "gear_rpm_per_kmh": [130, 75, 52, 40, 32, 27],
+        "filters": {
+            "STFT": {"median": 5, "ema": 0.3},
+            "BOOST": {"ema": 0.1},
+            "THROTTLE": {"rate": 0.15}
+        },
+        "assist_rate_hz": 10,
+        "alarms": {
+            "BOOST": {"high": 22, "debounce": 2},
+            "OIL_TEMP": {"high": 130, "debounce": 3, "band": 3},
+            "COOLANT_TEMP": {"high": 110, "debounce": 3, "band": 3},
+            "VOLTAGE": {"low": 11.8, "debounce": 5, "band": 0.2}
+        },
+        "trip_thresholds": {"RPM": 4000, "BOOST": 0, "COOLANT_TEMP": 100},
+        "trip_save_seconds": 5,
+        "pid_catalog": "pids.json",
+        "logging": {
+            "enabled": False,
+            "dir": "logs",
+            "segment_samples": 262144,
+            "rotate_seconds": 600,
+            "fsync_seconds": 5,
+            "buffer_samples": 32768
+        },
+        "operating_maps": {
+            "histograms": {"COOLANT_TEMP": [40, 120, 16], "IAT": [0, 80, 16]},
+            "tables": [
+                {"x": ["RPM", 0, 7000, 14], "y": ["BOOST", -15, 25, 8]},
+                {"x": ["LOAD", 0, 100, 10], "y": ["RPM", 0, 7000, 7], "z": "TIMING"},
+                {"x": ["LOAD", 0, 100, 10], "y": ["RPM", 0, 7000, 7], "z": "STFT"}
+            ]
+        }
     }
 
     def __init__(self):
@@ -62,6 +100,9 @@ class ConfigManager:
             print(f"Error saving config: {e}")
 
     def get(self, key, default=None):
+        """Falls back to DEFAULT_CONFIG for keys an older config.json doesn't have."""
+        if default is None:
+            default = self.DEFAULT_CONFIG.get(key)
         return self.config.get(key, default)
 
     def set(self, key, value):
@@ -0,0 +1,108 @@
+from math import isfinite
+
+# Always available inside an expression
+BASE_FUNCTIONS = {"abs": abs, "min": min, "max": max, "round": round}
+
+
+def key_name(key):
+    return getattr(key, "name", key)
+
+
+class DerivedChannels:
+    """Channels computed from other PIDs, e.g. "MAP - BARO".
+
+    Each entry with an "expr" is compiled once into a plain function of its
+    inputs, which are the PID names the expression uses (other derived
+    channels included). The channels are kept in dependency order, so one
+    pass over the dirty ones brings everything up to date.
+
+    The store marks a channel dirty when one of its inputs gets a sample,
+    and recompute() runs only those, once per published batch. A result
+    that can't be computed (an input not sampled yet, a division by zero)
+    leaves the channel's last value in place. A channel over a PID that
+    isn't in the store is left out with a warning and never gets a value.
+    """
+
+    def __init__(self, specs, functions=None):
+        self.functions = dict(BASE_FUNCTIONS, **(functions or {}))
+        by_name = {key_name(spec.key): spec for spec in specs}
+        compiled = {}
+        for spec in specs:
+            if spec.expr:
+                result = self.compile(spec, by_name)
+                if result:
+                    compiled[spec.id] = result
+
+        self.order = []  # (spec id, function, input ids), inputs before their dependents
+        state = {}
+        def visit(i, path):
+            if state.get(i) == "done":
+                return
+            if state.get(i) == "visiting":
+                names = " -> ".join(key_name(specs[j].key) for j in path + [i])
+                raise ValueError(f"Derived channels depend on each other: {names}")
+            state[i] = "visiting"
+            for j in compiled[i][1]:
+                if j in compiled:
+                    visit(j, path + [i])
+            state[i] = "done"
+            self.order.append((i,) + compiled[i])
+        for i in compiled:
+            visit(i, [])
+
+        # Per spec id: indexes into order of the channels that read it
+        self.feeds = [() for _ in specs]
+        for c, (i, func, inputs) in enumerate(self.order):
+            for j in inputs:
+                self.feeds[j] += (c,)
+        self.dirty = bytearray(len(self.order))
+        self.inputs = {specs[i].key: [specs[j].key for j in inputs] for i, func, inputs in self.order}
+
+    def compile(self, spec, by_name):
+        name = key_name(spec.key)
+        code = compile(spec.expr, f"<{name}>", "eval")
+        args = [n for n in code.co_names if n not in self.functions]
+        for arg in args:
+            if arg not in by_name:
+                print(f"[!] Derived channel {name}: unknown input {arg} in {spec.expr!r}, skipping")
+                return None
+        func = eval(f"lambda {', '.join(args)}: {spec.expr}", {"__builtins__": {}, **self.functions})
+        return func, tuple(by_name[arg].id for arg in args)
+
+    def is_derived(self, key):
+        return key in self.inputs
+
+    def leaves(self, key):
+        """The polled PIDs a channel is computed from; just [key] for a polled PID."""
+        if key not in self.inputs:
+            return [key]
+        found = []
+        for input_key in self.inputs[key]:
+            for leaf in self.leaves(input_key):
+                if leaf not in found:
+                    found.append(leaf)
+        return found
+
+    def recompute(self, store):
+        """Recomputes the dirty channels into the store, in dependency order."""
+        dirty = self.dirty
+        value, seq, timestamp = store.value, store.seq, store.timestamp
+        for c, (i, func, inputs) in enumerate(self.order):
+            if not dirty[c]:
+                continue
+            dirty[c] = 0
+            newest = 0.0
+            args = []
+            for j in inputs:
+                if not seq[j]:
+                    break
+                args.append(value[j])
+                if timestamp[j] > newest:
+                    newest = timestamp[j]
+            else:
+                try:
+                    result = float(func(*args))
+                except (ArithmeticError, ValueError, TypeError):
+                    continue
+                if isfinite(result):
+                    store.put(i, result, newest)  # Marks channels further down the order
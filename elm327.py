@@ -0,0 +1,444 @@
+import json
+import os
+import socket
+
+from obd_decode import reply_to_bytes
+
+PROMPT = b">"
+READ_BUFFER_SIZE = 4096
+
+# Settings every session needs, after either a full reset or a warm start
+SESSION_SETUP = [b"ATE0\r", b"ATL0\r", b"ATS0\r", b"ATH0\r"]
+
+
+class ResponseReader:
+    """Frames ELM327 replies on the '>' prompt with no per-read allocations.
+
+    Bytes are received with recv_into straight into one preallocated buffer
+    and only the newly received bytes are scanned for the prompt. Anything
+    the adapter sent after the prompt is kept for the next reply. A reply is
+    a memoryview into that buffer, so it is only good until the next command.
+    """
+
+    def __init__(self, sock, size=READ_BUFFER_SIZE):
+        self.sock = sock
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.start = 0  # First byte of the next reply
+        self.end = 0    # One past the last received byte
+
+    def reset(self):
+        """Drops anything buffered, e.g. a partial reply left by a timeout."""
+        self.start = 0
+        self.end = 0
+
+    def _compact(self):
+        """Moves leftover bytes from the previous reply to the front."""
+        if self.start:
+            leftover = self.end - self.start
+            self.buffer[:leftover] = self.view[self.start:self.end]
+            self.start = 0
+            self.end = leftover
+
+    def _take(self, scanned):
+        """Returns the reply if a prompt arrived at or after scanned, else None."""
+        idx = self.buffer.find(PROMPT, scanned, self.end)
+        if idx != -1:
+            self.start = idx + 1
+            return self.view[:idx]
+        if self.end == len(self.buffer):
+            self.reset()
+            raise ConnectionError("Response overflowed read buffer")
+        return None
+
+    def _received(self, n):
+        if not n:
+            raise ConnectionError("Lost connection")
+        self.end += n
+
+    def read_response(self):
+        """Blocks until a full reply arrives and returns it as a memoryview.
+
+        The prompt is not included. The view aliases the internal buffer and is
+        only valid until the next call.
+        """
+        self._compact()
+        scanned = 0
+        while True:
+            reply = self._take(scanned)
+            if reply is not None:
+                return reply
+            scanned = self.end
+            self._received(self.sock.recv_into(self.view[self.end:]))
+
+    def command(self, cmd):
+        """Sends one command and returns its reply."""
+        self.sock.sendall(cmd)
+        return self.read_response()
+
+    async def read_response_async(self, loop):
+        """read_response for a non-blocking socket driven by an asyncio loop."""
+        self._compact()
+        scanned = 0
+        while True:
+            reply = self._take(scanned)
+            if reply is not None:
+                return reply
+            scanned = self.end
+            self._received(await loop.sock_recv_into(self.sock, self.view[self.end:]))
+
+    async def command_async(self, loop, cmd):
+        await loop.sock_sendall(self.sock, cmd)
+        return await self.read_response_async(loop)
+
+
+def reply_text(reply):
+    """Decodes a reply view to one line of text, dropping blank lines."""
+    return " ".join(line.strip() for line in str(reply, 'ascii', 'ignore').splitlines() if line.strip())
+
+
+def is_ecu_reply(text, mode_pid="4100"):
+    return mode_pid in text.replace(" ", "")
+
+
+class StateFile:
+    """A small JSON dict persisted between sessions (adapter state, vehicle cache).
+
+    Saves go to a temporary file that replaces the real one, so a power cut
+    mid-write leaves the previous version rather than a truncated file.
+    """
+    ADAPTER_STATE_FILE = "adapter_state.json"
+    VEHICLE_CACHE_FILE = "vehicles.json"
+
+    def __init__(self, path, indent=4):
+        self.path = path
+        self.indent = indent
+        self.state = self.load_state()
+
+    def load_state(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, IOError):
+            print(f"[!] Error loading {self.path}, starting cold.")
+            return {}
+
+    def save_state(self):
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(self.state, f, indent=self.indent, separators=None if self.indent else (",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except (IOError, OSError) as e:
+            print(f"[!] Error saving {self.path}: {e}")
+
+    def get(self, key, default=None):
+        return self.state.get(key, default)
+
+    def update(self, **values):
+        if any(self.state.get(k) != v for k, v in values.items()):
+            self.state.update(values)
+            self.save_state()
+
+    def section(self, name):
+        return StateSection(self, name)
+
+
+class StateSection:
+    """One named dict inside a StateFile, e.g. the state of one adapter."""
+
+    def __init__(self, state_file, name):
+        self.state_file = state_file
+        self.name = name
+
+    @property
+    def state(self):
+        return self.state_file.state.setdefault(self.name, {})
+
+    def get(self, key, default=None):
+        return self.state.get(key, default)
+
+    def update(self, **values):
+        if any(self.state.get(k) != v for k, v in values.items()):
+            self.state.update(values)
+            self.state_file.save_state()
+
+
+def warm_init(reader, state):
+    """Re-initialises an adapter we have talked to before without a full reset.
+
+    ATWS skips the ATZ power-on sequence, and ATSPn with the cached protocol
+    skips the auto search. Returns False whenever anything looks different
+    from last time so the caller can fall back to full_init.
+    """
+    identity = state.get("identity")
+    protocol = state.get("protocol")
+    if not identity or not protocol:
+        return False
+    try:
+        if identity not in reply_text(reader.command(b"ATWS\r")):
+            return False
+        for cmd in SESSION_SETUP:
+            reader.command(cmd)
+        if "OK" not in reply_text(reader.command(f"ATSP{protocol}\r".encode('ascii'))):
+            return False
+        return is_ecu_reply(reply_text(reader.command(b"0100\r")))
+    except socket.timeout:
+        reader.reset()
+        return False
+
+
+def full_init(reader, state):
+    """Full reset and protocol auto-search, then caches what was detected."""
+    for cmd in [b"ATZ\r"] + SESSION_SETUP + [b"ATSP0\r", b"0100\r"]:
+        try:
+            reader.command(cmd)
+        except socket.timeout:
+            reader.reset()
+    try:
+        identity = reply_text(reader.command(b"ATI\r"))
+        protocol = reply_text(reader.command(b"ATDPN\r"))
+        if len(protocol) == 2 and protocol[0] == "A":
+            protocol = protocol[1:]  # "A6": found by auto search
+    except socket.timeout:
+        reader.reset()
+        return
+    if identity and len(protocol) == 1 and protocol in "123456789ABC":
+        state.update(identity=identity, protocol=protocol)
+
+
+# ECU request/response IDs for 11-bit CAN (protocols 6 and 8)
+ENGINE_ECU_REPLY_ID = "7E8"
+ENGINE_ECU_REQUEST_ID = "7E0"
+ELEVEN_BIT_CAN_PROTOCOLS = ("6", "8")
+
+# ATST counts in 4 ms steps; 0x32 (200 ms) is the adapter default.
+DEFAULT_ATST = 0x32
+MIN_ATST = 0x04
+TIMING_SAMPLES = 100
+TIMING_MARGIN = 1.5
+RETUNE_MIN_CHANGE = 0.25  # Smaller ATST changes (or under 2 steps) aren't worth an AT round trip
+LOOSEN_FACTOR = 1.5  # A NO DATA while tuned loosens ATST by this much, not all the way back
+
+
+class LatencyTuner:
+    """Cuts the adapter's wait after each Mode 01 reply.
+
+    Without a response-count suffix the ELM327 waits out its full response
+    timeout after the ECU has answered. Once it is safe to say how many
+    replies to expect (the engine ECU is addressed directly with ATSH, or
+    only one ECU answered 0100), requests get that count appended. ATAT1
+    adaptive timing is enabled, and ATST is then tightened to a margin over
+    the slowest round trip seen. Every step is dropped on adapters that
+    answer '?'. A NO DATA to a multi-PID request while tuned loosens ATST a
+    step and makes that the floor for later tightening, so it settles
+    instead of flapping.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.enabled = False
+        self.response_count = None
+        self.direct_ecu = False
+        self.atst = DEFAULT_ATST
+        self.floor = MIN_ATST  # Tightest ATST not yet seen to cost a NO DATA
+        self.samples = 0
+        self.slowest = 0.0
+        self.commands = {}
+        self.control = None # (atst, command) waiting for the driver to send
+
+    def setup(self, reader, protocol=None):
+        """Runs once per connect, after init. Leaves the adapter in ATH0."""
+        self.reset()
+        self.enabled = True
+        try:
+            responders = self.find_responders(reader)
+            if ENGINE_ECU_REPLY_ID in responders and protocol in ELEVEN_BIT_CAN_PROTOCOLS:
+                if self.accepted(reader, f"ATSH{ENGINE_ECU_REQUEST_ID}\r"):
+                    self.direct_ecu = True
+            if self.direct_ecu or len(responders) == 1:
+                self.response_count = 1
+            self.accepted(reader, "ATAT1\r")
+        except socket.timeout:
+            reader.reset()
+        mode = "direct" if self.direct_ecu else "functional"
+        print(f"[*] Latency Mode: {mode} addressing, response count {self.response_count or 'off'}")
+
+    def find_responders(self, reader):
+        """Returns the reply header of every ECU that answers 0100."""
+        reader.command(b"ATH1\r")
+        try:
+            text = str(reader.command(b"0100\r"), 'ascii', 'ignore')
+        finally:
+            reader.command(b"ATH0\r")
+        responders = []
+        for line in text.split():
+            idx = line.find("4100")
+            if idx > 3:
+                # "7E8064100..." -> CAN ID, then the PCI length byte
+                responders.append(line[:idx - 2])
+        return responders
+
+    def accepted(self, reader, cmd):
+        return "?" not in reply_text(reader.command(cmd.encode('ascii')))
+
+    def request(self, cmd):
+        """Returns cmd with the response-count suffix when it is enabled."""
+        if self.response_count is None:
+            return cmd
+        tuned = self.commands.get(cmd)
+        if tuned is None:
+            tuned = self.commands[cmd] = cmd[:-1] + b"%X\r" % self.response_count
+        return tuned
+
+    def observe(self, reply, elapsed, probing=False, single=False):
+        """Feeds one poll's reply and round trip back.
+
+        Returns False if the adapter rejected the suffixed request, so the
+        caller should resend it plain. Timeout changes are queued for the
+        driver to send between polls (see next_control), never sent from here:
+        reply still has to be decoded and a command would overwrite it in the
+        reader's buffer. Replies to probes of quarantined PIDs are expected to
+        fail and don't count as timing; nor does a NO DATA to a single-PID
+        request, which is more likely that PID than the timeout.
+        """
+        if not self.enabled:
+            return True
+        text = reply_text(reply) if len(reply) < 16 else ""
+        if self.response_count is not None and text == "?":
+            print("[!] Latency Mode: Adapter rejected response count. Disabling.")
+            self.response_count = None
+            return False
+        if probing:
+            return True
+        if text == "NO DATA":
+            if not single and self.atst < DEFAULT_ATST and self.control is None:
+                # Tuned too tight for this ECU; back off a step and never go this low again
+                self.floor = self.atst + 1
+                steps = min(max(int(self.atst * LOOSEN_FACTOR), self.atst + 2), DEFAULT_ATST)
+                self.control = (steps, b"ATST%02X\r" % steps)
+                self.samples = 0
+                self.slowest = 0.0
+            return True
+
+        self.slowest = max(self.slowest, elapsed)
+        self.samples += 1
+        if self.samples == TIMING_SAMPLES:
+            steps = max(self.floor, min(int(self.slowest * TIMING_MARGIN / 0.004) + 1, DEFAULT_ATST))
+            change = abs(steps - self.atst)
+            if change >= 2 and change > self.atst * RETUNE_MIN_CHANGE and self.control is None:
+                self.control = (steps, b"ATST%02X\r" % steps)
+            self.samples = 0
+            self.slowest = 0.0
+        return True
+
+    def next_control(self):
+        """Returns an adapter command to send before the next poll, or None."""
+        return self.control[1] if self.control else None
+
+    def control_reply(self, reply):
+        atst, _ = self.control
+        self.control = None
+        if "?" not in reply_text(reply):
+            print(f"[*] Latency Mode: ATST {self.atst * 4}ms -> {atst * 4}ms")
+            self.atst = atst
+
+
+def decode_support_bitmap(base, bitmap):
+    """Returns the PID numbers a 4-byte Mode 01 support bitmap marks as supported."""
+    value = int.from_bytes(bitmap, 'big')
+    return {base + i + 1 for i in range(32) if value & (1 << (31 - i))}
+
+
+def read_supported_pids(reader):
+    """Walks 0100/0120/0140 and returns the supported PIDs as hex strings ('0C')."""
+    supported = set()
+    for base in (0x00, 0x20, 0x40):
+        if base and base not in supported:
+            break
+        payload = reply_to_bytes(reader.command(b"01%02X\r" % base))
+        if not payload:
+            break
+        idx = payload.find(bytes([0x41, base]))
+        if idx == -1 or len(payload) < idx + 6:
+            break
+        supported |= decode_support_bitmap(base, payload[idx + 2:idx + 6])
+    return {f"{pid:02X}" for pid in supported}
+
+
+def read_vin(reader):
+    """Reads the VIN with Mode 09 PID 02, or returns None if the car won't say."""
+    return parse_vin(reader.command(b"0902\r"))
+
+
+def parse_vin(reply):
+    payload = reply_to_bytes(reply)
+    if not payload:
+        return None
+    idx = payload.find(b"\x49\x02")
+    if idx == -1:
+        return None
+    # Skips the 'number of data items' byte, then keeps the printable tail.
+    vin = "".join(chr(b) for b in payload[idx + 3:] if chr(b).isalnum())
+    return vin[-17:] if len(vin) >= 17 else None
+
+
+DTC_SYSTEMS = "PCBU"
+
+
+def decode_dtcs(reply):
+    """Decodes a Mode 03 reply into trouble codes like 'P0301'.
+
+    CAN replies carry a count byte after the 0x43, older protocols pad every
+    frame to three codes; either way 0000 entries are padding.
+    """
+    payload = reply_to_bytes(reply)
+    if not payload:
+        return []
+    idx = payload.find(b"\x43")
+    if idx == -1:
+        return []
+    codes = payload[idx + 1:]
+    if len(codes) % 2:
+        codes = codes[1:]  # CAN count byte
+    dtcs = []
+    for i in range(0, len(codes) - 1, 2):
+        a, b = codes[i], codes[i + 1]
+        if a or b:
+            dtcs.append(f"{DTC_SYSTEMS[a >> 6]}{(a >> 4) & 0x3}{a & 0xF:X}{b:02X}")
+    return dtcs
+
+
+def discover_vehicle(reader, adapter_state, vehicles):
+    """Returns (vin, supported PID hex set) for the connected car.
+
+    The VIN is read on every connect, warm ones included, since the adapter
+    may have moved to another car. The cached support bitmaps are used only
+    for a VIN seen before; otherwise they are walked and cached.
+    """
+    try:
+        vin = read_vin(reader)
+    except socket.timeout:
+        reader.reset()
+        vin = None
+    if vin and vin in vehicles.state:
+        adapter_state.update(vin=vin)
+        return vin, set(vehicles.get(vin)["supported"])
+
+    try:
+        supported = read_supported_pids(reader)
+    except socket.timeout:
+        reader.reset()
+        return vin, None
+    if not supported:
+        return vin, None
+    if vin:
+        vehicles.update(**{vin: {"supported": sorted(supported)}})
+        adapter_state.update(vin=vin)
+    return vin, supported
@@ -0,0 +1,277 @@
+"""Shares one ELM327 adapter between several TCP clients.
+
+The proxy owns the only connection to the adapter and speaks the ELM327
+text protocol to any number of clients (the dash, a logger, a laptop tool).
+Identical requests that are already on their way to the adapter are
+answered from the same reply, and Mode 01 replies are served from a short
+TTL cache to clients asking again right after.
+
+Usage: OBD_HOST=192.168.0.10 OBD_PORT=35000 PROXY_PORT=35001 python elm_proxy.py
+then point the clients at this machine's PROXY_PORT.
+"""
+import asyncio
+import os
+import re
+import socket
+import time
+
+from elm327 import ResponseReader
+
+UPSTREAM_HOST = os.environ.get("OBD_HOST", "192.168.0.10")
+UPSTREAM_PORT = int(os.environ.get("OBD_PORT", 35000))
+HOST = os.environ.get("PROXY_HOST", "0.0.0.0")
+PORT = int(os.environ.get("PROXY_PORT", 35001))
+CACHE_TTL = float(os.environ.get("PROXY_CACHE_TTL", 0.05))
+
+UPSTREAM_TIMEOUT = 2
+RECONNECT_DELAY = 2
+STATS_INTERVAL = 30
+MAX_CACHE_ENTRIES = 1024
+
+# The upstream link always runs echo, linefeeds and spaces off; whatever a
+# client asked for is applied when its reply is formatted.
+UPSTREAM_SETUP = ["ATZ", "ATE0", "ATL0", "ATS0", "ATH0", "ATSP0", "ATAT1", "0100"]
+
+# Shared adapter settings a single client must not change under the others.
+PROXY_OWNED = ("SP", "TP", "ST", "AT", "M")
+
+# Functional request header per protocol, restored when a client without
+# an ATSH of its own follows one that set it.
+DEFAULT_HEADERS = {"6": "7DF", "8": "7DF", "7": "18DB33F1", "9": "18DB33F1"}
+DEFAULT_HEADER = "686AF1"
+
+# Adapter-level error sent to clients while the adapter is unreachable
+UPSTREAM_DOWN = "CAN ERROR"
+
+HEX_LINE = re.compile(r"^([0-9A-F]:)?([0-9A-F]+)$")
+
+
+class ClientSession:
+    """The per-client view of the adapter settings that only affect formatting."""
+    __slots__ = ("echo", "linefeeds", "spaces", "headers", "header")
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        # ELM327 power-on defaults
+        self.echo = True
+        self.linefeeds = False
+        self.spaces = True
+        self.headers = False
+        self.header = None
+
+    def format(self, cmd, text):
+        lines = [line for line in text.split("\r") if line]
+        if self.spaces:
+            lines = [self.space(line) for line in lines]
+        eol = "\r\n" if self.linefeeds else "\r"
+        echo = cmd + eol if self.echo else ""
+        return f"{echo}{eol.join(lines)}{eol}{eol}>"
+
+    def space(self, line):
+        match = HEX_LINE.match(line)
+        if not match:
+            return line
+        prefix, digits = match.group(1) or "", match.group(2)
+        head = ""
+        if self.headers and not prefix and len(digits) % 2:
+            head, digits = digits[:3] + " ", digits[3:]  # 11-bit CAN ID
+        pairs = " ".join(digits[i:i + 2] for i in range(0, len(digits), 2))
+        return f"{prefix} {head}{pairs}" if prefix else f"{head}{pairs}"
+
+
+class Upstream:
+    """The single adapter connection, shared by every client session."""
+
+    def __init__(self):
+        self.reader = None
+        self.connected = asyncio.Event()
+        self.lock = asyncio.Lock()
+        self.inflight = {}  # key -> future of the reply text
+        self.cache = {}     # key -> (received_at, reply text)
+        self.identity = "ELM327 v1.5"
+        self.protocol = None
+        self.headers = False
+        self.header = None
+        self.stats = {"requests": 0, "sent": 0, "cached": 0, "coalesced": 0}
+
+    async def run(self):
+        """Keeps the adapter connected."""
+        while True:
+            if not self.connected.is_set():
+                try:
+                    await self.connect()
+                except (OSError, asyncio.TimeoutError, ConnectionError) as e:
+                    print(f"[!] Proxy: Adapter connection failed: {e!r}")
+                    self.disconnect()
+                    await asyncio.sleep(RECONNECT_DELAY)
+                    continue
+            await asyncio.sleep(0.5)
+
+    async def connect(self):
+        loop = asyncio.get_running_loop()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        try:
+            await asyncio.wait_for(loop.sock_connect(sock, (UPSTREAM_HOST, UPSTREAM_PORT)), UPSTREAM_TIMEOUT)
+        except BaseException:
+            sock.close()
+            raise
+        self.reader = ResponseReader(sock)
+        async with self.lock:
+            for cmd in UPSTREAM_SETUP:
+                await self.send(cmd)
+            self.identity = await self.send("ATI") or self.identity
+            self.protocol = (await self.send("ATDPN")).lstrip("A")
+            self.headers = False
+            self.header = None
+        self.cache.clear()
+        self.connected.set()
+        print(f"[*] Proxy: Adapter {UPSTREAM_HOST}:{UPSTREAM_PORT} connected ({self.identity}, protocol {self.protocol})")
+
+    def disconnect(self):
+        if self.reader:
+            self.reader.sock.close()
+            self.reader = None
+        if self.connected.is_set():
+            print("[!] Proxy: Adapter connection lost. Reconnecting...")
+        self.connected.clear()
+
+    async def send(self, cmd):
+        """One command on the wire; the caller holds the lock. Returns canonical text."""
+        loop = asyncio.get_running_loop()
+        reply = await asyncio.wait_for(
+            self.reader.command_async(loop, cmd.encode('ascii') + b"\r"), UPSTREAM_TIMEOUT)
+        self.stats["sent"] += 1
+        return "\r".join(line.strip() for line in str(reply, 'ascii', 'ignore').split("\r") if line.strip())
+
+    async def select(self, headers, header):
+        """Puts the adapter into the header settings the next request was made with."""
+        if headers != self.headers:
+            await self.send("ATH1" if headers else "ATH0")
+            self.headers = headers
+        if header != self.header:
+            await self.send(f"ATSH{header or DEFAULT_HEADERS.get(self.protocol, DEFAULT_HEADER)}")
+            self.header = header
+
+    async def request(self, cmd, headers, header, cacheable):
+        """Returns the reply text for cmd, sharing it with identical requests."""
+        self.stats["requests"] += 1
+        key = (cmd, headers, header)
+        if cacheable:
+            hit = self.cache.get(key)
+            if hit and time.monotonic() - hit[0] <= CACHE_TTL:
+                self.stats["cached"] += 1
+                return hit[1]
+        pending = self.inflight.get(key)
+        if pending:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[key] = future
+        try:
+            text = await self.exchange(cmd, headers, header)
+            if cacheable and text != UPSTREAM_DOWN:
+                if len(self.cache) >= MAX_CACHE_ENTRIES:
+                    self.cache.clear()
+                self.cache[key] = (time.monotonic(), text)
+            future.set_result(text)
+            return text
+        finally:
+            del self.inflight[key]
+            if not future.done():
+                future.set_result(UPSTREAM_DOWN)
+
+    async def exchange(self, cmd, headers, header):
+        try:
+            await asyncio.wait_for(self.connected.wait(), UPSTREAM_TIMEOUT)
+        except asyncio.TimeoutError:
+            return UPSTREAM_DOWN
+        async with self.lock:
+            if not self.connected.is_set():
+                return UPSTREAM_DOWN  # Dropped while this request waited its turn
+            try:
+                await self.select(headers, header)
+                return await self.send(cmd)
+            except (asyncio.TimeoutError, ConnectionError, OSError):
+                self.disconnect()
+                return UPSTREAM_DOWN
+
+
+class ElmProxy:
+    def __init__(self):
+        self.upstream = Upstream()
+        self.clients = 0
+
+    async def answer(self, session, cmd):
+        """Answers session-local settings here and sends the rest upstream."""
+        if cmd.startswith("AT"):
+            body = cmd[2:]
+            if body in ("Z", "WS", "D"):
+                session.reset()
+                return "OK" if body == "D" else self.upstream.identity
+            if body == "I":
+                return self.upstream.identity
+            if len(body) == 2 and body[0] in "ELSH" and body[1] in "01":
+                setattr(session, {"E": "echo", "L": "linefeeds", "S": "spaces", "H": "headers"}[body[0]], body[1] == "1")
+                return "OK"
+            if body.startswith("SH"):
+                session.header = body[2:] or None
+                return "OK"
+            if body.startswith(PROXY_OWNED):
+                return "OK"
+            return await self.upstream.request(cmd, session.headers, session.header, False)
+        return await self.upstream.request(cmd, session.headers, session.header, cmd.startswith("01"))
+
+    async def handle_client(self, reader, writer):
+        peer = writer.get_extra_info("peername")
+        self.clients += 1
+        print(f"[*] Proxy: Client {peer} connected ({self.clients} total)")
+        session = ClientSession()
+        buffer = b""
+        try:
+            while True:
+                data = await reader.read(1024)
+                if not data:
+                    break
+                buffer += data
+                while b"\r" in buffer:
+                    line, _, buffer = buffer.partition(b"\r")
+                    cmd = line.decode('ascii', 'ignore').strip().upper().replace(" ", "")
+                    if not cmd:
+                        continue
+                    text = await self.answer(session, cmd)
+                    writer.write(session.format(cmd, text).encode('ascii'))
+                    await writer.drain()
+        except (ConnectionError, OSError) as e:
+            print(f"[!] Proxy: Client {peer} error: {e}")
+        finally:
+            self.clients -= 1
+            print(f"[*] Proxy: Client {peer} disconnected ({self.clients} left)")
+            writer.close()
+
+    async def report(self):
+        while True:
+            await asyncio.sleep(STATS_INTERVAL)
+            s = self.upstream.stats
+            saved = s["cached"] + s["coalesced"]
+            print(f"[*] Proxy: {s['requests']} requests, {s['sent']} sent to adapter, "
+                  f"{s['cached']} cached, {s['coalesced']} coalesced "
+                  f"({100.0 * saved / max(s['requests'], 1):.0f}% saved)")
+
+    async def serve(self):
+        asyncio.create_task(self.upstream.run())
+        asyncio.create_task(self.report())
+        server = await asyncio.start_server(self.handle_client, HOST, PORT)
+        print(f"[*] Proxy: Listening on {HOST}:{PORT}, adapter at {UPSTREAM_HOST}:{UPSTREAM_PORT}, cache TTL {CACHE_TTL * 1000:.0f}ms")
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(ElmProxy().serve())
+    except KeyboardInterrupt:
+        print("\n[*] Proxy: Shutting down.")
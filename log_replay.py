@@ -0,0 +1,145 @@
+import json
+import mmap
+import os
+import threading
+import time
+from array import array
+from collections import deque
+from statistics import median
+
+from sample_logger import COLUMNS, HEADER, HEADER_SIZE, MAGIC
+
+LEVELS = ("sample", "frame")
+MAX_GAP = 5.0  # Longer gaps (restarts between segments) are closed up to one typical frame interval
+GAP_STEP = 0.01  # The interval used before any has been seen
+
+
+def segment_paths(path):
+    """The .seg files at path (one segment, or a directory of them) in recording order."""
+    if os.path.isdir(path):
+        return sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(".seg"))
+    return [path]
+
+
+def read_segment(path):
+    """(PID names, {column: array}) for the rows recorded in one segment."""
+    with open(path + ".json") as f:
+        names = json.load(f)["pids"]
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        magic, capacity, count, _, _ = HEADER.unpack_from(m, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a sample log")
+        columns = {}
+        offset = HEADER_SIZE
+        for name, code, _ in COLUMNS:
+            width = array(code).itemsize
+            column = array(code)
+            column.frombytes(m[offset:offset + count * width])
+            columns[name] = column
+            offset += capacity * width
+    return names, columns
+
+
+def encode_reply(data, pids, raws):
+    """The adapter reply (headers and spaces off) that decodes to raws; pids share one mode."""
+    mode = data[pids[0]].get("mode") or "01"
+    reply = f"{int(mode, 16) + 0x40:02X}"
+    for pid, raw in zip(pids, raws):
+        reply += data[pid]["pid"] + raw.to_bytes(data[pid]["bytes"], 'big').hex().upper()
+    return (reply + "\r").encode('ascii')
+
+
+class LogReplay:
+    """Plays a recorded sample log back into the app as if it came from the adapter.
+
+    Samples that share a timestamp came from one reply and are replayed
+    together, followed by after_batch(ts) like after_poll. At level "sample"
+    each goes to on_sample(key, raw, ts), the store's convert-and-filter
+    path; at "frame" the reply is rebuilt as adapter bytes and goes to
+    on_reply(reply, pids, ts), so the batch decoder runs as well (Mode 01
+    PIDs in one reply, any others one each).
+
+    speed is a multiple of real time, or 0 for as fast as possible. The
+    timestamps handed on keep the recorded spacing whatever the speed, so
+    filters, alarms, trip and maps see the same drive on every run, and
+    anything timed (assist dwell) should go by the ts after_batch gets.
+    """
+
+    def __init__(self, path, data, keys, on_sample, on_reply, after_batch, speed=1.0, level="sample"):
+        if level not in LEVELS:
+            raise ValueError(f"replay level must be one of {', '.join(LEVELS)}")
+        self.path = path
+        self.data = data
+        self.keys = keys  # PID name -> key; recorded PIDs no longer in the catalog are skipped
+        self.on_sample = on_sample
+        self.on_reply = on_reply
+        self.after_batch = after_batch
+        self.speed = float(speed)
+        self.level = level
+        self.samples = 0
+        self.stop_event = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self.run, name="log-replay", daemon=True).start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self):
+        paths = segment_paths(self.path)
+        print(f"[*] Replay: {len(paths)} segment(s) from {self.path} at "
+              f"{f'{self.speed:g}x' if self.speed > 0 else 'full'} speed, {self.level} level")
+        started = time.monotonic()
+        base = last = None
+        intervals = deque(maxlen=64)
+        for path in paths:
+            try:
+                names, columns = read_segment(path)
+            except (OSError, ValueError) as e:
+                print(f"[!] Replay: Skipping {path}: {e}")
+                continue
+            keys = [self.keys.get(name) for name in names]
+            # Derived channels were logged too; the store recomputes them from their inputs
+            keys = [key if key is not None and not self.data[key].get("expr") else None for key in keys]
+            stamps, raws, pids = columns["timestamp"], columns["raw"], columns["pid"]
+            n = len(stamps)
+            i = 0
+            while i < n:
+                t = stamps[i]
+                j = i + 1
+                while j < n and stamps[j] == t:
+                    j += 1
+                if base is None:
+                    base = last = t
+                elif t < last or t - last > MAX_GAP:
+                    base += t - last - (median(intervals) if intervals else GAP_STEP)
+                elif t > last:
+                    intervals.append(t - last)
+                last = t
+                elapsed = t - base
+                if self.speed > 0:
+                    delay = started + elapsed / self.speed - time.monotonic()
+                    if delay > 0 and self.stop_event.wait(delay):
+                        return
+                elif self.stop_event.is_set():
+                    return
+                batch = [(keys[pids[k]], raws[k]) for k in range(i, j) if pids[k] < len(keys) and keys[pids[k]]]
+                if batch:
+                    self.feed(batch, started + elapsed)
+                    self.after_batch(started + elapsed)
+                i = j
+        took = time.monotonic() - started
+        print(f"[*] Replay: Done, {self.samples} samples in {took:.1f}s ({self.samples / max(took, 1e-9):.0f}/s)")
+
+    def feed(self, batch, timestamp):
+        if self.level == "sample":
+            for key, raw in batch:
+                self.on_sample(key, raw, timestamp)
+        else:
+            batched = [(key, raw) for key, raw in batch if (self.data[key].get("mode") or "01") == "01"]
+            replies = [batched] if batched else []
+            replies += [[(key, raw)] for key, raw in batch if (self.data[key].get("mode") or "01") != "01"]
+            for reply in replies:
+                pids = [key for key, _ in reply]
+                self.on_reply(encode_reply(self.data, pids, [raw for _, raw in reply]), pids, timestamp)
+        self.samples += len(batch)
@@ -0,0 +1,48 @@
+import threading
+
+
+class Metrics:
+    """Thread-safe counters, gauges and timings shared by the poller and the UI."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.timings = {}
+
+    def inc(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def set(self, name, value):
+        with self.lock:
+            self.gauges[name] = value
+
+    def observe(self, name, seconds):
+        """Records one duration; keeps last/min/max/mean rather than every sample."""
+        with self.lock:
+            t = self.timings.get(name)
+            if t is None:
+                t = self.timings[name] = {"last": seconds, "min": seconds, "max": seconds, "count": 0, "total": 0.0}
+            t["last"] = seconds
+            t["min"] = min(t["min"], seconds)
+            t["max"] = max(t["max"], seconds)
+            t["count"] += 1
+            t["total"] += seconds
+
+    def get(self, name, default=None):
+        with self.lock:
+            if name in self.gauges:
+                return self.gauges[name]
+            if name in self.counters:
+                return self.counters[name]
+            t = self.timings.get(name)
+            return dict(t, mean=t["total"] / t["count"]) if t else default
+
+    def snapshot(self):
+        with self.lock:
+            timings = {k: dict(t, mean=t["total"] / t["count"]) for k, t in self.timings.items()}
+            return {"counters": dict(self.counters), "gauges": dict(self.gauges), "timings": timings}
+
+
+metrics = Metrics()
@@ -0,0 +1,132 @@
+import binascii
+
+MODE_01_RESPONSE = 0x41
+RESPONSE_OFFSET = 0x40  # A reply's mode byte is the request mode + 0x40
+WHITESPACE = b" \r\n\t"
+
+# The scheduler builds a handful of distinct batches, so compiled decoders
+# are cached; the cap only guards against a pathological config.
+MAX_CACHED_BATCHES = 256
+
+
+def reply_to_bytes(reply):
+    """Converts an ASCII-hex adapter reply into raw bytes.
+
+    The usual single-frame reply (spaces off) is unhexlified straight out of
+    the reply view. Otherwise each line is stripped in one translate pass,
+    status lines (SEARCHING..., NO DATA) are dropped, and multi-frame replies
+    keep only the data after each '0:' line prefix. Returns None if nothing
+    in the reply is hex.
+    """
+    end = len(reply)
+    while end and reply[end - 1] in WHITESPACE:
+        end -= 1
+    try:
+        return binascii.unhexlify(reply[:end])
+    except binascii.Error:
+        pass
+
+    raw = bytes(reply[:end])
+    # Multi-frame: "00C\r0:410C1AF80B64\r1:11A00E..." (the count line has no colon)
+    multi_frame = b":" in raw
+    payload = []
+    for line in raw.split(b"\r"):
+        if multi_frame:
+            if b":" not in line:
+                continue
+            line = line.split(b":", 1)[1]
+        try:
+            payload.append(binascii.unhexlify(line.translate(None, WHITESPACE)))
+        except binascii.Error:
+            pass
+    return b"".join(payload) or None
+
+
+class CompiledBatch:
+    """A Mode 01 batch request and the decoder that matches its reply.
+
+    The decoder knows every PID's echo byte and data width up front. It walks
+    the reply by PID echo, so a PID the ECU leaves out (or answers in a
+    different order) never costs the PIDs after it; unknown bytes are skipped
+    until the next echo that belongs to this batch.
+
+    A batch of one PID of another mode (a Mode 22 data identifier) matches
+    the reply mode byte and the whole identifier echo instead.
+    """
+
+    def __init__(self, data, pids):
+        self.pids = tuple(pids)
+        mode = data[self.pids[0]].get("mode") or "01"
+        self.cmd = (mode + "".join(data[pid]["pid"] for pid in self.pids) + "\r").encode('ascii')
+        self.echo = None
+        if mode != "01":
+            pid = self.pids[0]
+            self.echo = bytes([int(mode, 16) + RESPONSE_OFFSET]) + bytes.fromhex(data[pid]["pid"])
+            self.width = data[pid]["bytes"]
+            return
+        self.slots = [None] * 256
+        for pid in self.pids:
+            self.slots[int(data[pid]["pid"], 16)] = (pid, data[pid]["bytes"])
+
+    def decode(self, reply):
+        """Returns [(pid_key, raw_int), ...] for every PID found in reply."""
+        payload = reply_to_bytes(reply)
+        if not payload:
+            return []
+        if self.echo is not None:
+            return self.decode_echo(payload)
+        pos = payload.find(MODE_01_RESPONSE)
+        if pos == -1:
+            return []
+
+        slots = self.slots
+        size = len(payload)
+        remaining = len(self.pids)
+        results = []
+        pos += 1
+        while pos < size:
+            slot = slots[payload[pos]]
+            if slot is None:
+                pos += 1
+                continue
+            pid, width = slot
+            pos += 1
+            if pos + width > size:
+                break
+            if width == 1:
+                results.append((pid, payload[pos]))
+            elif width == 2:
+                results.append((pid, (payload[pos] << 8) | payload[pos + 1]))
+            else:
+                results.append((pid, int.from_bytes(payload[pos:pos + width], 'big')))
+            remaining -= 1
+            if not remaining:
+                break
+            pos += width
+        return results
+
+    def decode_echo(self, payload):
+        pos = payload.find(self.echo)
+        if pos == -1:
+            return []  # e.g. a 7F negative response
+        pos += len(self.echo)
+        if pos + self.width > len(payload):
+            return []
+        return [(self.pids[0], int.from_bytes(payload[pos:pos + self.width], 'big'))]
+
+
+class BatchCompiler:
+    """Compiles and caches a CompiledBatch per distinct PID tuple."""
+
+    def __init__(self, data):
+        self.data = data
+        self.cache = {}
+
+    def get(self, pids):
+        key = tuple(pids)
+        batch = self.cache.get(key)
+        if batch is None:
+            if len(self.cache) >= MAX_CACHED_BATCHES:
+                self.cache.clear()
+            batch = self.cache[key] = CompiledBatch(self.data, key)
+        return batch
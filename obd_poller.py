@@ -0,0 +1,219 @@
+import time
+
+from background_lane import BackgroundLane
+from batch_planner import plan_batches, describe_plan
+from elm327 import LatencyTuner, reply_text
+from metrics import metrics
+from obd_decode import BatchCompiler
+from pid_health import PidHealth, classify_reply
+from pid_scheduler import PidScheduler
+
+
+BURST_MAX_PIDS = 3
+
+
+class Burst:
+    __slots__ = ("pids", "batches", "turn", "started", "until", "requests", "samples")
+
+    def __init__(self, pids, batches, started, seconds):
+        self.pids = pids
+        self.batches = batches
+        self.turn = 0
+        self.started = started
+        self.until = started + seconds
+        self.requests = 0
+        self.samples = 0
+
+    def next_batch(self):
+        batch = self.batches[self.turn]
+        self.turn = (self.turn + 1) % len(self.batches)
+        return batch
+
+    def rate(self, now):
+        """Samples per second per burst PID so far."""
+        elapsed = now - self.started
+        return self.samples / elapsed / len(self.pids) if elapsed > 0 else 0.0
+
+
+class ElmPoller:
+    """Mode 01 (and Mode 22) polling engine for one ELM327 link.
+
+    Owns the batch plan, scheduler, compiled decoders, PID health and latency
+    tuning for that link, but never touches a socket: a driver asks it for the
+    next command, sends it, and hands the reply back. on_sample(pid, raw, ts)
+    publishes each decoded value and returns it converted.
+    """
+
+    def __init__(self, data, on_sample, name="obd"):
+        self.data = data
+        self.on_sample = on_sample
+        self.name = name
+        self.batches = BatchCompiler(data)
+        self.scheduler = PidScheduler(data)
+        self.health = PidHealth()
+        self.latency = LatencyTuner()
+        self.background = BackgroundLane()
+        self.burst = None
+        self.last_burst = None  # (pid names, requests/s) of the last finished burst
+        self.supported = None  # Hex PIDs the connected car supports; None until discovered
+        self.vin = None
+        self.planned_for = None
+        self.active = ([], [])
+        self.plan = []
+        self.pending = []
+
+    def is_supported(self, pid):
+        # Derived channels have no Mode 01 PID of their own; they go by their inputs.
+        # Mode 22 PIDs aren't in the support bitmaps; health quarantines dead ones.
+        entry = self.data[pid]
+        pid_hex = entry.get("pid")
+        return (self.supported is None or pid_hex is None or entry.get("mode", "01") != "01"
+                or pid_hex in self.supported)
+
+    def set_supported(self, supported, vin=None):
+        if (self.supported is not None and supported != self.supported) or vin != self.vin:
+            self.health.forget()  # Different car, different dead PIDs
+        self.supported = supported
+        self.vin = vin
+
+    def set_pids(self, fast, slow):
+        """Re-plans if the configured PIDs or the car's supported set changed."""
+        inputs = (list(fast), list(slow), self.supported)
+        if inputs == self.planned_for:
+            return
+        self.planned_for = inputs
+
+        fast_active = [pid for pid in fast if self.is_supported(pid)]
+        slow_active = [pid for pid in slow if self.is_supported(pid) and pid not in fast_active]
+        skipped = [pid.name for pid in list(fast) + list(slow) if not self.is_supported(pid)]
+        if skipped:
+            print(f"[*] {self.name}: Not supported by this car, skipping: {', '.join(skipped)}")
+        if (fast_active, slow_active) == self.active and self.plan:
+            return
+
+        if self.plan:
+            print(f"[*] {self.name}: Detected PID list change. Re-planning.")
+        self.active = (fast_active, slow_active)
+        pids = fast_active + slow_active
+        self.plan = plan_batches(self.data, pids)
+        print(f"[*] {self.name}: Batch Plan: {len(pids)} PIDs -> {len(self.plan)} single-frame requests")
+        print(f"    {describe_plan(self.data, self.plan)}")
+        self.scheduler.set_pids(pids, fast_active)
+        print(f"[*] {self.name}: Scheduler Targets: {self.scheduler.describe()}")
+        self.restart()
+
+    def restart(self):
+        """Every (re)connect and re-plan starts with one pass over the packed
+        plan so all PIDs get a value before the scheduler takes over."""
+        self.pending = [list(b) for b in self.plan]
+
+    def invalidate(self):
+        """Forces set_pids to re-check the plan, e.g. after a reconnect."""
+        self.planned_for = None
+
+    def start_burst(self, pids, seconds, now=None):
+        """Spends every request on up to BURST_MAX_PIDS PIDs for the next few seconds.
+
+        The PIDs are packed into as few single-frame requests as possible and
+        polled back to back; probes, background jobs and everything else wait
+        until it ends.
+        """
+        if now is None:
+            now = time.monotonic()
+        chosen = []
+        for pid in pids:
+            if pid not in chosen and self.is_supported(pid) and not self.health.is_quarantined(pid):
+                chosen.append(pid)
+        chosen = chosen[:BURST_MAX_PIDS]
+        if not chosen:
+            return False
+        self.burst = Burst(chosen, plan_batches(self.data, chosen), now, seconds)
+        print(f"[*] {self.name}: Burst on {'+'.join(pid.name for pid in chosen)} for {seconds:g}s "
+              f"({len(self.burst.batches)} request(s) per round)")
+        return True
+
+    def end_burst(self, now):
+        burst, self.burst = self.burst, None
+        rate = burst.rate(now)
+        elapsed = now - burst.started
+        names = "+".join(pid.name for pid in burst.pids)
+        self.last_burst = (names, rate)
+        metrics.set("burst_rate", round(rate, 1))
+        print(f"[*] {self.name}: Burst on {names} done: {burst.requests} requests in {elapsed:.1f}s, "
+              f"{burst.requests / elapsed:.1f} req/s, {rate:.1f} samples/s per PID")
+
+    def burst_status(self, now=None):
+        """(pid names, samples/s per PID, running) for the current or last burst, or None."""
+        burst = self.burst
+        if burst is not None:
+            return ("+".join(pid.name for pid in burst.pids), burst.rate(now or time.monotonic()), True)
+        if self.last_burst:
+            return self.last_burst + (False,)
+        return None
+
+    def next_batch(self, now=None):
+        burst = self.burst
+        if burst is not None:
+            if now is None:
+                now = time.monotonic()
+            if now < burst.until:
+                return burst.next_batch()
+            self.end_burst(now)
+        probe = self.health.next_probe(now)
+        if probe:
+            # Quarantined PIDs are re-probed alone so they can't spoil a healthy batch
+            return [probe]
+        while self.pending:
+            batch = [pid for pid in self.pending.pop(0) if not self.health.is_quarantined(pid)]
+            if batch:
+                return batch
+        return self.scheduler.next_batch(now, exclude=self.health.quarantined)
+
+    def idle(self, now=None):
+        """Seconds to wait after next_batch came back empty."""
+        return self.scheduler.idle(now, self.health.quarantined)
+
+    def next_background(self, now=None):
+        """A background job that fits the fast PIDs' slack right now, or None."""
+        if self.pending or self.burst is not None or not self.background.jobs:
+            return None
+        if now is None:
+            now = time.monotonic()
+        return self.background.next_job(self.scheduler.slack(now, self.health.quarantined), now)
+
+    def command(self, batch):
+        """The command to send for batch, with any latency-mode suffix."""
+        return self.latency.request(self.batches.get(batch).cmd)
+
+    def plain_command(self, batch):
+        return self.batches.get(batch).cmd
+
+    def handle_reply(self, batch, reply, sent_at, now=None):
+        """Decodes and publishes one reply.
+
+        Returns False if the adapter rejected the tuned request and the plain
+        command should be sent instead.
+        """
+        if now is None:
+            now = time.monotonic()
+        probing = len(batch) == 1 and self.health.is_quarantined(batch[0])
+        # reply is the reader's buffer: nothing may be sent until it is decoded below
+        if not self.latency.observe(reply, now - sent_at, probing, len(batch) == 1):
+            return False
+        metrics.observe("poll_seconds", now - sent_at)
+
+        updated = {}
+        for pid, raw in self.batches.get(batch).decode(reply):
+            val = self.on_sample(pid, raw, now)
+            if val is not None:
+                updated[pid] = val
+                self.scheduler.record(pid, val, now)
+        burst = self.burst
+        if burst is not None and batch in burst.batches:
+            burst.requests += 1
+            burst.samples += len(updated)
+        if len(updated) < len(batch) and classify_reply(reply_text(reply)) == "adapter":
+            metrics.inc("adapter_errors")
+        else:
+            self.health.record(batch, updated, now)
+        return True
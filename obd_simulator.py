@@ -10,6 +10,8 @@ from enum import Enum
 # Configuration
 HOST = '0.0.0.0'
 PORT = int(os.environ.get("OBD_PORT", 35000))
+# PIDs that stop answering, e.g. SIM_DEAD_PIDS=5C,42 to exercise quarantine
+DEAD_PIDS = [p.strip().upper() for p in os.environ.get("SIM_DEAD_PIDS", "").split(",") if p.strip()]
 
 class Scenario(Enum):
     COLD_START = 1
@@ -157,7 +159,10 @@ class VehicleState:
             self.map_pressure = 100 + ((self.throttle - 50) * 2) # Boost
         else:
             self.map_pressure = 30 + (self.throttle * 1.4) # Vacuum
-            
+
+        # Airflow: 1.6L four-stroke, half the displacement per rev, at MAP density
+        self.maf = (self.rpm / 120.0) * 1.6 * 1.2 * (self.map_pressure / 100.0)
+
         # Timing (simple map)
         self.timing = 25 - (self.load / 5)
 
@@ -172,6 +177,35 @@ def physics_loop():
         state.update()
         time.sleep(0.1)
 
+SUPPORTED_PIDS = ["04", "05", "06", "07", "0B", "0C", "0D", "0E", "0F", "10", "11", "33", "42", "44", "5C"]
+VIN = "MAT6SIM0000000001"
+
+def support_bitmap(base):
+    """Mode 01 PID 00/20/40: bit 31 is PID base+1, bit 0 means the next range exists."""
+    bits = 0
+    for pid in SUPPORTED_PIDS:
+        offset = int(pid, 16) - base
+        if 1 <= offset <= 32:
+            bits |= 1 << (32 - offset)
+    if any(int(pid, 16) > base + 32 for pid in SUPPORTED_PIDS):
+        bits |= 1
+    return f"{bits:08X}"
+
+def vin_response():
+    """Mode 09 PID 02 as a headers-off multi-frame reply."""
+    payload = "4902" + "01" + VIN.encode('ascii').hex().upper()
+    frames = [payload[:12]] + [payload[i:i + 14] for i in range(12, len(payload), 14)]
+    lines = [f"{len(payload) // 2:03X}"] + [f"{i}:{frame}" for i, frame in enumerate(frames)]
+    return "\r".join(lines)
+
+DTCS = ["P0301", "P0420"]
+
+def dtc_response():
+    """Mode 03 as a CAN reply: 43, the code count, then two bytes per code."""
+    systems = "PCBU"
+    codes = "".join(f"{systems.index(c[0]) << 6 | int(c[1]) << 4 | int(c[2], 16):02X}{c[3:]}" for c in DTCS)
+    return f"43{len(DTCS):02X}{codes}"
+
 def format_hex_byte(val):
     val = max(0, min(int(val), 255))
     return f"{val:02X}"
@@ -179,7 +213,10 @@ def format_hex_byte(val):
 def handle_pid(pid_hex):
     """Returns the hex data for a given PID"""
     
-    if pid_hex == "0C": # RPM (2 bytes, 1/4 rpm)
+    if pid_hex in ("00", "20", "40"): # Supported PID bitmaps
+        return support_bitmap(int(pid_hex, 16))
+
+    elif pid_hex == "0C": # RPM (2 bytes, 1/4 rpm)
         val = int(state.rpm * 4)
         return f"{val:04X}"
         
@@ -198,6 +235,10 @@ def handle_pid(pid_hex):
     elif pid_hex == "0B": # MAP (1 byte, kPa)
         return format_hex_byte(state.map_pressure)
         
+    elif pid_hex == "10": # MAF (2 bytes, g/s * 100)
+        val = int(state.maf * 100)
+        return f"{val:04X}"
+
     elif pid_hex == "11": # Throttle (1 byte, A*100/255)
         val = int((state.throttle * 255) / 100)
         return format_hex_byte(val)
@@ -236,6 +277,7 @@ def handle_pid(pid_hex):
 def handle_client(conn, addr):
     print(f"[*] Connected by {addr}")
     buffer = ""
+    headers = False
     try:
         while True:
             data = conn.recv(1024)
@@ -255,18 +297,45 @@ def handle_client(conn, addr):
                 
                 if cmd.startswith("AT"):
                     if cmd == "ATZ": response = "\r\nELM327 v1.5\r\nOK"
+                    elif cmd in ("ATWS", "ATI"): response = "ELM327 v1.5"
+                    elif cmd == "ATDPN": response = "A6"
+                    elif cmd == "ATRV": response = f"{state.voltage:.1f}V"
+                    elif cmd in ("ATH0", "ATH1"):
+                        headers = cmd == "ATH1"
+                        response = "OK"
                     else: response = "OK"
                 
                 elif cmd.startswith("01"):
                     pids_str = cmd[2:]
+                    # An odd trailing digit is the ELM327 response-count hint
+                    if len(pids_str) % 2: pids_str = pids_str[:-1]
                     request_pids = [pids_str[i:i+2] for i in range(0, len(pids_str), 2)]
                     
                     sim_response_payload = ""
                     for pid in request_pids:
+                        if pid in DEAD_PIDS: continue
                         sim_response_payload += pid
                         sim_response_payload += handle_pid(pid)
                         
-                    response = f"41{sim_response_payload}"
+                    response = f"41{sim_response_payload}" if sim_response_payload else "NO DATA"
+                    if headers:
+                        # Engine ECU reply ID + ISO-TP single-frame length byte
+                        response = f"7E8{len(response) // 2:02X}{response}"
+
+                elif cmd.startswith("22"):
+                    # Mode 22 DIDs F4xx mirror Mode 01 PID xx, as on UDS engine ECUs
+                    did = cmd[2:6]
+                    if did.startswith("F4") and did[2:] in SUPPORTED_PIDS and did[2:] not in DEAD_PIDS:
+                        response = f"62{did}{handle_pid(did[2:])}"
+                    else:
+                        response = "7F2231"  # requestOutOfRange
+                    if headers:
+                        response = f"7E8{len(response) // 2:02X}{response}"
+
+                elif cmd == "0902":
+                    response = vin_response()
+                elif cmd == "03":
+                    response = dtc_response()
                 else:
                     response = "?"
                     
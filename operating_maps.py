@@ -0,0 +1,222 @@
+import threading
+from array import array
+
+from derived_channels import key_name
+from elm327 import StateFile
+
+MAPS_FILE = "maps.json"
+SAVE_INTERVAL = 30.0
+MAX_GAP = 10.0  # Longer gaps between samples are not counted; slow PIDs come every few seconds
+
+
+class Axis:
+    """Fixed bins over one PID: `bins` equal steps from lo to hi.
+
+    Values outside the range land in the first or last bin, so nothing
+    is dropped and the edge bins read as "this or beyond".
+    """
+    __slots__ = ("key", "id", "name", "lo", "hi", "bins", "scale")
+
+    def __init__(self, spec, lo, hi, bins):
+        if hi <= lo or int(bins) < 1:
+            raise ValueError(f"bad range {lo}..{hi} in {bins} bins")
+        self.key = spec.key
+        self.id = spec.id
+        self.name = key_name(spec.key)
+        self.lo = float(lo)
+        self.hi = float(hi)
+        self.bins = int(bins)
+        self.scale = self.bins / (self.hi - self.lo)
+
+    def index(self, value):
+        i = int((value - self.lo) * self.scale)
+        return 0 if i < 0 else self.bins - 1 if i >= self.bins else i
+
+    def edge(self, i):
+        return self.lo + i / self.scale
+
+
+class OperatingMap:
+    """A histogram (x only) or a 2D table (x by y) of fixed-bin counters.
+
+    Without z, each cell holds the seconds spent there: every sample of x
+    adds the time since the previous one to the cell that sample was in,
+    with y read from the store at the same moment. With z, each cell holds
+    the mean of z's samples taken while x and y were in it. Either way an
+    update is one index computation and one or two array additions.
+    """
+
+    def __init__(self, store, x, y=None, z=None):
+        self.store = store
+        self.x = x
+        self.y = y
+        self.z = z
+        self.cells = x.bins * (y.bins if y else 1)
+        self.sums = array('d', [0.0]) * self.cells
+        self.counts = array('d', [0.0]) * self.cells
+        self.last_cell = None
+        self.last_at = None
+        if z:
+            self.title = f"{key_name(z.key)} by {x.name}" + (f" / {y.name}" if y else "")
+            self.watch_key = z.key
+        else:
+            self.title = f"{y.name} vs {x.name}" if y else f"{x.name} time"
+            self.watch_key = x.key
+
+    def cell(self):
+        """Index of the cell the current x (and y) values are in, or None before both are sampled."""
+        store, x, y = self.store, self.x, self.y
+        if not store.seq[x.id]:
+            return None
+        i = x.index(store.value[x.id])
+        if y is None:
+            return i
+        if not store.seq[y.id]:
+            return None
+        return y.index(store.value[y.id]) * x.bins + i
+
+    def add(self, value, timestamp):
+        if self.z:
+            c = self.cell()
+            if c is not None:
+                self.sums[c] += value
+                self.counts[c] += 1
+            return
+        c = self.last_cell
+        if c is not None:
+            dt = timestamp - self.last_at
+            if 0 < dt <= MAX_GAP:
+                self.sums[c] += dt
+                self.counts[c] += 1
+        self.last_cell = self.cell()
+        self.last_at = timestamp
+
+    def value(self, c):
+        """Seconds in the cell (or the mean of z there), None for an empty cell."""
+        if not self.counts[c]:
+            return None
+        return self.sums[c] / self.counts[c] if self.z else self.sums[c]
+
+    def clear(self):
+        for i in range(self.cells):
+            self.sums[i] = 0.0
+            self.counts[i] = 0.0
+        self.last_cell = None
+
+    def axes(self):
+        """[lo, hi, bins] of each axis, saved with the cells so a changed range isn't misread."""
+        return [[axis.lo, axis.hi, axis.bins] for axis in (self.x, self.y) if axis]
+
+    def to_dict(self):
+        return {"axes": self.axes(), "sums": self.sums.tolist(), "counts": self.counts.tolist()}
+
+    def load(self, saved):
+        if (saved.get("axes") != self.axes() or len(saved.get("sums", ())) != self.cells
+                or len(saved.get("counts", ())) != self.cells):
+            print(f"[!] Maps: Saved {self.title} has a different layout, starting over")
+            return
+        self.sums = array('d', saved["sums"])
+        self.counts = array('d', saved["counts"])
+
+
+class OperatingMaps:
+    """Live histograms and operating-point tables, kept across restarts.
+
+    settings is the "operating_maps" config:
+      {"histograms": {"PID": [lo, hi, bins], ...},
+       "tables": [{"x": ["PID", lo, hi, bins], "y": [...], "z": "PID"}, ...]}
+    where a table's z is optional. attach() makes each map a watcher of the
+    PID it counts on, so they build at the full sample rate. A background
+    thread saves them to maps.json every save_interval seconds.
+    """
+
+    def __init__(self, store, settings, path=MAPS_FILE, save_interval=SAVE_INTERVAL):
+        self.store = store
+        self.file = StateFile(path, indent=None)
+        self.save_interval = save_interval
+        self.lock = threading.Lock()
+        self.watchers = []
+        self.dirty = False
+        self.stop_event = threading.Event()
+        self.save_lock = threading.Lock()  # The saver thread and stop() share one .tmp file
+        self.saver = None
+        by_name = {key_name(spec.key): spec for spec in store.specs}
+
+        def axis(options):
+            name, lo, hi, bins = options
+            if name not in by_name:
+                raise ValueError(f"unknown PID {name}")
+            return Axis(by_name[name], lo, hi, bins)
+
+        self.maps = []
+        settings = settings or {}
+        for name, options in settings.get("histograms", {}).items():
+            try:
+                self.maps.append(OperatingMap(store, axis([name, *options])))
+            except (TypeError, ValueError) as e:
+                print(f"[!] Maps: Bad histogram {name} ({e}), skipping")
+        for options in settings.get("tables", []):
+            try:
+                z = options.get("z")
+                if z is not None and z not in by_name:
+                    raise ValueError(f"unknown PID {z}")
+                self.maps.append(OperatingMap(store, axis(options["x"]), axis(options["y"]) if "y" in options else None,
+                                              by_name[z] if z is not None else None))
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"[!] Maps: Bad table {options} ({e}), skipping")
+
+        saved = self.file.state.get("maps", {})
+        for m in self.maps:
+            if m.title in saved:
+                m.load(saved[m.title])
+
+    def attach(self):
+        for m in self.maps:
+            watcher = self.watcher(m)
+            self.watchers.append((m.watch_key, watcher))
+            self.store.watch(m.watch_key, watcher)
+
+    def detach(self):
+        for key, watcher in self.watchers:
+            self.store.unwatch(key, watcher)
+        self.watchers = []
+
+    def watcher(self, m):
+        def on_sample(value, timestamp):
+            with self.lock:
+                m.add(value, timestamp)
+                self.dirty = True
+        return on_sample
+
+    def reset(self):
+        with self.lock:
+            for m in self.maps:
+                m.clear()
+            self.dirty = True
+        print("[*] Maps: Reset")
+
+    def to_dict(self):
+        with self.lock:
+            self.dirty = False
+            return {"maps": {m.title: m.to_dict() for m in self.maps}}
+
+    def save(self):
+        with self.save_lock:
+            if self.dirty:
+                self.file.state = self.to_dict()
+                self.file.save_state()
+
+    def start(self):
+        self.saver = threading.Thread(target=self.run_saver, name="maps-saver", daemon=True)
+        self.saver.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.saver is not None:
+            self.saver.join(2)
+            self.saver = None
+        self.save()
+
+    def run_saver(self):
+        while not self.stop_event.wait(self.save_interval):
+            self.save()
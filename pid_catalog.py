@@ -0,0 +1,84 @@
+import ast
+import json
+
+from derived_channels import BASE_FUNCTIONS
+
+CATALOG_FILE = "pids.json"
+DEFAULT_MODE = "01"
+ECHO_HEX_DIGITS = {"01": 2, "22": 4}  # Mode 01 PIDs are one byte, Mode 22 data identifiers two
+BYTE_NAMES = "ABCD"  # Standard OBD formula notation: A is the first data byte
+WHOLE_NAME = "X"  # All data bytes as one big-endian integer
+# Arithmetic over the bytes and FUNCTIONS only; these would reach past that (e.g. ().__class__)
+FORBIDDEN_NODES = (ast.Attribute, ast.Subscript, ast.Lambda, ast.comprehension, ast.NamedExpr, ast.Starred)
+
+
+def signed(value, bits):
+    """Two's complement reading of a raw value, for PIDs that can go negative."""
+    return value - (1 << bits) if value >= 1 << (bits - 1) else value
+
+
+FUNCTIONS = dict(BASE_FUNCTIONS, signed=signed)
+
+
+class ByteNames(ast.NodeTransformer):
+    """Rewrites A..D in a formula into shifts and masks of X, the raw integer
+    the decoders hand over, and rejects any other unknown name."""
+
+    def __init__(self, width):
+        self.width = width
+
+    def visit_Name(self, node):
+        if node.id in BYTE_NAMES:
+            i = BYTE_NAMES.index(node.id)
+            if i >= self.width:
+                raise ValueError(f"{node.id} is past the PID's {self.width} byte(s)")
+            shift = 8 * (self.width - 1 - i)
+            whole = ast.Name(WHOLE_NAME, ast.Load())
+            if shift:
+                whole = ast.BinOp(whole, ast.RShift(), ast.Constant(shift))
+            if i:
+                whole = ast.BinOp(whole, ast.BitAnd(), ast.Constant(0xFF))
+            return ast.copy_location(whole, node)
+        if node.id != WHOLE_NAME and node.id not in FUNCTIONS:
+            raise ValueError(f"unknown name {node.id}")
+        return node
+
+
+def compile_formula(formula, width, name=WHOLE_NAME):
+    """Compiles a formula over A..D (data bytes) or X (all of them) into a
+    one-argument callable taking the raw integer; done once, at load."""
+    for node in ast.walk(ast.parse(formula, mode="eval")):
+        if isinstance(node, FORBIDDEN_NODES):
+            raise ValueError(f"{type(node).__name__} not allowed in a formula")
+    tree = ast.parse(f"lambda {WHOLE_NAME}: {formula}", mode="eval")
+    tree = ast.fix_missing_locations(ByteNames(width).visit(tree))
+    return eval(compile(tree, f"<{name}>", "eval"), {"__builtins__": {}, **FUNCTIONS})
+
+
+def load_catalog(path=CATALOG_FILE):
+    """{name: entry} from the catalog file, in file order.
+
+    Each polled entry gets its "formula" compiled into "convert" and its
+    "mode" filled in ("01" unless given); entries with an "expr" are derived
+    channels and pass through. A bad entry is skipped with a warning so one
+    typo in a car-specific PID doesn't take the rest down.
+    """
+    with open(path, encoding="utf-8") as f:
+        pids = json.load(f)["pids"]
+    catalog = {}
+    for name, entry in pids.items():
+        entry = dict(entry)
+        if "expr" not in entry:
+            try:
+                mode = entry["mode"] = str(entry.get("mode", DEFAULT_MODE)).upper()
+                pid = entry["pid"] = entry["pid"].upper()
+                if mode not in ECHO_HEX_DIGITS or len(pid) != ECHO_HEX_DIGITS[mode]:
+                    raise ValueError(f"mode {mode} PID {pid} is not supported")
+                int(pid, 16)
+                entry["convert"] = compile_formula(entry["formula"], int(entry["bytes"]), name)
+            except (KeyError, TypeError, SyntaxError, ValueError) as e:
+                print(f"[!] PID catalog: Bad entry {name} ({e}), skipping")
+                continue
+        catalog[name] = entry
+    print(f"[*] PID catalog: {len(catalog)} PIDs from {path}")
+    return catalog
@@ -0,0 +1,114 @@
+import threading
+import time
+
+from metrics import metrics
+
+# Consecutive unanswered polls before a PID is pulled out of the batches
+QUARANTINE_AFTER = 5
+PROBE_BACKOFF_START = 2.0
+PROBE_BACKOFF_MAX = 120.0
+
+# Adapter-level errors say nothing about the PIDs in the request
+ADAPTER_ERRORS = ("STOPPED", "CAN ERROR", "BUS ERROR", "BUS BUSY", "BUFFER FULL", "DATA ERROR", "FB ERROR")
+
+
+def classify_reply(text):
+    """Returns 'adapter' for adapter/bus errors, 'no_data' for NO DATA or '?', else None."""
+    if any(err in text for err in ADAPTER_ERRORS):
+        return "adapter"
+    if "NO DATA" in text or text.strip() == "?":
+        return "no_data"
+    return None
+
+
+class Quarantine:
+    __slots__ = ("next_probe", "backoff")
+
+    def __init__(self, now):
+        self.backoff = PROBE_BACKOFF_START
+        self.next_probe = now + self.backoff
+
+
+class PidHealth:
+    """Per-PID failure counters and a quarantine with exponential-backoff probes.
+
+    A PID that goes unanswered QUARANTINE_AFTER polls in a row is dropped from
+    the batches so it stops stretching replies for healthy PIDs. It is then
+    re-probed alone, with the wait doubling after every failed probe, and
+    rejoins the schedule on its first good answer.
+
+    A reply that answers nothing is the ECU or bus going quiet (ignition
+    off, cranking) more often than every PID in it dying at once, so it only
+    counts when the reply before it answered something; while the ECU stays
+    silent nothing is counted and nothing is pushed further into backoff.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.failures = {}
+        self.quarantined = {}
+        self.ecu_answering = False
+
+    def record(self, requested, answered, now=None):
+        """Updates counters after one request; answered is the set of PIDs decoded."""
+        if now is None:
+            now = time.monotonic()
+        changed = False
+        with self.lock:
+            answering, self.ecu_answering = self.ecu_answering, bool(answered)
+            if not answered and not answering:
+                metrics.inc("silent_replies")
+                return
+            for pid in requested:
+                if pid in answered:
+                    if self.failures.get(pid):
+                        self.failures[pid] = 0
+                    if self.quarantined.pop(pid, None) is not None:
+                        print(f"[*] PID Health: {pid.name} answering again. Released from quarantine.")
+                        metrics.inc("quarantine_releases")
+                        changed = True
+                    continue
+
+                metrics.inc("pid_failures")
+                count = self.failures.get(pid, 0) + 1
+                self.failures[pid] = count
+                q = self.quarantined.get(pid)
+                if q is not None:
+                    q.backoff = min(q.backoff * 2, PROBE_BACKOFF_MAX)
+                    q.next_probe = now + q.backoff
+                elif count >= QUARANTINE_AFTER:
+                    self.quarantined[pid] = Quarantine(now)
+                    print(f"[!] PID Health: {pid.name} failed {count} polls in a row. Quarantined.")
+                    metrics.inc("quarantines")
+                    changed = True
+            if changed:
+                metrics.set("quarantined", sorted(pid.name for pid in self.quarantined))
+
+    def is_quarantined(self, pid):
+        return pid in self.quarantined
+
+    def quarantined_pids(self):
+        with self.lock:
+            return frozenset(self.quarantined)
+
+    def next_probe(self, now=None):
+        """Returns one quarantined PID whose probe is due, or None."""
+        if not self.quarantined:
+            return None
+        if now is None:
+            now = time.monotonic()
+        with self.lock:
+            for pid, q in self.quarantined.items():
+                if now >= q.next_probe:
+                    # Pushed back until the probe's answer comes in via record().
+                    q.next_probe = now + q.backoff
+                    return pid
+        return None
+
+    def forget(self):
+        """Clears everything, e.g. when a different car is connected."""
+        with self.lock:
+            self.failures.clear()
+            self.quarantined.clear()
+            self.ecu_answering = False
+        metrics.set("quarantined", [])
@@ -0,0 +1,132 @@
+from array import array
+from math import ceil
+
+HISTORY_SECONDS = 30
+# Room for samples arriving faster than max_age asks for (batching, bursts).
+# Past that the buffer still works, it just covers less than HISTORY_SECONDS.
+RATE_HEADROOM = 2
+MIN_CAPACITY = 16
+MAX_CAPACITY = 8192
+
+
+def history_capacity(max_age, seconds=HISTORY_SECONDS):
+    """Slots needed to hold `seconds` of a PID polled every max_age seconds."""
+    wanted = ceil(seconds / max(max_age or 1.0, 0.001) * RATE_HEADROOM)
+    return max(MIN_CAPACITY, min(wanted, MAX_CAPACITY))
+
+
+class RingBuffer:
+    """The last `capacity` (timestamp, value) samples of one PID.
+
+    Both columns are preallocated array('d'); append overwrites the oldest
+    sample once full, and the window queries walk back from the newest
+    sample without building lists. A window is the samples no older than
+    `seconds` before `now`, which defaults to the newest timestamp so the
+    same queries work on replayed data.
+    """
+    __slots__ = ("capacity", "times", "values", "head", "size")
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.times = array('d', [0.0]) * capacity
+        self.values = array('d', [0.0]) * capacity
+        self.head = 0  # Next slot to write
+        self.size = 0
+
+    def append(self, timestamp, value):
+        head = self.head
+        self.times[head] = timestamp
+        self.values[head] = value
+        self.head = head + 1 if head + 1 < self.capacity else 0
+        if self.size < self.capacity:
+            self.size += 1
+
+    def clear(self):
+        self.head = 0
+        self.size = 0
+
+    def latest(self):
+        """(timestamp, value) of the newest sample, or None."""
+        if not self.size:
+            return None
+        i = self.head - 1 if self.head else self.capacity - 1
+        return self.times[i], self.values[i]
+
+    def count(self, seconds, now=None):
+        """Number of newest samples inside the window."""
+        size = self.size
+        if not size:
+            return 0
+        times = self.times
+        i = self.head - 1 if self.head else self.capacity - 1
+        start = (times[i] if now is None else now) - seconds
+        n = 0
+        while n < size and times[i] >= start:
+            n += 1
+            i = i - 1 if i else self.capacity - 1
+        return n
+
+    def samples(self, seconds, now=None):
+        """Yields the window's (timestamp, value) pairs, oldest first."""
+        n = self.count(seconds, now)
+        i = (self.head - n) % self.capacity
+        for _ in range(n):
+            yield self.times[i], self.values[i]
+            i = i + 1 if i + 1 < self.capacity else 0
+
+    def min(self, seconds, now=None):
+        n = self.count(seconds, now)
+        if not n:
+            return None
+        values, i = self.values, (self.head - n) % self.capacity
+        low = values[i]
+        for _ in range(n - 1):
+            i = i + 1 if i + 1 < self.capacity else 0
+            if values[i] < low:
+                low = values[i]
+        return low
+
+    def max(self, seconds, now=None):
+        n = self.count(seconds, now)
+        if not n:
+            return None
+        values, i = self.values, (self.head - n) % self.capacity
+        high = values[i]
+        for _ in range(n - 1):
+            i = i + 1 if i + 1 < self.capacity else 0
+            if values[i] > high:
+                high = values[i]
+        return high
+
+    def mean(self, seconds, now=None):
+        n = self.count(seconds, now)
+        if not n:
+            return None
+        values, i = self.values, (self.head - n) % self.capacity
+        total = 0.0
+        for _ in range(n):
+            total += values[i]
+            i = i + 1 if i + 1 < self.capacity else 0
+        return total / n
+
+    def slope(self, seconds, now=None):
+        """Least-squares change per second over the window; 0.0 if it can't tell."""
+        n = self.count(seconds, now)
+        if n < 2:
+            return 0.0
+        times, values = self.times, self.values
+        i = (self.head - n) % self.capacity
+        origin = times[i]  # Keeps the sums small for monotonic clock values
+        st = sv = stt = stv = 0.0
+        for _ in range(n):
+            t = times[i] - origin
+            v = values[i]
+            st += t
+            sv += v
+            stt += t * t
+            stv += t * v
+            i = i + 1 if i + 1 < self.capacity else 0
+        spread = n * stt - st * st
+        if spread <= 0.0:
+            return 0.0
+        return (n * stv - st * sv) / spread
@@ -0,0 +1,129 @@
+import time
+
+from batch_planner import fits
+
+# PIDs listed under "fast_pids" never get a staleness budget looser than this.
+FAST_PID_MAX_AGE = 0.05
+DEFAULT_MAX_AGE = 1.0
+
+# How strongly a changing value tightens its staleness budget.
+# Volatility is measured in dial spans per second, so a needle sweeping the
+# whole dial in one second polls (1 + VOLATILITY_GAIN) times as often.
+VOLATILITY_GAIN = 4.0
+VOLATILITY_SMOOTHING = 0.3
+
+# A request goes out once some PID is this far into its budget, and every
+# other PID that far along rides in the same frame; before that the lane idles.
+FILL_THRESHOLD = 0.5
+IDLE_MAX = 0.1  # Longest idle wait, so PID list changes are still picked up
+
+
+class PidState:
+    __slots__ = ("max_age", "last_sample", "last_value", "volatility")
+
+    def __init__(self, max_age):
+        self.max_age = max_age
+        self.last_sample = None
+        self.last_value = None
+        self.volatility = 0.0
+
+
+class PidScheduler:
+    """Builds each Mode 01 round from the most overdue PIDs.
+
+    Every PID in DATA declares a "max_age" (seconds of staleness it tolerates).
+    A PID's priority is its age over that budget, with the budget shrunk by how
+    fast the value has recently been moving across its dial.
+    """
+
+    def __init__(self, data, pids=(), fast_pids=()):
+        self.data = data
+        self.states = {}
+        self.pids = []
+        self.fast = []
+        self.set_pids(pids, fast_pids)
+
+    def set_pids(self, pids, fast_pids=()):
+        """Replaces the polled PID set, keeping history for PIDs that stay."""
+        fast = set(fast_pids)
+        self.pids = list(dict.fromkeys(pids))
+        self.fast = [pid for pid in self.pids if pid in fast]
+        states = {}
+        for pid in self.pids:
+            max_age = self.data[pid].get("max_age", DEFAULT_MAX_AGE)
+            if pid in fast:
+                max_age = min(max_age, FAST_PID_MAX_AGE)
+            state = self.states.get(pid) or PidState(max_age)
+            state.max_age = max_age
+            states[pid] = state
+        self.states = states
+
+    def priority(self, pid, now):
+        state = self.states[pid]
+        if state.last_sample is None:
+            return float("inf")
+        budget = state.max_age / (1.0 + VOLATILITY_GAIN * state.volatility)
+        return (now - state.last_sample) / budget
+
+    def next_batch(self, now=None, exclude=()):
+        """Returns the PIDs for the next request, most overdue first, or an
+        empty list while no PID is FILL_THRESHOLD into its budget."""
+        if now is None:
+            now = time.monotonic()
+        pids = [pid for pid in self.pids if pid not in exclude] if exclude else self.pids
+        ranked = sorted(pids, key=lambda pid: self.priority(pid, now), reverse=True)
+
+        batch = []
+        for pid in ranked:
+            if self.priority(pid, now) < FILL_THRESHOLD:
+                break
+            if not batch or fits(self.data, batch, pid):
+                batch.append(pid)
+        return batch
+
+    def idle(self, now=None, exclude=()):
+        """Seconds until next_batch has something to send, at most IDLE_MAX."""
+        if now is None:
+            now = time.monotonic()
+        wait = IDLE_MAX
+        for pid in self.pids:
+            if pid in exclude:
+                continue
+            state = self.states[pid]
+            if state.last_sample is None:
+                return 0.0
+            budget = state.max_age / (1.0 + VOLATILITY_GAIN * state.volatility)
+            wait = min(wait, state.last_sample + FILL_THRESHOLD * budget - now)
+        return max(wait, 0.0)
+
+    def slack(self, now=None, exclude=()):
+        """Seconds until the first fast PID goes over its budget; inf without fast PIDs."""
+        if now is None:
+            now = time.monotonic()
+        slack = float("inf")
+        for pid in self.fast:
+            if pid in exclude:
+                continue
+            state = self.states[pid]
+            if state.last_sample is None:
+                return float("-inf")
+            slack = min(slack, state.last_sample + state.max_age - now)
+        return slack
+
+    def record(self, pid, value, now=None):
+        """Feeds a decoded value back so the PID's age and volatility update."""
+        state = self.states.get(pid)
+        if state is None:
+            return
+        if now is None:
+            now = time.monotonic()
+        if state.last_sample is not None and now > state.last_sample:
+            entry = self.data[pid]
+            span = abs(entry["dial_max"] - entry["dial_min"]) or 1.0
+            rate = abs(value - state.last_value) / (now - state.last_sample) / span
+            state.volatility += VOLATILITY_SMOOTHING * (rate - state.volatility)
+        state.last_sample = now
+        state.last_value = value
+
+    def describe(self):
+        return ", ".join(f"{pid.name}<={self.states[pid].max_age:g}s" for pid in self.pids)
@@ -0,0 +1,201 @@
+import asyncio
+import multiprocessing
+import os
+import queue
+import time
+
+from config_manager import config_manager
+from shared_telemetry import (TelemetryBlock, FLAG_QUARANTINED, FLAG_UNSUPPORTED,
+                              BURST_RUNNING, BURST_DONE)
+
+STATUS_INTERVAL = 0.1  # Child: flags, burst status and UI commands
+CONFIG_CHECK_INTERVAL = 1.0  # Child: the UI saves PID list changes to config.json
+ALIVE_CHECK_INTERVAL = 1.0
+
+
+class PollerProcess:
+    """Runs a TransportHub in its own process, optionally pinned to one core.
+
+    The child publishes every sample into a TelemetryBlock and the UI process
+    only reads that block, so a long Kivy frame never delays a recv and a
+    burst of decoding never delays a frame. The child is forked so the hub
+    and DATA (with its converter lambdas) come across as they are.
+
+    Answers the same queries as TransportHub (quarantined_pids, is_supported,
+    burst, burst_status, submit); call sync() from the UI loop to pull in new
+    values through on_value(pid, value, min, max, ts) and deliver results,
+    including anything the child send()s to a name the UI listen()s on.
+    child_setup, if given, runs first thing in the child, e.g. to turn off
+    work that belongs to the UI process.
+    """
+
+    def __init__(self, hub, data, on_value, core=None, child_setup=None):
+        self.hub = hub
+        self.data = data
+        self.on_value = on_value
+        self.core = core
+        self.child_setup = child_setup
+        self.pids = list(data)
+        self.slots = {pid: slot for slot, pid in enumerate(self.pids)}
+        self.block = TelemetryBlock.create(len(self.pids))
+        self.context = multiprocessing.get_context("fork")
+        self.commands = self.context.Queue()
+        self.results = self.context.Queue()
+        self.process = None
+        # UI side
+        self.seen = [0] * len(self.pids)
+        self.delivered = [0.0] * len(self.pids)  # ts of the last sample handed to on_value, per slot
+        self.flags = [0] * len(self.pids)
+        self.callbacks = {}
+        self.listeners = {}
+        self.last_burst = None
+        self.checked_at = 0.0
+
+    def start(self):
+        self.process = self.context.Process(target=self.child_main, name="obd-poller", daemon=True)
+        self.process.start()
+        pinned = f", pinned to core {self.core}" if self.core is not None else ""
+        print(f"[*] Poller Process: Started pid {self.process.pid}{pinned}")
+
+    def stop(self):
+        if self.process and self.process.is_alive():
+            self.process.terminate()
+            self.process.join(2)
+        self.block.close(unlink=True)
+
+    # --- Child process ---
+
+    def child_main(self):
+        if self.child_setup:
+            self.child_setup()
+        if self.core is not None and hasattr(os, "sched_setaffinity"):
+            try:
+                os.sched_setaffinity(0, {int(self.core)})
+            except (OSError, ValueError) as e:
+                print(f"[!] Poller Process: Could not pin to core {self.core}: {e}")
+        self.published = 0
+        self.lows = [float("inf")] * len(self.pids)
+        self.highs = [float("-inf")] * len(self.pids)
+        self.hub.sink = self.write_sample
+        asyncio.run(self.child_run())
+
+    async def child_run(self):
+        await asyncio.gather(self.hub.run(), self.child_status())
+
+    def write_sample(self, pid, value, ts):
+        slot = self.slots[pid]
+        if value < self.lows[slot]:
+            self.lows[slot] = value
+        if value > self.highs[slot]:
+            self.highs[slot] = value
+        self.block.write(slot, value, self.lows[slot], self.highs[slot], ts)
+        self.published += 1
+
+    async def child_status(self):
+        checked_at = 0.0
+        while True:
+            self.child_commands()
+            now = time.monotonic()
+            if now - checked_at >= CONFIG_CHECK_INTERVAL:
+                checked_at = now
+                config_manager.check_for_changes()
+            quarantined = self.hub.quarantined_pids()
+            for pid, slot in self.slots.items():
+                flags = FLAG_QUARANTINED if pid in quarantined else 0
+                if not self.hub.is_supported(pid):
+                    flags |= FLAG_UNSUPPORTED
+                self.block.set_flags(slot, flags)
+            status = self.hub.burst_status()
+            if status:
+                names, rate, running = status
+                self.block.write_header(self.published, rate, BURST_RUNNING if running else BURST_DONE, names)
+            else:
+                self.block.write_header(self.published)
+            await asyncio.sleep(STATUS_INTERVAL)
+
+    def child_commands(self):
+        while True:
+            try:
+                command, args = self.commands.get_nowait()
+            except queue.Empty:
+                return
+            if command == "burst":
+                self.hub.burst(*args)
+            elif command == "submit":
+                name, cmd, decode = args
+                self.hub.submit(name, self.send, cmd, decode)
+
+    def send(self, name, value):
+        """Child: queues value for the UI process, delivered by the next sync()."""
+        self.results.put((name, value))
+
+    # --- UI process ---
+
+    def sync(self):
+        """Pulls changed slots and finished background results into the UI process.
+
+        Returns how many PIDs got a new value.
+        """
+        block = self.block
+        changed = 0
+        for slot, pid in enumerate(self.pids):
+            if block.seq(slot) == self.seen[slot]:
+                continue
+            record = block.read(slot)
+            if record is None:
+                continue
+            seq, value, lo, hi, ts, flags = record
+            self.seen[slot] = seq
+            self.flags[slot] = flags
+            # set_flags bumps seq too; only a new ts is a new sample
+            if ts and ts != self.delivered[slot]:
+                self.delivered[slot] = ts
+                self.on_value(pid, value, lo, hi, ts)
+                changed += 1
+
+        header = block.read_header()
+        if header:
+            _, _, rate, state, names, _ = header
+            self.last_burst = (names, rate, state == BURST_RUNNING) if state else None
+
+        while True:
+            try:
+                name, value = self.results.get_nowait()
+            except queue.Empty:
+                break
+            for callback in self.callbacks.pop(name, []) + self.listeners.get(name, []):
+                callback(name, value)
+
+        now = time.monotonic()
+        if now - self.checked_at >= ALIVE_CHECK_INTERVAL:
+            self.checked_at = now
+            if self.process and not self.process.is_alive():
+                print(f"[!] Poller Process: Exited with code {self.process.exitcode}. Restarting...")
+                self.start()
+        return changed
+
+    def samples(self):
+        header = self.block.read_header()
+        return header[1] if header else 0
+
+    def quarantined_pids(self):
+        return frozenset(pid for pid, flags in zip(self.pids, self.flags) if flags & FLAG_QUARANTINED)
+
+    def is_supported(self, pid):
+        return not self.flags[self.slots[pid]] & FLAG_UNSUPPORTED
+
+    def burst(self, pids, seconds):
+        self.commands.put(("burst", (list(pids), seconds)))
+        return True
+
+    def burst_status(self):
+        return self.last_burst
+
+    def listen(self, name, callback):
+        """Calls callback(name, value) for everything the child sends under name."""
+        self.listeners.setdefault(name, []).append(callback)
+
+    def submit(self, name, callback, cmd=None, decode=None):
+        self.callbacks.setdefault(name, []).append(callback)
+        self.commands.put(("submit", (name, cmd, decode)))
+        return True
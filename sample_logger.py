@@ -0,0 +1,242 @@
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+
+from derived_channels import key_name
+from metrics import metrics
+
+LOG_DIR = "logs"
+SEGMENT_SAMPLES = 1 << 18  # ~6.5 MB per segment
+ROTATE_SECONDS = 600.0
+FSYNC_SECONDS = 5.0
+BUFFER_SAMPLES = 1 << 15
+DRAIN_INTERVAL = 0.2
+RETRY_SECONDS = 5.0  # Wait after a failed write (disk full, card pulled) before trying again
+
+MAGIC = b"DASHLOG1"
+# magic, capacity, count, clock offset (wall clock - monotonic), opened at (monotonic); padded to HEADER_SIZE
+HEADER = struct.Struct("<8sQQdd")
+HEADER_SIZE = 64
+COUNT_OFFSET = 16
+COUNT = struct.Struct("<Q")
+# After the header, one column per field, each `capacity` long: (name, array code, NumPy type)
+COLUMNS = (("timestamp", "d", "<f8"), ("value", "d", "<f8"), ("raw", "Q", "<u8"), ("pid", "H", "<u2"))
+
+
+def segment_dtype(capacity):
+    """A whole segment as one NumPy record, so a segment reads with
+
+        seg = np.memmap(path, dtype=np.dtype(segment_dtype(capacity)), mode="r")[0]
+        n = seg["count"]; seg["timestamp"][:n], seg["pid"][:n], seg["value"][:n]
+
+    The .json next to each segment has capacity, the PID names the pid ids
+    index, and this list as "dtype" (np.dtype([tuple(f) for f in dtype])).
+    """
+    return ([("magic", "S8"), ("capacity", "<u8"), ("count", "<u8"), ("clock_offset", "<f8"), ("opened", "<f8"),
+             ("pad", f"V{HEADER_SIZE - HEADER.size}")]
+            + [(name, numpy_type, capacity) for name, _, numpy_type in COLUMNS])
+
+
+class SampleRing:
+    """Bounded handoff from the poll thread to the writer thread.
+
+    One producer and one consumer, so no lock: the producer only moves
+    head and the consumer only moves tail, and each fills its slots before
+    moving. A full ring drops the new sample and counts it instead of
+    waiting.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.columns = [array(code, [0]) * capacity for _, code, _ in COLUMNS]
+        self.timestamp, self.value, self.raw, self.pid = self.columns
+        self.head = 0
+        self.tail = 0
+        self.dropped = 0
+
+    def append(self, pid, raw, value, timestamp):
+        head = self.head
+        if head - self.tail >= self.capacity:
+            self.dropped += 1
+            return False
+        i = head % self.capacity
+        self.timestamp[i] = timestamp
+        self.value[i] = value
+        self.raw[i] = raw
+        self.pid[i] = pid
+        self.head = head + 1
+        return True
+
+
+class Segment:
+    """One preallocated segment file, memory-mapped, filled column by column."""
+
+    def __init__(self, path, capacity, clock_offset, opened):
+        self.path = path
+        self.capacity = capacity
+        self.count = 0
+        self.opened = opened
+        size = HEADER_SIZE + capacity * sum(array(code).itemsize for _, code, _ in COLUMNS)
+        self.file = open(path, "w+b")
+        try:
+            self.file.truncate(size)
+            self.map = mmap.mmap(self.file.fileno(), size)
+        except OSError:
+            self.file.close()
+            raise
+        HEADER.pack_into(self.map, 0, MAGIC, capacity, 0, clock_offset, opened)
+        self.columns = []
+        offset = HEADER_SIZE
+        view = memoryview(self.map)
+        for _, code, _ in COLUMNS:
+            width = capacity * array(code).itemsize
+            self.columns.append(view[offset:offset + width].cast(code))
+            offset += width
+        view.release()
+
+    def write(self, ring, start, n):
+        """Copies ring slots start..start+n into the next n rows."""
+        count = self.count
+        for column, source in zip(self.columns, ring.columns):
+            column[count:count + n] = source[start:start + n]
+        self.count = count + n
+
+    def commit(self):
+        """Publishes the row count, written after the rows so a reader never sees unwritten ones."""
+        COUNT.pack_into(self.map, COUNT_OFFSET, self.count)
+
+    def flush(self):
+        self.map.flush()
+
+    def close(self):
+        self.commit()
+        self.flush()
+        for column in self.columns:
+            column.release()
+        self.map.close()
+        self.file.close()
+
+
+class SampleLogger:
+    """Binary log of every decoded sample: (timestamp, pid id, raw, value),
+    and of every derived channel value once attach()ed to the store.
+
+    append() is called on the poll thread and only copies four numbers into
+    a SampleRing. A writer thread drains it every DRAIN_INTERVAL into
+    fixed-size, memory-mapped columnar segments in `directory`, starting a
+    new one when a segment is full or rotate_seconds old, and msyncs every
+    fsync_seconds. Timestamps are monotonic; add the header's clock_offset
+    for wall-clock time. See segment_dtype() for reading them back.
+    """
+
+    def __init__(self, keys, directory=LOG_DIR, segment_samples=SEGMENT_SAMPLES, rotate_seconds=ROTATE_SECONDS,
+                 fsync_seconds=FSYNC_SECONDS, buffer_samples=BUFFER_SAMPLES):
+        self.ids = {key: i for i, key in enumerate(keys)}
+        self.names = [key_name(key) for key in keys]
+        self.directory = directory
+        self.segment_samples = int(segment_samples)
+        self.rotate_seconds = rotate_seconds
+        self.fsync_seconds = fsync_seconds
+        self.ring = SampleRing(int(buffer_samples))
+        self.segment = None
+        self.segments = 0
+        self.written = 0
+        self.reported_drops = 0
+        self.last_fsync = 0.0
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    def append(self, key, raw, value, timestamp):
+        self.ring.append(self.ids[key], raw, value, timestamp)
+
+    def attach(self, store):
+        """Logs the store's derived channels too, with raw 0, as they are recomputed.
+
+        The store must recompute them on the thread that calls append(),
+        the ring's one producer.
+        """
+        for spec in store.specs:
+            if spec.expr and spec.key in self.ids:
+                store.watch(spec.key, self.watcher(spec.key))
+
+    def watcher(self, key):
+        def on_sample(value, timestamp):
+            self.append(key, 0, value, timestamp)
+        return on_sample
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.thread = threading.Thread(target=self.run, name="sample-logger", daemon=True)
+        self.thread.start()
+        print(f"[*] Logger: Writing samples to {self.directory}/")
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.stop_event.set()
+        self.thread.join(2)
+        thread, self.thread = self.thread, None
+        if thread.is_alive():
+            # Still writing; the ring has one consumer, so leave the rest to it
+            print("[!] Logger: Writer still busy, not waiting for it")
+            return
+        try:
+            self.drain()
+        except OSError as e:
+            print(f"[!] Logger: Write failed: {e}")
+        if self.segment:
+            self.segment.close()
+            self.segment = None
+
+    def run(self):
+        while not self.stop_event.wait(DRAIN_INTERVAL):
+            try:
+                self.drain()
+            except OSError as e:
+                print(f"[!] Logger: Write failed: {e}")
+                self.stop_event.wait(RETRY_SECONDS)
+
+    def rotate(self, now):
+        if self.segment:
+            segment, self.segment = self.segment, None
+            segment.close()
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(self.directory, f"{stamp}-{self.segments:04d}.seg")
+        clock_offset = time.time() - time.monotonic()
+        self.segment = Segment(path, self.segment_samples, clock_offset, now)
+        self.segments += 1
+        with open(path + ".json", "w") as f:
+            json.dump({"capacity": self.segment_samples, "clock_offset": clock_offset, "pids": self.names,
+                       "dtype": segment_dtype(self.segment_samples)}, f)
+        self.last_fsync = now
+
+    def drain(self):
+        ring = self.ring
+        head = ring.head
+        if ring.tail == head:
+            return
+        now = time.monotonic()
+        capacity = ring.capacity
+        while ring.tail != head:
+            segment = self.segment
+            if segment is None or segment.count >= segment.capacity or now - segment.opened >= self.rotate_seconds:
+                self.rotate(now)
+                segment = self.segment
+            start = ring.tail % capacity
+            n = min(head - ring.tail, capacity - start, segment.capacity - segment.count)
+            segment.write(ring, start, n)
+            ring.tail += n
+            self.written += n
+        self.segment.commit()
+        if now - self.last_fsync >= self.fsync_seconds:
+            self.segment.flush()
+            self.last_fsync = now
+        metrics.set("log_samples", self.written)
+        if ring.dropped != self.reported_drops:
+            print(f"[!] Logger: Buffer full, dropped {ring.dropped - self.reported_drops} samples")
+            self.reported_drops = ring.dropped
+            metrics.set("log_dropped", ring.dropped)
@@ -0,0 +1,98 @@
+import struct
+import time
+from multiprocessing import shared_memory
+
+# Header: seq, samples published, burst rate, burst state, burst PID names, heartbeat
+HEADER = struct.Struct("<QQdQ64sd")
+# One slot per PID: seq, value, min, max, timestamp, flags
+SLOT = struct.Struct("<QddddQ")
+SEQ = struct.Struct("<Q")
+
+FLAG_QUARANTINED = 1
+FLAG_UNSUPPORTED = 2
+
+BURST_NONE = 0
+BURST_RUNNING = 1
+BURST_DONE = 2
+
+READ_RETRIES = 100
+
+
+class TelemetryBlock:
+    """Latest PID values in a shared memory block, one writer and any readers.
+
+    Every slot (and the header) is guarded by its own sequence number,
+    seqlock style: the writer makes it odd, writes the record, then makes it
+    even again. A reader copies the record and only keeps it if the sequence
+    number was even and unchanged around the copy, so it never blocks the
+    writer and never sees a half-written value.
+    """
+
+    def __init__(self, shm, slots):
+        self.shm = shm
+        self.buf = shm.buf
+        self.slots = slots
+        self.seqs = [0] * (slots + 1)  # Writer's copy: header, then every slot
+        self.records = [[0.0, 0.0, 0.0, 0.0, 0] for _ in range(slots)]  # Writer's last value/min/max/ts/flags
+
+    @classmethod
+    def create(cls, slots):
+        shm = shared_memory.SharedMemory(create=True, size=HEADER.size + slots * SLOT.size)
+        shm.buf[:] = bytes(shm.size)
+        return cls(shm, slots)
+
+    def offset(self, slot):
+        return HEADER.size + slot * SLOT.size
+
+    def _write(self, index, offset, record, *values):
+        seq = self.seqs[index] + 1
+        SEQ.pack_into(self.buf, offset, seq)  # Odd: write in progress
+        record.pack_into(self.buf, offset, seq, *values)
+        self.seqs[index] = seq + 1
+        SEQ.pack_into(self.buf, offset, seq + 1)
+
+    def _read(self, offset, record):
+        for _ in range(READ_RETRIES):
+            before = SEQ.unpack_from(self.buf, offset)[0]
+            if before & 1:
+                continue
+            values = record.unpack_from(self.buf, offset)
+            if SEQ.unpack_from(self.buf, offset)[0] == before:
+                return values
+        return None
+
+    def write(self, slot, value, lo, hi, timestamp):
+        record = self.records[slot]
+        record[:4] = value, lo, hi, timestamp
+        self._write(slot + 1, self.offset(slot), SLOT, *record)
+
+    def set_flags(self, slot, flags):
+        record = self.records[slot]
+        if record[4] != flags:
+            record[4] = flags
+            self._write(slot + 1, self.offset(slot), SLOT, *record)
+
+    def write_header(self, samples, burst_rate=0.0, burst_state=BURST_NONE, burst_names=""):
+        self._write(0, 0, HEADER, samples, burst_rate, burst_state,
+                    burst_names.encode('ascii')[:64], time.monotonic())
+
+    def seq(self, slot):
+        """Cheap change check: the slot's sequence number without copying the record."""
+        return SEQ.unpack_from(self.buf, self.offset(slot))[0]
+
+    def read(self, slot):
+        """(seq, value, min, max, timestamp, flags), or None if it kept changing under us."""
+        return self._read(self.offset(slot), SLOT)
+
+    def read_header(self):
+        """(seq, samples, burst rate, burst state, burst names, heartbeat), or None."""
+        header = self._read(0, HEADER)
+        if header is None:
+            return None
+        return header[:4] + (header[4].rstrip(b"\0").decode('ascii'), header[5])
+
+    def close(self, unlink=False):
+        self.buf = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
@@ -0,0 +1,115 @@
+from math import exp
+
+MEDIAN_TAPS = (3, 5)
+
+
+class Median:
+    """Median of the last 3 or 5 samples; drops single-sample spikes."""
+    __slots__ = ("window", "next", "filled")
+
+    def __init__(self, taps):
+        if taps not in MEDIAN_TAPS:
+            raise ValueError(f"median needs 3 or 5 taps, not {taps}")
+        self.window = [0.0] * taps
+        self.next = 0
+        self.filled = 0
+
+    def step(self, value, timestamp):
+        window = self.window
+        window[self.next] = value
+        self.next = (self.next + 1) % len(window)
+        if self.filled < len(window):
+            self.filled += 1
+            if self.filled < len(window):
+                return value  # Not enough samples yet
+        return sorted(window)[len(window) // 2]
+
+
+class Ema:
+    """Exponential moving average with a time constant in seconds.
+
+    The weight of each sample comes from the time since the previous one,
+    so irregular poll intervals smooth the same as regular ones.
+    """
+    __slots__ = ("tau", "value", "last")
+
+    def __init__(self, tau):
+        self.tau = float(tau)
+        self.value = None
+        self.last = None
+
+    def step(self, value, timestamp):
+        if self.value is None or self.tau <= 0:
+            self.value = value
+        else:
+            dt = timestamp - self.last
+            if dt > 0:
+                self.value += (1.0 - exp(-dt / self.tau)) * (value - self.value)
+        self.last = timestamp
+        return self.value
+
+
+class Rate:
+    """Change per second between samples, EMA-smoothed with time constant tau."""
+    __slots__ = ("smooth", "value", "last_value", "last")
+
+    def __init__(self, tau):
+        self.smooth = Ema(tau)
+        self.value = 0.0
+        self.last_value = None
+        self.last = None
+
+    def step(self, value, timestamp):
+        if self.last_value is not None:
+            dt = timestamp - self.last
+            if dt > 0:
+                self.value = self.smooth.step((value - self.last_value) / dt, timestamp)
+        self.last_value = value
+        self.last = timestamp
+        return self.value
+
+
+class Conditioner:
+    """One PID's filters: median, then EMA, then the rate of the result.
+
+    Built from a config entry such as {"median": 5, "ema": 0.3, "rate": 0.15};
+    every key is optional. step() returns the conditioned value and leaves
+    the rate (per second) in .rate.
+    """
+    __slots__ = ("filters", "rate_filter", "rate")
+
+    def __init__(self, median=None, ema=None, rate=None):
+        self.filters = []
+        if median:
+            self.filters.append(Median(int(median)))
+        if ema:
+            self.filters.append(Ema(ema))
+        self.rate_filter = Rate(rate) if rate is not None else None
+        self.rate = 0.0
+
+    def step(self, value, timestamp):
+        for f in self.filters:
+            value = f.step(value, timestamp)
+        if self.rate_filter:
+            self.rate = self.rate_filter.step(value, timestamp)
+        return value
+
+    def track(self, value, timestamp):
+        """Only updates the rate, for a value that was conditioned elsewhere; returns it."""
+        if self.rate_filter:
+            self.rate = self.rate_filter.step(value, timestamp)
+        return self.rate
+
+
+def conditioners(settings, names):
+    """{name: Conditioner} from the "filters" config; bad entries are skipped with a warning."""
+    built = {}
+    for name, options in (settings or {}).items():
+        if name not in names:
+            print(f"[!] Filters: Unknown PID {name}, skipping")
+            continue
+        try:
+            built[name] = Conditioner(**options)
+        except (TypeError, ValueError) as e:
+            print(f"[!] Filters: Bad settings for {name} ({e}), skipping")
+    return built
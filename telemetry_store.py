@@ -0,0 +1,249 @@
+from array import array
+from collections.abc import Mapping
+from math import inf
+
+from derived_channels import DerivedChannels, key_name
+from pid_history import RingBuffer, history_capacity, HISTORY_SECONDS
+from signal_filters import conditioners
+
+# Fields of a DATA entry that describe the PID rather than its latest reading
+SPEC_FIELDS = ("name", "mode", "pid", "unit", "convert", "bytes", "max_age", "dial_min", "dial_max", "icon", "precision", "expr")
+NO_READING = "--"
+
+
+class PidSpec:
+    """The fixed description of one PID, with a dense id into the store's columns."""
+    __slots__ = ("id", "key") + SPEC_FIELDS
+
+    def __init__(self, id, key, entry):
+        set_field = object.__setattr__
+        set_field(self, "id", id)
+        set_field(self, "key", key)
+        for field in SPEC_FIELDS:
+            set_field(self, field, entry.get(field))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("PidSpec is immutable")
+
+
+class TelemetryStore:
+    """Latest reading of every PID in flat numeric columns.
+
+    value, min, max and timestamp are array('d') and seq is array('Q'), all
+    indexed by PidSpec.id, so a sample is a handful of float stores instead
+    of formatting and re-parsing strings. seq counts the PID's samples.
+
+    A PID with filters (see set_filters) stores the conditioned value in
+    value and everything downstream of it; the converted sample is kept in
+    raw and the conditioned value's change per second in rate.
+
+    Watchers added with watch() are called as watcher(value, timestamp)
+    with every value stored for their PID (see alarms, trip_computer).
+
+    Only the polling side writes these columns. After each completed batch
+    it calls publish(), which copies them into an immutable Snapshot for the
+    UI and calls on_publish(snapshot), so readers never see a half-updated
+    reading and only wake up when there is something new.
+
+    Every sample is also appended to the PID's history ring buffer, sized
+    for history_seconds at its max_age. Entries with an "expr" instead of a
+    "pid" are derived channels (see DerivedChannels), recomputed on publish
+    and stored like any polled PID; functions are extra names their
+    expressions may call.
+    """
+
+    def __init__(self, data, history_seconds=HISTORY_SECONDS, functions=None):
+        self.specs = [PidSpec(i, key, entry) for i, (key, entry) in enumerate(data.items())]
+        self.by_key = {spec.key: spec for spec in self.specs}
+        n = len(self.specs)
+        self.value = array('d', (float(entry.get("value", 0)) for entry in data.values()))
+        self.min = array('d', [inf]) * n
+        self.max = array('d', [-inf]) * n
+        self.timestamp = array('d', [0.0]) * n
+        self.seq = array('Q', [0]) * n
+        self.raw = array('d', self.value)
+        self.rate = array('d', [0.0]) * n
+        self.conditioners = [None] * n
+        self.watchers = [()] * n
+        self.histories = [RingBuffer(history_capacity(spec.max_age, history_seconds)) for spec in self.specs]
+        # Per column, per PID: (number, text) of the last formatting
+        self.text_cache = {column: [(None, "")] * n for column in ("value", "min", "max", "raw", "rate")}
+        self.derived = DerivedChannels(self.specs, functions)
+        self.feeds = self.derived.feeds
+        self.view = DataView(self)
+        self.snapshot = Snapshot(self, 0)
+        self.on_publish = None
+
+    def spec(self, key):
+        return self.by_key[key]
+
+    def history(self, key):
+        return self.histories[self.by_key[key].id]
+
+    def watch(self, key, watcher):
+        i = self.by_key[key].id
+        self.watchers[i] += (watcher,)
+
+    def unwatch(self, key, watcher):
+        i = self.by_key[key].id
+        self.watchers[i] = tuple(w for w in self.watchers[i] if w != watcher)
+
+    def set_filters(self, settings):
+        """Per-PID filters from config, e.g. {"STFT": {"median": 5, "ema": 0.3}}."""
+        by_name = {key_name(spec.key): spec for spec in self.specs}
+        self.conditioners = [None] * len(self.specs)
+        for name, conditioner in conditioners(settings, by_name).items():
+            self.conditioners[by_name[name].id] = conditioner
+
+    def update(self, key, raw, timestamp):
+        """Converts and stores one raw sample; returns the conditioned value."""
+        spec = self.by_key[key]
+        return self.put(spec.id, spec.convert(raw), timestamp)
+
+    def put(self, i, val, timestamp):
+        self.raw[i] = val
+        conditioner = self.conditioners[i]
+        if conditioner is not None:
+            val = conditioner.step(val, timestamp)
+            self.rate[i] = conditioner.rate
+        self.value[i] = val
+        if val < self.min[i]:
+            self.min[i] = val
+        if val > self.max[i]:
+            self.max[i] = val
+        self.timestamp[i] = timestamp
+        self.seq[i] += 1
+        self.histories[i].append(timestamp, val)
+        for c in self.feeds[i]:
+            self.derived.dirty[c] = 1
+        for watcher in self.watchers[i]:
+            watcher(val, timestamp)
+        return val
+
+    def set(self, key, value, lo, hi, timestamp):
+        """Stores an already conditioned reading, e.g. one read from shared memory."""
+        i = self.by_key[key].id
+        conditioner = self.conditioners[i]
+        if conditioner is not None:
+            self.rate[i] = conditioner.track(value, timestamp)
+        self.raw[i] = value
+        self.value[i] = value
+        self.min[i] = lo
+        self.max[i] = hi
+        self.timestamp[i] = timestamp
+        self.seq[i] += 1
+        self.histories[i].append(timestamp, value)
+        for c in self.feeds[i]:
+            self.derived.dirty[c] = 1
+        for watcher in self.watchers[i]:
+            watcher(value, timestamp)
+
+    def recompute(self):
+        """Brings the derived channels up to date without publishing a snapshot."""
+        if any(self.derived.dirty):
+            self.derived.recompute(self)
+
+    def publish(self):
+        """Makes everything stored so far visible as a new snapshot."""
+        self.recompute()
+        snapshot = Snapshot(self, self.snapshot.version + 1)
+        self.snapshot = snapshot
+        if self.on_publish:
+            self.on_publish(snapshot)
+        return snapshot
+
+    def get(self, key, column="value"):
+        return getattr(self, column)[self.by_key[key].id]
+
+    def text(self, key, column="value"):
+        """The column's number formatted to the PID's precision, e.g. for a label."""
+        spec = self.by_key[key]
+        return self.format(spec, column, getattr(self, column)[spec.id], self.seq[spec.id])
+
+    def format(self, spec, column, number, seq):
+        cache = self.text_cache[column]
+        cached = cache[spec.id]
+        if cached[0] == number:
+            return cached[1]
+        if column != "value" and not seq:
+            return NO_READING  # Not cached: the first real reading may be the same number
+        text = f"{number:.{spec.precision}f}"
+        cache[spec.id] = (number, text)
+        return text
+
+
+class Snapshot:
+    """A published copy of the store's columns; never changes once made."""
+    __slots__ = ("store", "version", "value", "min", "max", "timestamp", "seq", "raw", "rate")
+
+    def __init__(self, store, version):
+        self.store = store
+        self.version = version
+        self.value = array('d', store.value)
+        self.min = array('d', store.min)
+        self.max = array('d', store.max)
+        self.timestamp = array('d', store.timestamp)
+        self.seq = array('Q', store.seq)
+        self.raw = array('d', store.raw)
+        self.rate = array('d', store.rate)
+
+    def get(self, key, column="value"):
+        return getattr(self, column)[self.store.by_key[key].id]
+
+    def seq_of(self, key):
+        return self.seq[self.store.by_key[key].id]
+
+    def text(self, key, column="value"):
+        spec = self.store.by_key[key]
+        return self.store.format(spec, column, getattr(self, column)[spec.id], self.seq[spec.id])
+
+
+class DataEntryView(Mapping):
+    """One PID as the old DATA dict: spec fields plus formatted readings."""
+    __slots__ = ("store", "spec")
+
+    DYNAMIC = {"value": "value", "min_read": "min", "max_read": "max"}
+    KEYS = SPEC_FIELDS + ("value", "min_read", "max_read", "timestamp")
+
+    def __init__(self, store, spec):
+        self.store = store
+        self.spec = spec
+
+    def __getitem__(self, field):
+        column = self.DYNAMIC.get(field)
+        if column:
+            return self.store.text(self.spec.key, column)
+        if field == "timestamp":
+            return self.store.timestamp[self.spec.id]
+        if field in SPEC_FIELDS:
+            value = getattr(self.spec, field)
+            if value is not None:
+                return value
+        raise KeyError(field)
+
+    def __iter__(self):
+        return (field for field in self.KEYS if field in self)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __contains__(self, field):
+        if field in self.DYNAMIC or field == "timestamp":
+            return True
+        return field in SPEC_FIELDS and getattr(self.spec, field) is not None
+
+
+class DataView(Mapping):
+    """Read-only dict-of-dicts view of a TelemetryStore, for code written against DATA."""
+
+    def __init__(self, store):
+        self.entries = {spec.key: DataEntryView(store, spec) for spec in store.specs}
+
+    def __getitem__(self, key):
+        return self.entries[key]
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,336 @@
+import asyncio
+import re
+import socket
+import time
+
+from config_manager import config_manager
+from elm327 import ResponseReader, StateFile, warm_init, full_init, discover_vehicle
+from metrics import metrics
+from obd_poller import ElmPoller
+
+CONNECT_TIMEOUT = 2
+POLL_TIMEOUT = 2
+RECONNECT_DELAY = 2
+CONFIG_CHECK_POLLS = 60  # Re-read PID lists from config every N polls
+
+# canusb monitor output, e.g. "Frame ID: 7e8, Data: 00 00 00 00 64 0b 41 03"
+FRAME_RE = re.compile(r"Frame ID:\s*([0-9A-Fa-f]+),\s*Data:\s*([0-9A-Fa-f ]+)")
+ECU_REPLY_IDS = range(0x7E8, 0x7F0)
+
+
+class ElmAdapter:
+    """An ELM327 on TCP (the WiFi dongle), polled by its own coroutine.
+
+    Connect and init are blocking and rare, so they run in the loop's
+    executor with the existing helpers; the poll loop itself is pure asyncio
+    on a non-blocking socket.
+    """
+
+    def __init__(self, hub, name, host, port):
+        self.hub = hub
+        self.name = name
+        self.host = host
+        self.port = port
+        self.poller = ElmPoller(hub.data, hub.publish, name)
+        self.state = hub.adapter_state.section(name)
+        self.reader = None
+
+    def open(self):
+        """Opens the adapter socket, initialises it and returns a ResponseReader.
+
+        Tries the warm path with the cached protocol first and only falls back
+        to the full ATZ/ATSP0 sequence when that fails. Timing lands in metrics.
+        """
+        try:
+            started = time.monotonic()
+            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            s.settimeout(CONNECT_TIMEOUT)
+            s.connect((self.host, self.port))
+            reader = ResponseReader(s)
+
+            if warm_init(reader, self.state):
+                init_path = "warm"
+            else:
+                init_path = "full"
+                full_init(reader, self.state)
+
+            vin, supported = discover_vehicle(reader, self.state, self.hub.vehicles)
+            self.poller.set_supported(supported, vin)
+            if supported is not None:
+                print(f"[*] {self.name}: Vehicle {vin or '(no VIN)'}: {len(supported)} supported PIDs")
+
+            if config_manager.get("latency_mode", False):
+                self.poller.latency.setup(reader, self.state.get("protocol"))
+            else:
+                self.poller.latency.reset()
+
+            elapsed = time.monotonic() - started
+            metrics.observe("connect_seconds", elapsed)
+            metrics.set("connect_path", init_path)
+            print(f"[*] {self.name}: Raw High-Speed OBD Connection Established ({init_path} init, {elapsed:.2f}s)")
+            return reader
+        except Exception as e:
+            print(f"[!] {self.name}: Raw Connection Failed: {e}")
+            return None
+
+    async def connect(self, loop):
+        while True:
+            reader = await loop.run_in_executor(None, self.open)
+            if reader:
+                reader.sock.setblocking(False)
+                self.poller.invalidate()
+                self.poller.restart()
+                return reader
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    async def command(self, loop, cmd):
+        return await asyncio.wait_for(self.reader.command_async(loop, cmd), POLL_TIMEOUT)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self.reader = await self.connect(loop)
+        print(f"[*] {self.name}: Starting Adaptive Batch Polling...")
+        poller = self.poller
+        poll_count = 0
+        job = None
+
+        while True:
+            try:
+                if poll_count % CONFIG_CHECK_POLLS == 0:
+                    poller.set_pids(*self.hub.pid_lists(self))
+                poll_count += 1
+
+                control = poller.latency.next_control()
+                if control:
+                    poller.latency.control_reply(await self.command(loop, control))
+
+                job = poller.next_background()
+                if job:
+                    sent_at = time.monotonic()
+                    reply = await self.command(loop, job.cmd)
+                    poller.background.finish(job, reply, sent_at)
+                    job = None
+
+                batch = poller.next_batch()
+                if not batch:
+                    await asyncio.sleep(poller.idle())
+                    continue
+                sent_at = time.monotonic()
+                reply = await self.command(loop, poller.command(batch))
+                if not poller.handle_reply(batch, reply, sent_at):
+                    sent_at = time.monotonic()
+                    reply = await self.command(loop, poller.plain_command(batch))
+                    poller.handle_reply(batch, reply, sent_at)
+                self.hub.after_poll(self)
+
+            except (TimeoutError, ConnectionError, OSError):
+                print(f"[!] {self.name}: Connection Lost. Reconnecting...")
+                if job:
+                    poller.background.requeue(job)
+                    job = None
+                lost_at = time.monotonic()
+                self.reader.sock.close()
+                self.reader = await self.connect(loop)
+                metrics.inc("reconnects")
+                metrics.observe("reconnect_seconds", time.monotonic() - lost_at)
+                poll_count = 0
+            except Exception as e:
+                print(f"[!] {self.name}: Loop Exception: {e}")
+                await asyncio.sleep(0.1)
+
+    def submit(self, name, callback, cmd=None, decode=None):
+        self.poller.background.submit(name, callback, cmd, decode)
+
+    def quarantined_pids(self):
+        return self.poller.health.quarantined_pids()
+
+    def is_supported(self, pid):
+        return self.poller.is_supported(pid)
+
+
+class CanUsbAdapter:
+    """A CAN-USB adapter on a second bus, driven through the canusb tool.
+
+    Works like usb.py: one canusb process per PID injects its Mode 01 (or
+    Mode 22) request every gap_ms, and one monitor process reports every
+    frame on the bus. Replies are decoded as they arrive.
+    """
+
+    def __init__(self, hub, name, pids, binary="./canusb", device="/dev/ttyUSB0",
+                 speed="500000", request_id="7DF", gap_ms=100):
+        self.hub = hub
+        self.name = name
+        self.pids = pids
+        self.binary = binary
+        self.device = device
+        self.speed = str(speed)
+        self.request_id = request_id
+        self.gap_ms = str(gap_ms)
+        self.publish = hub.publish
+        # Reply mode byte + PID echo -> (pid, data width), e.g. 41 0C or 62 F4 0C
+        self.slots = {}
+        for pid in pids:
+            entry = hub.data[pid]
+            mode = entry.get("mode", "01")
+            echo = bytes([int(mode, 16) + 0x40]) + bytes.fromhex(entry["pid"])
+            self.slots[echo] = (pid, entry["bytes"])
+
+    async def run(self):
+        while True:
+            procs = []  # Every process spawned this round, monitor first, killed however the round ends
+            try:
+                monitor = await asyncio.create_subprocess_exec(
+                    "stdbuf", "-oL", self.binary, "-t", "-d", self.device, "-s", self.speed,
+                    stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL)
+                procs.append(monitor)
+                for pid in self.pids:
+                    request = self.hub.data[pid].get("mode", "01") + self.hub.data[pid]["pid"]
+                    data = f"{len(request) // 2:02X}{request}".ljust(16, "0")
+                    procs.append(await asyncio.create_subprocess_exec(
+                        self.binary, "-d", self.device, "-s", self.speed, "-i", self.request_id,
+                        "-j", data, "-g", self.gap_ms,
+                        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL))
+                print(f"[*] {self.name}: CANUSB monitor and {len(procs) - 1} request injectors running")
+                await self.listen(monitor)
+            except Exception as e:
+                print(f"[!] {self.name}: CANUSB failed: {e}")
+            finally:
+                for proc in procs:
+                    if proc.returncode is None:
+                        proc.kill()
+                        await proc.wait()
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    async def listen(self, monitor):
+        async for line in monitor.stdout:
+            match = FRAME_RE.search(line.decode('ascii', 'ignore'))
+            if match and int(match.group(1), 16) in ECU_REPLY_IDS:
+                self.decode_frame(match.group(2), time.monotonic())
+        print(f"[!] {self.name}: CANUSB monitor exited. Restarting...")
+
+    def decode_frame(self, data_str, now):
+        # canusb prints the payload last byte first (see usb.decode_frame)
+        frame = bytes.fromhex(data_str)[::-1]
+        if len(frame) < 4:
+            return
+        start = 3
+        slot = self.slots.get(frame[1:3])
+        if slot is None:
+            start = 4
+            slot = self.slots.get(frame[1:4])
+            if slot is None:
+                return
+        pid, width = slot
+        if len(frame) >= start + width:
+            self.publish(pid, int.from_bytes(frame[start:start + width], 'big'), now)
+            self.hub.after_poll(self)
+
+    def quarantined_pids(self):
+        return frozenset()
+
+    def is_supported(self, pid):
+        return pid in self.pids
+
+
+class TransportHub:
+    """Runs every configured adapter's polling coroutine on one asyncio loop.
+
+    Timestamped samples from all adapters go through on_sample(pid, raw, ts)
+    into the shared DATA store. PIDs pinned to a non-ELM adapter are left out
+    of the ELM327 batches, so a second source adds throughput.
+    """
+
+    def __init__(self, data, on_sample, pid_source, after_poll=None):
+        self.data = data
+        self.on_sample = on_sample
+        self.pid_source = pid_source  # () -> (fast_pids, slow_pids) from config
+        self.after_poll = after_poll or (lambda adapter: None)
+        self.sink = None  # Optional sink(pid, value, ts) after on_sample, e.g. shared memory
+        self.logger = None  # Optional SampleLogger, fed every decoded sample
+        self.adapter_state = StateFile(StateFile.ADAPTER_STATE_FILE)
+        self.vehicles = StateFile(StateFile.VEHICLE_CACHE_FILE)
+        self.adapters = []
+
+    @classmethod
+    def from_config(cls, specs, data, pid_names, on_sample, pid_source, after_poll=None,
+                    default_host="192.168.0.10", default_port=35000):
+        hub = cls(data, on_sample, pid_source, after_poll)
+        for spec in specs:
+            kind = spec.get("type", "elm327")
+            name = spec.get("name", kind)
+            if kind == "elm327":
+                hub.adapters.append(ElmAdapter(hub, name, spec.get("host", default_host),
+                                               int(spec.get("port", default_port))))
+            elif kind == "canusb":
+                pids = [pid_names[k] for k in spec.get("pids", []) if k in pid_names]
+                options = {k: spec[k] for k in ("binary", "device", "speed", "request_id", "gap_ms") if k in spec}
+                hub.adapters.append(CanUsbAdapter(hub, name, pids, **options))
+            else:
+                print(f"[!] Transport: Unknown adapter type '{kind}' for {name}. Skipping.")
+        return hub
+
+    def publish(self, pid, raw, ts):
+        val = self.on_sample(pid, raw, ts)
+        if val is not None:
+            if self.sink is not None:
+                self.sink(pid, val, ts)
+            if self.logger is not None:
+                self.logger.append(pid, raw, val, ts)
+        return val
+
+    def claimed_pids(self, adapter):
+        """PIDs another, non-ELM adapter provides."""
+        claimed = set()
+        for other in self.adapters:
+            if other is not adapter and isinstance(other, CanUsbAdapter):
+                claimed.update(other.pids)
+        return claimed
+
+    def pid_lists(self, adapter):
+        """The configured fast/slow PIDs minus those another adapter provides."""
+        fast, slow = self.pid_source()
+        claimed = self.claimed_pids(adapter)
+        return [p for p in fast if p not in claimed], [p for p in slow if p not in claimed]
+
+    def quarantined_pids(self):
+        quarantined = frozenset()
+        for adapter in self.adapters:
+            quarantined |= adapter.quarantined_pids()
+        return quarantined
+
+    def burst(self, pids, seconds):
+        """Starts a burst on every ELM327 adapter for the pids no other adapter provides."""
+        started = False
+        for adapter in self.adapters:
+            if isinstance(adapter, ElmAdapter):
+                claimed = self.claimed_pids(adapter)
+                mine = [pid for pid in pids if pid not in claimed]
+                started = adapter.poller.start_burst(mine, seconds) or started
+        return started
+
+    def burst_status(self):
+        for adapter in self.adapters:
+            if isinstance(adapter, ElmAdapter):
+                status = adapter.poller.burst_status()
+                if status:
+                    return status
+        return None
+
+    def submit(self, name, callback, cmd=None, decode=None):
+        """Queues a background command on the first ELM327 adapter."""
+        for adapter in self.adapters:
+            if isinstance(adapter, ElmAdapter):
+                adapter.submit(name, callback, cmd, decode)
+                return True
+        print(f"[!] Transport: No ELM327 adapter for background command {name}.")
+        return False
+
+    def is_supported(self, pid):
+        return any(adapter.is_supported(pid) for adapter in self.adapters) if self.adapters else True
+
+    async def run(self):
+        await asyncio.gather(*(adapter.run() for adapter in self.adapters))
+
+    def run_forever(self):
+        print(f"[*] Transport: Starting {len(self.adapters)} adapter(s): {', '.join(a.name for a in self.adapters)}")
+        asyncio.run(self.run())
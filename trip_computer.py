@@ -0,0 +1,173 @@
+import threading
+import time
+from math import inf, sqrt
+
+from derived_channels import key_name
+from elm327 import StateFile
+
+TRIP_FILE = "trip.json"
+SAVE_INTERVAL = 5.0
+MAX_GAP = 5.0  # Longer gaps between samples (reconnects, restarts) are not integrated
+
+
+class PidTrip:
+    """One PID's running statistics for the trip, O(1) per sample.
+
+    Mean and variance use Welford's method; time above the threshold is
+    the time from each sample above it to the next.
+    """
+    __slots__ = ("count", "mean", "m2", "min", "min_at", "max", "max_at", "above", "last_value", "last_at")
+
+    FIELDS = ("count", "mean", "m2", "min", "min_at", "max", "max_at", "above")
+
+    def __init__(self, saved=None):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = inf
+        self.min_at = None
+        self.max = -inf
+        self.max_at = None
+        self.above = 0.0
+        self.last_value = None
+        self.last_at = None
+        for field in self.FIELDS:
+            if saved and saved.get(field) is not None:
+                setattr(self, field, saved[field])
+
+    def add(self, value, at, dt, threshold):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if value < self.min:
+            self.min, self.min_at = value, at
+        if value > self.max:
+            self.max, self.max_at = value, at
+        if threshold is not None and dt and self.last_value > threshold:
+            self.above += dt
+        self.last_value = value
+
+    def stddev(self):
+        return sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def to_dict(self):
+        # JSON has no infinity; an empty min/max is just left out
+        return {field: getattr(self, field) for field in self.FIELDS if abs(getattr(self, field) or 0) != inf}
+
+
+class TripComputer:
+    """Per-trip statistics for every PID, saved to disk every few seconds.
+
+    attach() watches every PID in the store, so each sample costs a few
+    float operations under a lock. Distance is SPEED (km/h) integrated over
+    sample time. A background thread writes a compact snapshot with an
+    atomic replace every save_interval seconds, so a power cut loses at
+    most that much and the SD card sees one write per interval. min/max
+    times are wall-clock, to still make sense after a restart.
+    """
+
+    def __init__(self, store, path=TRIP_FILE, thresholds=None, speed_key=None, save_interval=SAVE_INTERVAL):
+        self.store = store
+        self.file = StateFile(path, indent=None)
+        self.save_interval = save_interval
+        by_name = {key_name(spec.key): spec for spec in store.specs}
+        self.thresholds = {by_name[name].key: limit for name, limit in (thresholds or {}).items() if name in by_name}
+        self.speed_key = speed_key
+        self.lock = threading.Lock()
+        self.watchers = {}
+        self.dirty = False
+        self.stop_event = threading.Event()
+        self.save_lock = threading.Lock()  # The saver thread and stop() share one .tmp file
+        self.saver = None
+        self.clock_offset = time.time() - time.monotonic()
+        self.load()
+
+    def load(self):
+        saved = self.file.state
+        pids = saved.get("pids", {})
+        self.started = saved.get("started") or time.time()
+        self.distance = saved.get("distance", 0.0)
+        self.duration = saved.get("duration", 0.0)
+        self.last_at = None
+        self.pids = {spec.key: PidTrip(pids.get(key_name(spec.key))) for spec in self.store.specs}
+        if saved:
+            print(f"[*] Trip: Resumed trip from {time.strftime('%Y-%m-%d %H:%M', time.localtime(self.started))}, "
+                  f"{self.distance:.1f} km")
+
+    def reset(self):
+        with self.lock:
+            self.file.state = {}
+            self.load()
+            self.dirty = True
+        print("[*] Trip: Reset")
+
+    def attach(self):
+        for spec in self.store.specs:
+            watcher = self.watcher(spec.key)
+            self.watchers[spec.key] = watcher
+            self.store.watch(spec.key, watcher)
+
+    def detach(self):
+        for key, watcher in self.watchers.items():
+            self.store.unwatch(key, watcher)
+        self.watchers = {}
+
+    def watcher(self, key):
+        threshold = self.thresholds.get(key)
+        is_speed = key == self.speed_key
+        def on_sample(value, timestamp):
+            with self.lock:
+                trip = self.pids[key]
+                dt = timestamp - trip.last_at if trip.last_at is not None else 0.0
+                if dt < 0 or dt > MAX_GAP:
+                    dt = 0.0
+                if is_speed and dt and trip.last_value is not None:
+                    self.distance += (trip.last_value + value) / 2.0 * dt / 3600.0
+                trip.add(value, timestamp + self.clock_offset, dt, threshold)
+                trip.last_at = timestamp
+                if self.last_at is not None and 0 < timestamp - self.last_at <= MAX_GAP:
+                    self.duration += timestamp - self.last_at
+                if self.last_at is None or timestamp > self.last_at:
+                    self.last_at = timestamp
+                self.dirty = True
+        return on_sample
+
+    def summary(self, key):
+        """(mean, stddev, min, max, seconds above threshold) of one PID, or None before any sample."""
+        with self.lock:
+            trip = self.pids[key]
+            if not trip.count:
+                return None
+            return trip.mean, trip.stddev(), trip.min, trip.max, trip.above
+
+    def to_dict(self):
+        with self.lock:
+            self.dirty = False
+            return {
+                "started": self.started,
+                "distance": self.distance,
+                "duration": self.duration,
+                "pids": {key_name(key): trip.to_dict() for key, trip in self.pids.items() if trip.count},
+            }
+
+    def save(self):
+        with self.save_lock:
+            if self.dirty:
+                self.file.state = self.to_dict()
+                self.file.save_state()
+
+    def start(self):
+        self.saver = threading.Thread(target=self.run_saver, name="trip-saver", daemon=True)
+        self.saver.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.saver is not None:
+            self.saver.join(2)
+            self.saver = None
+        self.save()
+
+    def run_saver(self):
+        while not self.stop_event.wait(self.save_interval):
+            self.save()
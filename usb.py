@@ -27,6 +27,9 @@ from math import inf
 import math 
 import random
 
+from config_manager import config_manager
+from pid_catalog import CATALOG_FILE, load_catalog
+
 # Fullscreen, no borders, hide mouse
 Config.set('graphics', 'fullscreen', 'auto')
 Window.show_cursor = False
@@ -43,85 +46,20 @@ REQUEST_INTERVAL = 0  # seconds
 
 OBD_REQ_ID = "7DF"
 
+# The PIDs this screen shows, from the shared catalog (keyed by their Mode 01 PID here)
+USB_PIDS = ["MAP", "IAT", "COOLANT_TEMP", "OIL_TEMP", "CAT_TEMP", "VOLTAGE"]
+CATALOG = load_catalog(config_manager.get("pid_catalog", CATALOG_FILE))
+# This screen's own labels and dial ranges, kept over the catalog's
+USB_DISPLAY = {
+    "MAP": {"name": "Boost", "dial_min": -20, "dial_max": 20, "value": 0, "precision": 2},
+    "OIL_TEMP": {"dial_min": 40, "dial_max": 150, "value": 100},
+    "VOLTAGE": {"dial_min": 10, "dial_max": 15, "value": 13.8},
+}
+
 DATA = {
-    "0B": {
-        "name": "Boost",
-        "unit": "psi",
-        "convert": lambda A: A * 0.145,
-        "bytes": 1,
-        "dial_min": -20,
-        "dial_max": 20,
-        "value": 0,
-        "min_read": inf,
-        "max_read": -inf,
-        "icon": "./boost_pressure.png",
-        "precision": 2
-    },
-    "0F": {
-        "name": "Intake Air Temp",
-        "unit": "°C",
-        "convert": lambda A: A - 40,
-        "bytes": 1,
-        "dial_min": 0,
-        "dial_max": 80,
-        "value": 40,
-        "min_read": inf,
-        "max_read": -inf,
-        "icon": "./iat.png",
-        "precision": 0
-    },
-    "05": {
-        "name": "Coolant Temp",
-        "unit": "°C",
-        "convert": lambda A: A - 40,
-        "bytes": 1,
-        "dial_min": 40,
-        "dial_max": 120,
-        "value": 90,
-        "min_read": inf,
-        "max_read": -inf,
-        "icon": "./coolant_temp.png",
-        "precision": 0
-    },
-    "5C": {
-        "name": "Oil Temp",
-        "unit": "°C",
-        "convert": lambda A: A - 40,
-        "bytes": 1,
-        "dial_min": 40,
-        "dial_max": 150,
-        "value": 100,
-        "min_read": inf,
-        "max_read": -inf,
-        "icon": "./oil_temp.png",
-        "precision": 0
-    },
-    "3C": {
-        "name": "EGT",
-        "unit": "°C",
-        "convert": lambda A, B: ((A * 256 + B) / 10) - 40,
-        "bytes": 2,
-        "dial_min": 200,
-        "dial_max": 1000,
-        "value": 600,
-        "min_read": inf,
-        "max_read": -inf,
-        "icon": "./egt.png",
-        "precision": 0
-    },
-    "42": {
-        "name": "Voltage",
-        "unit": "V",
-        "convert": lambda A: A / 10.0,
-        "bytes": 1,
-        "dial_min": 10,
-        "dial_max": 15,
-        "value": 13.8,
-        "min_read": inf,
-        "max_read": -inf,
-        "icon": "./battery.png",
-        "precision": 1
-    },
+    CATALOG[name]["pid"]: dict(CATALOG[name], **USB_DISPLAY.get(name, {}), icon="./" + CATALOG[name]["icon"],
+                               min_read=inf, max_read=-inf)
+    for name in USB_PIDS if name in CATALOG
 }
 
 FRAME_RE = re.compile(r"Frame ID:\s*([0-9A-Fa-f]+),\s*Data:\s*([0-9A-Fa-f ]+)")
@@ -164,7 +102,7 @@ def dummy_thread():
                     A = int(value + 40)
                     frame = f"03 41 {pid} {A:02X} 00 00 00 00"
 
-                elif pid == "3C":  # EGT (val = (A*256 + B)/10)
+                elif pid == "3C":  # Catalyst temp (val = (A*256 + B)/10)
                     value = center + amplitude * math.sin(t * 1.2 + random.uniform(-0.2, 0.2)) + noise * 5
                     value = max(dial_min, min(dial_max, value))
                     raw = int(value * 10)
@@ -172,11 +110,13 @@ def dummy_thread():
                     B = raw & 0xFF
                     frame = f"03 41 {pid} {A:02X} {B:02X} 00 00 00"
 
-                elif pid == "42":  # Voltage (A / 10)
+                elif pid == "42":  # Voltage ((A*256 + B) / 1000)
                     value = center + math.sin(t * 0.1) * 0.1 + noise * 0.05
                     value = max(dial_min, min(dial_max, value))
-                    A = int(value * 10)
-                    frame = f"03 41 {pid} {A:02X} 00 00 00 00"
+                    raw = int(value * 1000)
+                    A = (raw >> 8) & 0xFF
+                    B = raw & 0xFF
+                    frame = f"04 41 {pid} {A:02X} {B:02X} 00 00 00"
 
                 else:  # Generic 1-byte
                     value = center + amplitude * math.sin(t)
@@ -219,18 +159,12 @@ def decode_frame(data_str):
             # print(f"[decode_frame] PID {pid} not found in DATA.")
             return None
 
-        if entry["bytes"] == 2:
-            A = int(bytes_list[3], 16)
-            B = int(bytes_list[4], 16)
-            # print(f"[decode_frame] Parsed A: {A}, B: {B}")
-            value = entry["convert"](A, B)
-        elif entry["bytes"] == 1:
-            A = int(bytes_list[3], 16)
-            # print(f"[decode_frame] Parsed A: {A}")
-            value = entry["convert"](A)
-        else:
-            # print(f"[decode_frame] Unsupported byte size for PID {pid}")
+        width = entry["bytes"]
+        if len(bytes_list) < 3 + width:
             return None
+        raw = int("".join(bytes_list[3:3 + width]), 16)
+        # print(f"[decode_frame] Parsed raw: {raw}")
+        value = entry["convert"](raw)
 
         # print(f"[decode_frame] Computed value: {value}")
 
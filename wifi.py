@@ -31,16 +31,26 @@ from kivy.animation import Animation
 from kivy.core.window import Window
 import threading
 import re
-from math import inf
 import random
 import obd
 from enum import Enum
 from os import path
 import time
-import socket
 import select
 import os
 from config_manager import config_manager
+from obd_decode import BatchCompiler
+from pid_scheduler import FAST_PID_MAX_AGE
+from transport import TransportHub
+from telemetry_store import TelemetryStore
+from assist_rules import AssistRules
+from alarms import AlarmEngine
+from trip_computer import TripComputer
+from pid_catalog import load_catalog, CATALOG_FILE
+from operating_maps import OperatingMaps
+from sample_logger import SampleLogger
+from log_replay import LogReplay
+from poller_process import PollerProcess
 
 USE_FAKE_OBD = False
 
@@ -48,58 +58,61 @@ DIAL_MIN = 18
 DIAL_MAX = -110
 OBD_WIFI_IP = os.environ.get("OBD_HOST", "192.168.0.10")
 OBD_WIFI_PORT = int(os.environ.get("OBD_PORT", 35000))
+# Plays a recorded log (a .seg file or a log directory) instead of polling the adapter;
+# OBD_REPLAY_SPEED is 1, 10, ... or 0 for as fast as possible, OBD_REPLAY_LEVEL "sample" or "frame"
+OBD_REPLAY = os.environ.get("OBD_REPLAY")
+OBD_REPLAY_SPEED = float(os.environ.get("OBD_REPLAY_SPEED", 1))
+OBD_REPLAY_LEVEL = os.environ.get("OBD_REPLAY_LEVEL", "sample")
 GAUGE_UPDATE_INTERVAL = 1.0 / 60.0
 ASSETS_ICONS_PATH = "./assets/icons/"
 ASSETS_ICONS_PATH = "./assets/icons/"
 ASSETS_FONTS_PATH = "./assets/fonts"
 MAX_GAUGES = 6
-
-class PID(Enum):
-    BARO = "BAROMETRIC_PRESSURE"
-    BOOST = "MANIFOLD_PRESSURE"
-    IAT = "IAT"
-    AFR = "AFR_C"
-    TIMING = "IGNITION_TIMING"
-    COOLANT_TEMP = "COOLANT_TEMP"
-    OIL_TEMP = "OIL_TEMP"
-    VOLTAGE = "VOLTAGE"
-    RPM = "ENGINE_RPM"
-    THROTTLE = "THROTTLE_POSITION"
-    SPEED = "SPEED"
-    LTFT = "LTFT"
-    STFT = "STFT"
-    LOAD = "ENGINE_LOAD"
-
-# --- FIXED DATA DICTIONARY ---
-DATA = {
-    PID.BARO: { "name": "Barometer", "pid": "33", "unit": "psi", "convert": lambda A: A * 0.145, "bytes": 1, "dial_min": 0, "dial_max": 20, "value": 14.5, "min_read": inf, "max_read": -inf, "icon": "boost_pressure.png", "precision": 1 },
-    PID.BOOST: { "name": "Boost", "pid": "0B", "unit": "psi", "convert": lambda A: (A * 0.145) - 14.5, "bytes": 1, "dial_min": -20, "dial_max": 30, "value": 0, "min_read": inf, "max_read": -inf, "icon": "boost_pressure.png", "precision": 1 },
-    PID.IAT: { "name": "Intake Air Temp", "pid": "0F", "unit": "°C", "convert": lambda A: A - 40, "bytes": 1, "dial_min": 0, "dial_max": 80, "value": 40, "min_read": inf, "max_read": -inf, "icon": "iat.png", "precision": 0 },
-    PID.AFR: { "name": "Commanded AFR", "pid": "44", "unit": "λ", "convert": lambda A: A / 32768.0, "bytes": 2, "dial_min": 0.7, "dial_max": 1.3, "value": 1.0, "min_read": float('inf'), "max_read": float('-inf'), "icon": "afr.png", "precision": 2 },
-    PID.TIMING: { "name": "Timing Advance", "pid": "0E", "unit": "°", "convert": lambda A: (A / 2.0) - 64.0, "bytes": 1, "dial_min": -20, "dial_max": 60, "value": 0, "min_read": float('inf'), "max_read": float('-inf'), "icon": "timing.png", "precision": 0 },
-    PID.COOLANT_TEMP: { "name": "Coolant Temp", "pid": "05", "unit": "°C", "convert": lambda A: A - 40, "bytes": 1, "dial_min": 40, "dial_max": 120, "value": 90, "min_read": inf, "max_read": -inf, "icon": "coolant_temp.png", "precision": 0 },
-    PID.OIL_TEMP: { "name": "Oil Temp", "pid": "5C", "unit": "°C", "convert": lambda A: A - 40, "bytes": 1, "dial_min": 40, "dial_max": 120, "value": 90, "min_read": inf, "max_read": -inf, "icon": "oil_temp.png", "precision": 0 },
-    PID.VOLTAGE: { "name": "Voltage", "pid": "42", "unit": "V", "convert": lambda A: A / 1000.0, "bytes": 2, "dial_min": 5, "dial_max": 20, "value": 12, "min_read": inf, "max_read": -inf, "icon": "battery.png", "precision": 1 },
-    PID.RPM: { "name": "RPM", "pid": "0C", "unit": "rpm", "convert": lambda A: A / 4.0, "bytes": 2, "dial_min": 0, "dial_max": 7000, "value": 800, "min_read": float('inf'), "max_read": float('-inf'), "icon": "speedo.png", "precision": 0 },
-    PID.THROTTLE: { "name": "Throttle", "pid": "11", "unit": "%", "convert": lambda A: (A * 100.0) / 255.0, "bytes": 1, "dial_min": 0, "dial_max": 100, "value": 0, "min_read": float('inf'), "max_read": float('-inf'), "icon": "throttlebody.png", "precision": 0 },
-    PID.SPEED: { "name": "Speed", "pid": "0D", "unit": "km/h", "convert": lambda A: A, "bytes": 1, "dial_min": 0, "dial_max": 180, "value": 0, "min_read": float('inf'), "max_read": float('-inf'), "icon": "speedo.png", "precision": 0 },
-    PID.LTFT: { "name": "LTFT", "pid": "07", "unit": "%", "convert": lambda A: (A - 128) * (100.0 / 128.0), "bytes": 1, "dial_min": -25, "dial_max": 25, "value": 0, "min_read": float('inf'), "max_read": float('-inf'), "icon": "trim.png", "precision": 1 },
-    PID.STFT: { "name": "STFT", "pid": "06", "unit": "%", "convert": lambda A: (A - 128) * (100.0 / 128.0), "bytes": 1, "dial_min": -25, "dial_max": 25, "value": 0, "min_read": float('inf'), "max_read": float('-inf'), "icon": "trim.png", "precision": 1 },
-    PID.LOAD: { "name": "Engine Load", "pid": "04", "unit": "%", "convert": lambda A: (A * 100.0) / 255.0, "bytes": 1, "dial_min": 0, "dial_max": 100, "value": 0, "min_read": float('inf'), "max_read": float('-inf'), "icon": "load.png", "precision": 0 },
-}
+TAP_SLOP = 20 # px a touch may move and still count as a tap rather than a swipe
+
+# --- PID CATALOG ---
+# Every PID comes from pids.json: Mode 01/22 PIDs with a formula over their data
+# bytes, compiled once at load, and derived channels with an "expr" over other
+# PIDs, computed whenever one of them has a new sample (listing one in
+# fast/slow_pids polls its inputs instead). "value" is only what is shown until
+# the first sample arrives.
+PID_CATALOG = load_catalog(config_manager.get("pid_catalog", CATALOG_FILE))
+PID = Enum("PID", [(name, name) for name in PID_CATALOG], module=__name__)
+PID_TABLE = {PID[name]: entry for name, entry in PID_CATALOG.items()}
+# The few PIDs the UI itself leans on; None when the catalog doesn't have them
+RPM_KEY = PID.__members__.get("RPM")
+SPEED_KEY = PID.__members__.get("SPEED")
+
+STOICH_AFR = 14.7 # Petrol; lambda 1.0 in AFR
+
+def gear(rpm, speed):
+    """Estimated gear from the RPM per km/h of the configured gear ratios; 0 when stopped."""
+    if speed < GEAR_MIN_SPEED:
+        return 0
+    ratio = rpm / speed
+    ratios = config_manager.get("gear_rpm_per_kmh")
+    return 1 + min(range(len(ratios)), key=lambda i: abs(ratios[i] - ratio))
+
+GEAR_MIN_SPEED = 3 # km/h; below this the clutch is probably in
+
+# Live readings in numeric columns; DATA is the old dict-of-dicts view of them
+STORE = TelemetryStore(PID_TABLE, config_manager.get("history_seconds"),
+                       { "gear": gear, "STOICH_AFR": STOICH_AFR })
+# Conditioning between decode and publish: {"PID": {"median": 3|5, "ema": tau_s, "rate": tau_s}}
+STORE.set_filters(config_manager.get("filters"))
+DATA = STORE.view
 
 # ============================================================================
 #  USER CONFIGURATION SECTION
 # ============================================================================
 
-# 1. FAST PIDS: Updated instantly.
-# WARNING: Keep total response bytes <= 7 for instant updates.
-# Calculation: 1 byte (Header) + Sum(1 byte PID + N bytes Data for each PID)
+# 1. FAST PIDS: Polled as close to the adapter's maximum rate as possible.
+# Their "max_age" in DATA is capped at pid_scheduler.FAST_PID_MAX_AGE.
 FAST_PIDS_KEYS = config_manager.get("fast_pids")
 FAST_PIDS = [getattr(PID, k) for k in FAST_PIDS_KEYS if hasattr(PID, k)]
 
-# 2. SLOW PIDS: Updated every 10th cycle (Temps, Voltages, etc)
-# Focused on Thermal Management (Altroz weakness) and General Health.
+# 2. SLOW PIDS: Polled whenever they get older than their "max_age" in DATA
+# (Temps, Voltages, etc). Focused on Thermal Management (Altroz weakness) and General Health.
 SLOW_PIDS_KEYS = config_manager.get("slow_pids")
 SLOW_PIDS = [getattr(PID, k) for k in SLOW_PIDS_KEYS if hasattr(PID, k)]
 
@@ -129,296 +142,249 @@ DRIVER_ASSISTS_STATE = {
     AssistKey.THROTTLE_STYLE: { "name": "Drive Style", "value": "--", "show": True, "icon": "drivestyle.png" }
 }
 
-DRIVER_ASSISTS_INTERNAL_STATE = { "prev_throttle": None }
+# Driver assists as rules over PID names (see assist_rules.AssistRules).
+# "states" are tried in order; "all" joins every one that holds.
+INEFFICIENT = "LOAD > 80 or THROTTLE > 70 or AFR < 0.95"
+ASSIST_RULES = {
+    AssistKey.ECO_STATUS: { "mode": "all", "default": "ECO", "states": [
+        ("Inefficient", INEFFICIENT),
+        ("Upshift", f"THROTTLE < 20 and RPM > 3000 and not ({INEFFICIENT})"),
+        ("Rich trim", "LTFT < -5"),
+    ]},
+    AssistKey.SHIFT_HINT: { "default": "--", "states": [
+        ("SHIFT ^", "RPM > 3500 and THROTTLE < 30"),
+        ("SHIFT v", "RPM < 1500 and LOAD > 80"),
+    ]},
+    AssistKey.WARMUP_STATUS: { "default": "OK", "dwell": 2.0, "states": [
+        ("Idle", "OIL_TEMP < 40"),
+        ("Gentle", "OIL_TEMP < 60 or COOLANT_TEMP < 60"),
+        ("Warm", "OIL_TEMP < 80 or COOLANT_TEMP < 80"),
+    ]},
+    AssistKey.RESPONSIVENESS_LABEL: { "score": 100, "format": "{}%", "penalties": [
+        (20, "IAT > 50"),
+        (20, "abs(LTFT) > 5"),
+        (10, "abs(STFT) > 5"),
+        (15, "TIMING < 10"),
+        (10, "LOAD < 20"),
+    ]},
+    AssistKey.BATTERY_STATUS: { "default": "OK", "dwell": 2.0, "states": [
+        ("LOW", "VOLTAGE < 12.6"),
+        ("HIGH", "VOLTAGE > 14.7"),
+    ]},
+    AssistKey.THROTTLE_STYLE: { "default": "SMOOTH", "states": [
+        ("AGGRESSIVE", "abs(THROTTLE_RATE) > 100"),  # %/s, from the THROTTLE "rate" filter
+        ("MODERATE", "abs(THROTTLE_RATE) > 20"),
+    ]},
+}
+
+# How far past a limit an input must go before a state it holds turns off
+ASSIST_HYSTERESIS = {
+    "RPM": 150, "THROTTLE": 3, "LOAD": 3, "AFR": 0.02, "LTFT": 1, "STFT": 1, "IAT": 2,
+    "TIMING": 1, "OIL_TEMP": 2, "COOLANT_TEMP": 2, "VOLTAGE": 0.1, "THROTTLE_RATE": 10,
+}
+
+ASSISTS = AssistRules(STORE, ASSIST_RULES, ASSIST_HYSTERESIS)
+
+# Threshold alarms, checked on every stored sample: {"PID": {"high"/"low": limit, "debounce": samples, "band": units}}
+ALARMS = AlarmEngine(STORE, config_manager.get("alarms"))
+ALARMS.attach()
+
+# Trip statistics for every PID, saved to trip.json every trip_save_seconds
+TRIP = TripComputer(STORE, thresholds=config_manager.get("trip_thresholds"),
+                    speed_key=SPEED_KEY, save_interval=config_manager.get("trip_save_seconds"))
+TRIP.attach()
+
+# Time-at-value histograms and operating-point tables, kept in maps.json:
+# {"histograms": {"PID": [lo, hi, bins]}, "tables": [{"x": [PID, lo, hi, bins], "y": [...], "z": "PID"}]}
+MAPS = OperatingMaps(STORE, config_manager.get("operating_maps"))
+MAPS.attach()
+
+def poller_child_setup():
+    """Alarms are checked and the sample log written where the samples are decoded,
+    alarm events going to the UI process; trip statistics and maps run on the
+    values the UI process receives."""
+    ALARMS.attach()
+    ALARMS.on_alarm = ALARMS.on_clear = lambda event: HUB.send("alarm", event)
+    # Nothing publishes here, so derived channels (BOOST) are brought up to date after each reply
+    TRANSPORT.after_poll = lambda adapter: STORE.recompute()
+    TRIP.detach()
+    MAPS.detach()
+    if LOGGER:
+        LOGGER.attach(STORE)
+        LOGGER.start()
+
 WARNINGS_KEYS = config_manager.get("warnings")
 WARNINGS_TO_SHOW = [getattr(AssistKey, k) for k in WARNINGS_KEYS if hasattr(AssistKey, k)]
 
 # --- HELPER FUNCTIONS FOR CONFIGURATION ---
 
-def validate_batch_size(pids, batch_name):
-    """Calculates response size and warns if it exceeds Single Frame (7 byte) limit."""
-    total_bytes = 1 # Response header '41'
-    for pid in pids:
-        total_bytes += 1 # The PID echo
-        total_bytes += DATA[pid]["bytes"] # The data bytes
-    
-    print(f"[*] Config Check: {batch_name} Response Size = {total_bytes} bytes")
-    
-    if total_bytes > 7:
-        print(f"[!] WARNING: {batch_name} size ({total_bytes}B) exceeds 7 bytes!")
-        print(f"    This will trigger Multi-Frame responses (slower).")
-        print(f"    Consider removing PIDs from {batch_name} to restore instant speed.")
-    else:
-        print(f"[*] {batch_name} fits in Single Frame. Maximum Speed Enabled.")
-
-def generate_batch_cmd(pids):
-    """Generates the hex command string from a list of PIDs."""
-    # Start with Mode 01
-    cmd_str = "01"
-    for pid in pids:
-        cmd_str += DATA[pid]["pid"]
-    cmd_str += "\r"
-    return cmd_str.encode('ascii')
+# Batch commands and their compiled reply decoders, cached per PID tuple
+BATCHES = BatchCompiler(DATA)
 
-# ----------------------------------------
+# Adapters to poll concurrently; each entry is {"type": "elm327"|"canusb", "name": ...}
+DEFAULT_ADAPTERS = [{"type": "elm327", "name": "wifi"}]
 
-def raw_obd_connect():
-    try:
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        s.settimeout(2)
-        s.connect((OBD_WIFI_IP, OBD_WIFI_PORT))
-        
-        commands = [b"ATZ\r", b"ATE0\r", b"ATL0\r", b"ATS0\r", b"ATH0\r", b"ATSP0\r", b"0100\r"]
-        for cmd in commands:
-            s.send(cmd)
-            buffer = b""
-            while b">" not in buffer:
-                try:
-                    chunk = s.recv(1024)
-                    if not chunk: break
-                    buffer += chunk
-                except socket.timeout:
-                    break
-            # print(f"Init cmd {cmd.strip()} -> {buffer.strip()}")
-        print("[*] Raw High-Speed OBD Connection Established")
-        return s
-    except Exception as e:
-        print(f"[!] Raw Connection Failed: {e}")
-        return None
+def polled_pids(pids, fast=False):
+    """Replaces derived channels with the PIDs they are computed from.
 
-def parse_batch_response(buffer, requested_pids):
-    try:
-        raw_str = buffer.decode('utf-8', errors='ignore').strip()
-    except:
-        return
+    In a fast list, inputs that are slow by nature (e.g. BARO under BOOST)
+    are returned separately so they can be polled at their own max_age.
+    """
+    polled, slow_inputs = [], []
+    for pid in pids:
+        for leaf in STORE.derived.leaves(pid):
+            slow_input = fast and leaf != pid and DATA[leaf]["max_age"] > FAST_PID_MAX_AGE
+            target = slow_inputs if slow_input else polled
+            if leaf not in target:
+                target.append(leaf)
+    return polled, slow_inputs
+
+def configured_pids():
+    """Re-reads FAST_PIDS and SLOW_PIDS; the UI thread may have saved new ones."""
+    fast, slow_inputs = polled_pids([getattr(PID, k) for k in config_manager.get("fast_pids") if hasattr(PID, k)], fast=True)
+    slow, _ = polled_pids([getattr(PID, k) for k in config_manager.get("slow_pids") if hasattr(PID, k)] + slow_inputs)
+    FAST_PIDS[:] = fast
+    SLOW_PIDS[:] = [pid for pid in slow if pid not in fast]
+    return FAST_PIDS, SLOW_PIDS
 
-    if ':' in raw_str:
-        lines = raw_str.split('\r')
-        clean_hex = ""
-        for line in lines:
-            line = line.strip()
-            if ':' in line:
-                clean_hex += line.split(':')[1]
-    else:
-        clean_hex = raw_str.replace('\r', '').replace('\n', '')
-
-    clean_hex = clean_hex.replace(' ', '').replace('>', '')
-    response_start = clean_hex.find("41")
-    if response_start == -1:
-        return
+# ----------------------------------------
 
-    current_data = clean_hex[response_start + 2:]
-
-    for pid_key in requested_pids:
-        pid_hex = DATA[pid_key]["pid"]
-        byte_count = DATA[pid_key]["bytes"]
-        hex_len = byte_count * 2
-        
-        if current_data.startswith(pid_hex):
-            try:
-                raw_val_hex = current_data[2 : 2 + hex_len]
-                val_int = int(raw_val_hex, 16)
-                update_data_entry(pid_key, val_int)
-                current_data = current_data[2 + hex_len:]
-            except ValueError:
-                break
-        else:
-            pass
+def parse_batch_response(buffer, requested_pids, timestamp=None):
+    updated = {}
+    for pid_key, raw_val in BATCHES.get(requested_pids).decode(buffer):
+        val = update_data_entry(pid_key, raw_val, timestamp)
+        if val is not None: updated[pid_key] = val
+    return updated
 
-def update_data_entry(pid_key, raw_val):
+def update_data_entry(pid_key, raw_val, timestamp=None):
     try:
-        entry = DATA[pid_key]
-        val = entry["convert"](raw_val)
-        precision = entry["precision"]
-        truncated_value = f"{val:.{precision}f}"
-        
-        entry["value"] = truncated_value
-        entry["min_read"] = str(min(float(entry["min_read"]), float(truncated_value)))
-        entry["max_read"] = str(max(float(entry["max_read"]), float(truncated_value)))
+        return STORE.update(pid_key, raw_val, timestamp if timestamp is not None else time.monotonic())
     except Exception as e:
         print(f"[!] Update error for {pid_key}: {e}")
 
+def after_poll(adapter):
+    # Every completed batch becomes one snapshot and one UI wake
+    STORE.publish()
+
+# A replay drives the store from this process, so it never starts the poller process
+POLLER_PROCESS = config_manager.get("poller_process", False) and not OBD_REPLAY
+
+# Every adapter's polling coroutine, run on one asyncio loop in the OBD thread,
+# or in a separate process when "poller_process" is on
+TRANSPORT = TransportHub.from_config(
+    config_manager.get("adapters") or DEFAULT_ADAPTERS, DATA, PID.__members__,
+    update_data_entry, configured_pids, None if POLLER_PROCESS else after_poll,
+    default_host=OBD_WIFI_IP, default_port=OBD_WIFI_PORT)
+
+# Optional binary log of every decoded sample, in memory-mapped segments under "dir"
+LOG_SETTINGS = config_manager.get("logging")
+LOGGER = None
+if LOG_SETTINGS.get("enabled"):
+    LOGGER = SampleLogger(list(PID_TABLE), LOG_SETTINGS.get("dir", "logs"),
+                          LOG_SETTINGS.get("segment_samples", 262144), LOG_SETTINGS.get("rotate_seconds", 600),
+                          LOG_SETTINGS.get("fsync_seconds", 5), LOG_SETTINGS.get("buffer_samples", 32768))
+TRANSPORT.logger = LOGGER
+
+def after_replay_batch(timestamp):
+    after_poll(None)
+    # Assists go by the recorded clock, once per replayed reply, so their dwell
+    # and hysteresis come out the same at any replay speed
+    update_driver_assists(timestamp)
+
+REPLAY = None
+if OBD_REPLAY:
+    REPLAY = LogReplay(OBD_REPLAY, DATA, PID.__members__, update_data_entry, parse_batch_response,
+                       after_replay_batch, OBD_REPLAY_SPEED, OBD_REPLAY_LEVEL)
+
+HUB = PollerProcess(TRANSPORT, DATA, STORE.set, config_manager.get("poller_core"), poller_child_setup) if POLLER_PROCESS else TRANSPORT
+
+# Results of the background diagnostics lane, filled in as answers arrive
+DIAGNOSTICS = { "dtcs": None, "vin": None, "adapter_voltage": None }
+
+def request_diagnostics(on_result=None):
+    """Queues DTC, VIN and adapter voltage reads between polls.
+
+    on_result(name, value) is called on the UI thread as each answer arrives.
+    """
+    def deliver(name, value):
+        DIAGNOSTICS[name] = value
+        if on_result:
+            Clock.schedule_once(lambda dt: on_result(name, value))
+    for name in DIAGNOSTICS:
+        HUB.submit(name, deliver)
+
+def start_burst(pid=None):
+    """Bursts the tapped gauge's PID plus the configured burst_pids (3 at most)."""
+    keys = config_manager.get("burst_pids")
+    pids, _ = polled_pids(([pid] if pid else []) + [getattr(PID, k) for k in keys if hasattr(PID, k)], fast=True)
+    return HUB.burst(pids, float(config_manager.get("burst_seconds")))
+
+def ui_wake(callback):
+    """Returns wake(*args), safe from any thread: runs callback() once on the UI
+    thread, however many times wake is called before it gets there."""
+    state = { "pending": False }
+    def run(dt):
+        state["pending"] = False
+        callback()
+    def wake(*args):
+        if not state["pending"]:
+            state["pending"] = True
+            Clock.schedule_once(run)
+    return wake
+
+# Redraw callbacks, called with the newest snapshot on the UI thread after
+# something was published. More batches before the wake runs just make it
+# pick a newer snapshot.
+UI_LISTENERS = []
+
+def redraw_ui():
+    snapshot = STORE.snapshot
+    for listener in UI_LISTENERS:
+        listener(snapshot)
+
+STORE.on_publish = ui_wake(redraw_ui)
+
+# Called with the newly fired alarm events as soon as the UI thread gets to them
+ALARM_LISTENERS = []
+
+def show_alarms():
+    events = ALARMS.drain()
+    for listener in ALARM_LISTENERS:
+        listener(events)
+
+ALARMS.on_alarm = ui_wake(show_alarms)
+if POLLER_PROCESS:
+    # Checked on every sample in the poller process (see poller_child_setup); only events come over
+    ALARMS.detach()
+    HUB.listen("alarm", lambda name, event: ALARMS.receive(event))
+
+def sync_poller_process(dt):
+    if HUB.sync():
+        STORE.publish()
+
 def start_obd_polling():
     if USE_FAKE_OBD:
         return
-
-    # Validate Config on Startup
-    validate_batch_size(FAST_PIDS, "FAST_PIDS")
-    
-    # Generate Commands dynamically
-    batch_1_cmd = generate_batch_cmd(FAST_PIDS)
-    batch_2_cmd = generate_batch_cmd(SLOW_PIDS)
-    
-    print(f"[*] Fast Command: {batch_1_cmd}")
-    print(f"[*] Slow Command: {batch_2_cmd}")
-
-    s = None
-    while not s:
-        s = raw_obd_connect()
-        if not s: time.sleep(2)
-
-    print("[*] Starting Ultra-Fast Batch Polling...")
-
-    # Monitor Config Changes in Loop
-    # We'll use a simple counter to check every N loops
-    loop_count = 0
-    
-    while True:
-        try:
-            # Check for config reload (if main thread handled it, we just need to refresh lists)
-            # Actually, the polling loop needs to know if PIDs changed.
-            # We can check a shared flag or just check the config object directly.
-            # Since ConfigManager is thread-safe effectively (GIL), we can check shared lists.
-            pass # We will re-read PIDs from global config every loop or periodically
-            
-            # Re-read PIDs every 60 cycles (~1 sec) to catch updates
-            if loop_count % 60 == 0:
-                 # Update lists from config manager (which might have been reloaded by main thread)
-                 # Note: ConfigManager might be reloaded by the UI thread, so we just read get().
-                 
-                 # Optimization: Only regenerate commands if lists changed
-                 new_fast = [getattr(PID, k) for k in config_manager.get("fast_pids") if hasattr(PID, k)]
-                 new_slow = [getattr(PID, k) for k in config_manager.get("slow_pids") if hasattr(PID, k)]
-                 
-                 if new_fast != FAST_PIDS or new_slow != SLOW_PIDS:
-                     print("[*] Polling Loop: Detected PID list change. Regenerating commands.")
-                     FAST_PIDS[:] = new_fast
-                     SLOW_PIDS[:] = new_slow
-                     batch_1_cmd = generate_batch_cmd(FAST_PIDS)
-                     batch_2_cmd = generate_batch_cmd(SLOW_PIDS)
-
-            # --- POLL FAST BATCH ---
-            s.send(batch_1_cmd)
-            buffer = b""
-            while b">" not in buffer:
-                chunk = s.recv(1024)
-                if not chunk: raise ConnectionError("Lost connection")
-                buffer += chunk
-            
-            parse_batch_response(buffer, FAST_PIDS)
-
-            # --- POLL SLOW BATCH (Every 10th frame) ---
-            if loop_count % 10 == 0:
-                s.send(batch_2_cmd)
-                buffer = b""
-                while b">" not in buffer:
-                    chunk = s.recv(1024)
-                    if not chunk: raise ConnectionError("Lost connection")
-                    buffer += chunk
-                parse_batch_response(buffer, SLOW_PIDS)
-            
-            # Update driver assists periodically
-            if loop_count % 5 == 0:
-                update_driver_assists()
-
-            loop_count += 1
-            
-        except (socket.timeout, ConnectionError, OSError):
-            print("[!] Connection Lost. Reconnecting...")
-            if s: s.close()
-            s = None
-            while not s:
-                s = raw_obd_connect()
-                if not s: time.sleep(2)
-        except Exception as e:
-            print(f"[!] Loop Exception: {e}")
-            time.sleep(0.1)
+    if REPLAY:
+        REPLAY.start()
+        return
+    if POLLER_PROCESS:
+        HUB.start()
+        # Shared memory has no wakeup of its own; a cheap seq check per frame
+        Clock.schedule_interval(sync_poller_process, GAUGE_UPDATE_INTERVAL)
+        return
+    if LOGGER:
+        LOGGER.attach(STORE)
+        LOGGER.start()
+    TRANSPORT.run_forever()
 
 # --- UI CLASSES START HERE (UNMODIFIED) ---
 
-def update_driver_assists():
-    try:
-        throttle = float(DATA[PID.THROTTLE]["value"])
-        load = float(DATA[PID.LOAD]["value"])
-        # Check if AFR is available (it might be 0 if not polled yet or not in config)
-        afr = float(DATA[PID.AFR]["value"]) if DATA[PID.AFR]["value"] != "--" else 14.7 
-        rpm = float(DATA[PID.RPM]["value"])
-        ltft = float(DATA[PID.LTFT]["value"])
-        stft = float(DATA[PID.STFT]["value"])
-        coolant = float(DATA[PID.COOLANT_TEMP]["value"])
-        oil = float(DATA[PID.OIL_TEMP]["value"])
-        timing = float(DATA[PID.TIMING]["value"])
-        iat = float(DATA[PID.IAT]["value"])
-        voltage = float(DATA[PID.VOLTAGE]["value"])
-
-        # 1. Eco DrivingTrue
-        eco = []
-        if load > 80 or throttle > 70 or afr < 0.95:
-            eco.append("Inefficient")
-        elif throttle < 20 and rpm > 3000:
-            eco.append("Upshift")
-        if ltft < -5:
-            eco.append("Rich trim")
-        
-        # Mapping to existing AssistKey.ECO_STATUS
-        DRIVER_ASSISTS_STATE[AssistKey.ECO_STATUS]["value"] = ", ".join(eco) if eco else "ECO"
-
-        # 2. Shift Suggestion
-        if rpm > 3500 and throttle < 30:
-            DRIVER_ASSISTS_STATE[AssistKey.SHIFT_HINT]["value"] = "SHIFT ^"
-        elif rpm < 1500 and load > 80:
-            DRIVER_ASSISTS_STATE[AssistKey.SHIFT_HINT]["value"] = "SHIFT v"
-        else:
-            DRIVER_ASSISTS_STATE[AssistKey.SHIFT_HINT]["value"] = "--"
-
-        # 3. Warmup
-        if oil < 40:
-            DRIVER_ASSISTS_STATE[AssistKey.WARMUP_STATUS]["value"] = "Idle"
-            # DRIVER_ASSISTS_STATE[AssistKey.WARMUP_STATUS]["show"] = True
-        elif oil < 60 or coolant < 60:
-            DRIVER_ASSISTS_STATE[AssistKey.WARMUP_STATUS]["value"]= "Gentle"
-            # DRIVER_ASSISTS_STATE[AssistKey.WARMUP_STATUS]["show"] = True
-        elif oil < 80 or coolant < 80:
-            DRIVER_ASSISTS_STATE[AssistKey.WARMUP_STATUS]["value"]  = "Warm"
-            # DRIVER_ASSISTS_STATE[AssistKey.WARMUP_STATUS]["show"] = True
-        else:
-            DRIVER_ASSISTS_STATE[AssistKey.WARMUP_STATUS]["value"] = "OK"
-            # DRIVER_ASSISTS_STATE[AssistKey.WARMUP_STATUS]["show"] = False
-
-        # 4. Responsiveness
-        score = 100
-        if iat > 50: score -= 20
-        if abs(ltft) > 5: score -= 20
-        if abs(stft) > 5: score -= 10
-        if timing < 10: score -= 15
-        if load < 20: score -= 10
-        
-        # label = "TUNED" if score > 80 else "OK" if score > 50 else "HEATSOAKED" if score > 30 else "DULL"
-        # We don't have a label for Responsiveness in the original UI, 
-        # but we have AssistKey.RESPONSIVENESS_LABEL defined in Python but not shown in WARNINGS_TO_SHOW by default.
-        # We'll update usage if it exists.
-        DRIVER_ASSISTS_STATE[AssistKey.RESPONSIVENESS_LABEL]["value"] = f"{score}%"
-
-        # 5. Battery
-        if voltage < 12.6:
-            DRIVER_ASSISTS_STATE[AssistKey.BATTERY_STATUS]["value"] = "LOW"
-        elif voltage > 14.7:
-            DRIVER_ASSISTS_STATE[AssistKey.BATTERY_STATUS]["value"] = "HIGH"
-        else:
-            DRIVER_ASSISTS_STATE[AssistKey.BATTERY_STATUS]["value"] = "OK"
-
-        # 6. Throttle Sensitivity Coach
-        prev_throttle = DRIVER_ASSISTS_INTERNAL_STATE.get("prev_throttle")
-        if prev_throttle is None:
-            DRIVER_ASSISTS_INTERNAL_STATE["prev_throttle"] = throttle
-            return
-
-        delta_throttle = abs(throttle - prev_throttle)
-        rate = delta_throttle / 0.5  # 0.5s interval
-
-        if rate > 100:
-            style = "AGGRESSIVE"
-        elif rate > 20:
-            style = "MODERATE"
-        else:
-            style = "SMOOTH"
-
-        DRIVER_ASSISTS_STATE[AssistKey.THROTTLE_STYLE]["value"] = style
-        DRIVER_ASSISTS_INTERNAL_STATE["prev_throttle"] = throttle
-
-    except Exception as e:
-        # print("[Assist Error]", e)
-        pass
+def update_driver_assists(now=None):
+    """Runs the assist rules on the newest snapshot; UI thread, every 1 / assist_rate_hz,
+    or the replay thread after each replayed reply (now is then the recorded time)."""
+    for key, label in ASSISTS.evaluate(STORE.snapshot, time.monotonic() if now is None else now).items():
+        DRIVER_ASSISTS_STATE[key]["value"] = label
 
 class DataCell(BoxLayout):
     def __init__(self, title, value, min_val, max_val, draw_top=False, draw_left=False, **kwargs):
@@ -450,6 +416,9 @@ class DataCell(BoxLayout):
         self.value.text = str(value)
         self.min_val.text = str(min_read)
         self.max_val.text = str(max_read)
+    def set_quarantined(self, quarantined):
+        self.title.color = (0.5, 0.5, 0.5, 1) if quarantined else (1, 1, 1, 1)
+        self.value.opacity = 0.3 if quarantined else 1
 
 class GaugeWidget(Widget):
     angle = NumericProperty(0)
@@ -520,14 +489,18 @@ class RPMBar(BoxLayout):
         self.label = Label(text="6300", font_size=56, halign="left", valign="middle", width=160, size_hint=(None, 1), font_name=path.join(ASSETS_FONTS_PATH, "Michroma", "Michroma-Regular.ttf"))
         self.label.bind(texture_size=lambda inst, s: setattr(inst, "width", max(160, s[0])))
         self.add_widget(self.label)
-        Clock.schedule_interval(self._refresh, 1 / 60) 
+        self._seen = None
+        UI_LISTENERS.append(self._refresh)
     def _update_geometry(self, *_):
         self.bg_rect.pos = self.pos
         self.bg_rect.size = self.size
-    def _refresh(self, _dt):
+    def _refresh(self, snapshot):
         try:
-            entry = DATA[PID.RPM]
-            rpm_val = float(entry["value"])
+            seq = snapshot.seq_of(RPM_KEY)
+            if seq == self._seen:
+                return
+            self._seen = seq
+            rpm_val = snapshot.get(RPM_KEY)
             rpm_min, rpm_max = 0, 6300
             rpm_val = max(rpm_min, min(rpm_val, rpm_max))
             self.label.text = f"{round(rpm_val)}"
@@ -571,6 +544,81 @@ class WarningBox(BoxLayout):
         self.opacity = 1 if show else 0
         self.disabled = not show
 
+class MapView(Widget):
+    """Draws one operating map: bars for a histogram, a heat grid for a table.
+
+    Label textures are kept per text, since cells show a small set of
+    values, and nothing is redrawn while the map and the geometry stay the same.
+    """
+    TEXTURE_CACHE_SIZE = 512
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.map = None
+        self.drawn = None
+        self.textures = {}
+        self.bind(pos=self.redraw, size=self.redraw)
+
+    def show(self, m):
+        self.map = m
+        self.redraw()
+
+    def text(self, text, x, y, font_size=16):
+        texture = self.textures.get((text, font_size))
+        if texture is None:
+            if len(self.textures) >= self.TEXTURE_CACHE_SIZE:
+                self.textures.clear()
+            label = CoreLabel(text=text, font_size=font_size)
+            label.refresh()
+            texture = self.textures[(text, font_size)] = label.texture
+        w, h = texture.size
+        Color(1, 1, 1, 1)
+        Rectangle(texture=texture, pos=(x - w / 2, y - h / 2), size=(w, h))
+
+    def redraw(self, *args):
+        m = self.map
+        values = [m.value(c) for c in range(m.cells)] if m is not None else None
+        drawn = (m, values, tuple(self.pos), tuple(self.size))
+        if drawn == self.drawn:
+            return
+        self.drawn = drawn
+        self.canvas.clear()
+        if m is None:
+            return
+        filled = [v for v in values if v is not None]
+        x_axis, y_axis = m.x, m.y
+        rows = y_axis.bins if y_axis else 1
+        left, bottom = self.x + 60, self.y + 30
+        cell_w = (self.right - left) / x_axis.bins
+        cell_h = (self.top - bottom) / rows
+        total = sum(filled) if not m.z else 0
+        lo, hi = (min(filled), max(filled)) if filled else (0, 0)
+        precision = STORE.specs[m.z.id].precision if m.z else 0
+        with self.canvas:
+            for c, v in enumerate(values):
+                col, row = c % x_axis.bins, c // x_axis.bins
+                x, y = left + col * cell_w, bottom + row * cell_h
+                if v is None:
+                    Color(0.15, 0.15, 0.15, 1)
+                    Rectangle(pos=(x + 1, y + 1), size=(cell_w - 2, cell_h - 2))
+                    continue
+                if m.z:
+                    heat = (v - lo) / (hi - lo) if hi > lo else 0.5
+                    text = f"{v:.{precision}f}"
+                else:
+                    heat = v / hi if hi else 0
+                    text = f"{100 * v / total:.0f}%" if total else ""
+                Color(heat, 0.3, 1 - heat, 1)
+                height = cell_h * heat if y_axis is None and not m.z else cell_h
+                Rectangle(pos=(x + 1, y + 1), size=(cell_w - 2, max(height - 2, 2)))
+                if cell_w > 30 and cell_h > 20:
+                    self.text(text, x + cell_w / 2, y + cell_h / 2, 14)
+            for col in range(0, x_axis.bins + 1, max(1, x_axis.bins // 7)):
+                self.text(f"{x_axis.edge(col):g}", left + col * cell_w, self.y + 12)
+            if y_axis:
+                for row in range(0, rows + 1, max(1, rows // 5)):
+                    self.text(f"{y_axis.edge(row):g}", self.x + 30, bottom + row * cell_h)
+
 class GaugeScreen(Screen):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
@@ -602,11 +650,22 @@ class GaugeScreen(Screen):
         settings_btn = Button(text="CONFIG", size_hint=(None, 1), width=80, background_color=(0.2, 0.2, 0.2, 1))
         settings_btn.bind(on_release=self.go_to_settings)
         
+        # Burst rate readout (tap a gauge to start a burst)
+        self.burst_label = Label(text="", size_hint=(None, 1), width=140, font_size=18)
+
+        # Alarm readout; tap to acknowledge
+        self.alarm_btn = Button(text="", size_hint=(None, 1), width=160, font_size=18, bold=True,
+                                background_color=(0.8, 0, 0, 1), opacity=0, disabled=True)
+        self.alarm_btn.bind(on_release=self.acknowledge_alarms)
+        ALARM_LISTENERS.append(self.update_alarms)
+
         header_layout.add_widget(warnings_layout)
         
         if config_manager.get("show_rpm_bar", True):
              header_layout.add_widget(self.rpm_bar)
              
+        header_layout.add_widget(self.alarm_btn)
+        header_layout.add_widget(self.burst_label)
         header_layout.add_widget(settings_btn)
         
         self.header_layout = header_layout # Keep ref
@@ -616,6 +675,7 @@ class GaugeScreen(Screen):
         for pid in GAUGES_TO_SHOW:
             entry = DATA[pid]
             gauge = GaugeWidget(entry["unit"], entry["icon"], str(entry["dial_min"]), str(entry["dial_max"]))
+            gauge.bind(on_touch_up=self.on_gauge_touch)
             self.pid_to_gauge[pid] = gauge
             self.gauges.append(gauge)
             gauges_layout.add_widget(gauge)
@@ -625,13 +685,16 @@ class GaugeScreen(Screen):
         
         self.gauges_layout = gauges_layout # Keep reference for rebuild
         
-        Clock.schedule_interval(self.update_all_gauges, GAUGE_UPDATE_INTERVAL)
+        self.seen = {}
+        self.quarantined = frozenset()
+        UI_LISTENERS.append(self.update_all_gauges)
         
     def rebuild_ui(self):
         print("[*] GaugeScreen: Rebuilding UI...")
         self.gauges_layout.clear_widgets()
         self.gauges = []
         self.pid_to_gauge = {}
+        self.seen = {}
         
         # Reload keys
         # Reload keys
@@ -662,28 +725,76 @@ class GaugeScreen(Screen):
         self.header_layout.add_widget(warnings_layout)
         if config_manager.get("show_rpm_bar", True):
             self.header_layout.add_widget(self.rpm_bar)
+        self.header_layout.add_widget(self.alarm_btn)
+        self.header_layout.add_widget(self.burst_label)
         self.header_layout.add_widget(settings_btn)
 
         
         for pid in GAUGES_TO_SHOW:
             entry = DATA[pid]
             gauge = GaugeWidget(entry["unit"], entry["icon"], str(entry["dial_min"]), str(entry["dial_max"]))
+            gauge.bind(on_touch_up=self.on_gauge_touch)
             self.pid_to_gauge[pid] = gauge
             self.gauges.append(gauge)
             self.gauges_layout.add_widget(gauge)
 
-    def update_all_gauges(self, dt):
-        for pid, gauge in self.pid_to_gauge.items(): self.update_gauge(pid, gauge)
+    def update_all_gauges(self, snapshot):
+        # Only PIDs with a new sample are redrawn, unless quarantine changed
+        quarantined = HUB.quarantined_pids()
+        redraw_all = quarantined != self.quarantined
+        self.quarantined = quarantined
+        for pid, gauge in self.pid_to_gauge.items():
+            seq = snapshot.seq_of(pid)
+            if not redraw_all and self.seen.get(pid) == seq:
+                continue
+            self.seen[pid] = seq
+            self.update_gauge(pid, gauge, snapshot)
+            gauge.opacity = 0.4 if pid in quarantined else 1
+        self.update_burst_label()
+        self.update_alarms()
+
+    def update_alarms(self, events=None):
+        showing = ALARMS.showing()
+        text = "ALARM\n" + " ".join(alarm.name for alarm in showing) if showing else ""
+        if self.alarm_btn.text != text:
+            self.alarm_btn.text = text
+            self.alarm_btn.opacity = 1 if showing else 0
+            self.alarm_btn.disabled = not showing
+
+    def acknowledge_alarms(self, *args):
+        ALARMS.acknowledge()
+        self.update_alarms()
+
+    def update_burst_label(self):
+        status = HUB.burst_status()
+        if status is None:
+            return
+        names, rate, running = status
+        text = f"BURST\n{rate:.0f} Hz/PID" if running else f"LAST BURST\n{rate:.0f} Hz/PID"
+        if self.burst_label.text != text:
+            self.burst_label.text = text
+            self.burst_label.color = (1, 0.6, 0, 1) if running else (0.7, 0.7, 0.7, 1)
+
+    def on_gauge_touch(self, gauge, touch):
+        # A tap, not the start or end of a swipe; left unconsumed for the screen manager
+        ox, oy = touch.opos
+        if (abs(touch.x - ox) > TAP_SLOP or abs(touch.y - oy) > TAP_SLOP
+                or not gauge.collide_point(ox, oy) or not gauge.collide_point(*touch.pos)):
+            return False
+        for pid, g in self.pid_to_gauge.items():
+            if g is gauge:
+                start_burst(pid)
+        return False
     
     def go_to_settings(self, *args):
         self.parent.current = 'settings'
         self.parent.transition.direction = 'left'
 
-    def update_gauge(self, pid, gauge):
-        entry = DATA[pid]
-        val = float(entry["value"])
-        min_d = entry["dial_min"]
-        max_d = entry["dial_max"]
+    def update_gauge(self, pid, gauge, snapshot):
+        spec = STORE.spec(pid)
+        val = snapshot.value[spec.id]
+        min_d = spec.dial_min
+        max_d = spec.dial_max
         val = max(min_d, min(val, max_d))
         target_angle = DIAL_MIN + ((val - min_d) / (max_d - min_d)) * (DIAL_MAX - DIAL_MIN)
         if not hasattr(gauge, '_target_angle'): gauge._target_angle = None
@@ -709,12 +820,14 @@ class DigitalScreen(Screen):
             grid.add_widget(cell)
         self.add_widget(grid)
         self.grid = grid # Keep reference
-        Clock.schedule_interval(self.update_all_cells, GAUGE_UPDATE_INTERVAL)  
+        self.seen = {}
+        UI_LISTENERS.append(self.update_all_cells)
 
     def rebuild_ui(self):
         print("[*] DigitalScreen: Rebuilding UI...")
         self.grid.clear_widgets()
         self.pid_to_cell = {}
+        self.seen = {}
         
         # Reload keys
         global DATACELLS_TO_SHOW
@@ -731,14 +844,16 @@ class DigitalScreen(Screen):
             self.pid_to_cell[pid] = cell
             self.grid.add_widget(cell)
 
-    def update_all_cells(self, dt):
-        global DATA
+    def update_all_cells(self, snapshot):
+        quarantined = HUB.quarantined_pids()
         for pid, cell in self.pid_to_cell.items():
-            entry = DATA[pid]
-            val = float(entry["value"])
-            min_ = float(entry["min_read"])
-            max_ = float(entry["max_read"])
-            cell.update_readings(val, min_, max_)
+            seq = snapshot.seq_of(pid)
+            if self.seen.get(pid) != seq:
+                self.seen[pid] = seq
+                cell.update_readings(snapshot.text(pid), snapshot.text(pid, "min"), snapshot.text(pid, "max"))
+            if getattr(cell, '_quarantined', False) != (pid in quarantined):
+                cell._quarantined = pid in quarantined
+                cell.set_quarantined(cell._quarantined)
         
 class SettingsScreen(Screen):
     def __init__(self, **kwargs):
@@ -763,13 +878,15 @@ class SettingsScreen(Screen):
         gauges_grid = GridLayout(cols=3, spacing=5, size_hint_y=None)
         gauges_grid.bind(minimum_height=gauges_grid.setter('height'))
         
+        self.pid_labels = {pid_name: [] for pid_name in PID.__members__}
         current_gauges = config_manager.get("gauges")
         for pid_name in PID.__members__:
             box = BoxLayout(orientation='horizontal', size_hint_y=None, height=40)
             chk = CheckBox(active=(pid_name in current_gauges))
             box.add_widget(chk)
-            box.add_widget(Label(text=pid_name))
-            box.add_widget(Label(text=pid_name))
+            label = Label(text=pid_name)
+            self.pid_labels[pid_name].append(label)
+            box.add_widget(label)
             chk.bind(active=self.on_gauge_toggle)
             self.gauge_toggles[pid_name] = chk
             gauges_grid.add_widget(box)
@@ -789,7 +906,9 @@ class SettingsScreen(Screen):
             box = BoxLayout(orientation='horizontal', size_hint_y=None, height=40)
             chk = CheckBox(active=(pid_name in current_datacells))
             box.add_widget(chk)
-            box.add_widget(Label(text=pid_name))
+            label = Label(text=pid_name)
+            self.pid_labels[pid_name].append(label)
+            box.add_widget(label)
             self.datacell_toggles[pid_name] = chk
             datacell_grid.add_widget(box)
         content.add_widget(datacell_grid)
@@ -825,6 +944,27 @@ class SettingsScreen(Screen):
         self.redline_input = TextInput(text=str(config_manager.get("redline")), multiline=False, size_hint_y=None, height=40)
         content.add_widget(self.redline_input)
         
+        # 5. Diagnostics (read in the background, between polls)
+        content.add_widget(Label(text="Diagnostics", size_hint_y=None, height=40, font_size=24))
+        self.diag_label = Label(text="Not read yet", size_hint_y=None, height=80, halign='left', valign='top')
+        self.diag_label.bind(size=self.diag_label.setter('text_size'))
+        content.add_widget(self.diag_label)
+        diag_btn = Button(text="Read Codes", size_hint_y=None, height=50)
+        diag_btn.bind(on_release=self.read_diagnostics)
+        content.add_widget(diag_btn)
+
+        # 6. Trip
+        content.add_widget(Label(text="Trip", size_hint_y=None, height=40, font_size=24))
+        self.trip_label = Label(text="", size_hint_y=None, height=80, halign='left', valign='top')
+        self.trip_label.bind(size=self.trip_label.setter('text_size'))
+        content.add_widget(self.trip_label)
+        trip_btn = Button(text="Reset Trip", size_hint_y=None, height=50)
+        trip_btn.bind(on_release=self.reset_trip)
+        content.add_widget(trip_btn)
+        maps_btn = Button(text="Operating Maps", size_hint_y=None, height=50)
+        maps_btn.bind(on_release=self.show_maps)
+        content.add_widget(maps_btn)
+
         # Save Button
         save_btn = Button(text="Save & Restart", size_hint_y=None, height=60, background_color=(0, 1, 0, 1))
         save_btn.bind(on_release=self.save_config)
@@ -834,6 +974,45 @@ class SettingsScreen(Screen):
         self.layout.add_widget(scroll)
         self.add_widget(self.layout)
 
+    def on_pre_enter(self, *args):
+        self.update_supported_labels()
+        self.update_trip_label()
+
+    def update_trip_label(self):
+        hours = TRIP.duration / 3600.0
+        avg = TRIP.distance / hours if hours > 0 else 0.0
+        rpm = TRIP.summary(RPM_KEY) if RPM_KEY else None
+        rpm_text = f"max {rpm[3]:.0f} rpm, {rpm[4]:.0f}s above {TRIP.thresholds.get(RPM_KEY, 0):g}" if rpm else "--"
+        self.trip_label.text = (f"Distance: {TRIP.distance:.1f} km in {TRIP.duration / 60:.0f} min (avg {avg:.0f} km/h)\n"
+                                f"RPM: {rpm_text}")
+
+    def reset_trip(self, *args):
+        TRIP.reset()
+        self.update_trip_label()
+
+    def show_maps(self, *args):
+        self.manager.transition.direction = 'left'
+        self.manager.current = 'analysis'
+
+    def update_supported_labels(self):
+        """Greys out PIDs the connected car doesn't support (known after discovery)."""
+        for pid_name, labels in self.pid_labels.items():
+            supported = all(HUB.is_supported(leaf) for leaf in STORE.derived.leaves(PID[pid_name]))
+            for label in labels:
+                label.text = pid_name if supported else f"{pid_name} (n/a)"
+                label.color = (1, 1, 1, 1) if supported else (0.5, 0.5, 0.5, 1)
+
+    def read_diagnostics(self, *args):
+        self.diag_label.text = "Reading..."
+        request_diagnostics(self.show_diagnostics)
+
+    def show_diagnostics(self, name, value):
+        dtcs = DIAGNOSTICS["dtcs"]
+        codes = ", ".join(dtcs) if dtcs else ("No codes" if dtcs is not None else "--")
+        self.diag_label.text = (f"Codes: {codes}\n"
+                                f"VIN: {DIAGNOSTICS['vin'] or '--'}\n"
+                                f"Adapter: {DIAGNOSTICS['adapter_voltage'] or '--'}")
+
     def on_gauge_toggle(self, instance, value):
         self.update_gauge_locks()
         
@@ -880,16 +1059,64 @@ class SettingsScreen(Screen):
                       size_hint=(None, None), size=(400, 200))
         popup.open()
 
+class AnalysisScreen(Screen):
+    """Live histograms and operating-point tables, one at a time."""
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.index = 0
+        self.refresh_event = None
+        layout = BoxLayout(orientation='vertical', padding=10, spacing=10)
+        header = BoxLayout(size_hint=(1, None), height=50, spacing=10)
+        self.title_label = Label(text="No maps configured", font_size=28, bold=True)
+        header.add_widget(self.title_label)
+        for text, action in (("Next", self.next_map), ("Reset", self.reset_maps), ("Back", self.go_back)):
+            btn = Button(text=text, size_hint=(None, 1), width=100)
+            btn.bind(on_release=action)
+            header.add_widget(btn)
+        layout.add_widget(header)
+        self.view = MapView()
+        layout.add_widget(self.view)
+        self.add_widget(layout)
+
+    def on_pre_enter(self, *args):
+        self.show()
+        self.refresh_event = Clock.schedule_interval(lambda dt: self.view.redraw(), 1.0)
+
+    def on_leave(self, *args):
+        if self.refresh_event:
+            self.refresh_event.cancel()
+            self.refresh_event = None
+
+    def show(self):
+        if not MAPS.maps:
+            return
+        m = MAPS.maps[self.index % len(MAPS.maps)]
+        self.title_label.text = m.title + ("" if m.z else " (time)")
+        self.view.show(m)
+
+    def next_map(self, *args):
+        self.index += 1
+        self.show()
+
+    def reset_maps(self, *args):
+        MAPS.reset()
+        self.view.redraw()
+
+    def go_back(self, *args):
+        self.manager.current = 'settings'
+        self.manager.transition.direction = 'right'
+
 class RootWidget(ScreenManager):
     def __init__(self, **kwargs):
         super().__init__(transition=SlideTransition(duration=0.4), **kwargs)
         self.add_widget(GaugeScreen(name='gauge'))
         self.add_widget(DigitalScreen(name='digital'))
         self.add_widget(SettingsScreen(name='settings'))
+        self.add_widget(AnalysisScreen(name='analysis'))
         self.current = 'gauge'
     def on_touch_move(self, touch):
         # Disabled swipe for settings to avoid accidental confusion
-        if self.current == 'settings': return
+        if self.current in ('settings', 'analysis'): return
         
         if touch.dx < -40: self.switch_to_screen('digital')
         elif touch.dx > 40: self.switch_to_screen('gauge')
@@ -905,7 +1132,24 @@ class DashApp(App):
         return self.root_widget
         
     def on_start(self): 
-        threading.Thread(target=start_obd_polling, daemon=True).start()
+        TRIP.start()
+        MAPS.start()
+        if not REPLAY:
+            Clock.schedule_interval(lambda dt: update_driver_assists(), 1.0 / config_manager.get("assist_rate_hz"))
+        if POLLER_PROCESS:
+            start_obd_polling()
+        else:
+            threading.Thread(target=start_obd_polling, daemon=True).start()
+
+    def on_stop(self):
+        TRIP.stop()
+        MAPS.stop()
+        if LOGGER and not POLLER_PROCESS:
+            LOGGER.stop()
+        if REPLAY:
+            REPLAY.stop()
+        if POLLER_PROCESS:
+            HUB.stop()
         
     def check_config_updates(self, dt):
         if config_manager.check_for_changes():